@@ -1,19 +1,62 @@
-from flask import Flask, jsonify, request, session
+from flask import Flask, Response, jsonify, request, session, stream_with_context
 from flask_cors import CORS, cross_origin
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from werkzeug.middleware.proxy_fix import ProxyFix
 from functools import wraps
-from models import db, Producto, Pedido, Usuario, Configuracion, Categoria, init_db
-from datetime import datetime
+from peewee import JOIN, SQL, Case, PostgresqlDatabase, prefetch
+from models import db, Producto, Pedido, PedidoItem, Usuario, Configuracion, Categoria, init_db, items_desde_json, rellenar_items_pedidos
+from busqueda import es_postgres, buscar_ids, indexar_producto, eliminar_de_indice, reindexar_categoria
+from cache import cache_catalogo, cache_tasa, cache_usuarios
+from seguridad import (ServicioOcupado, hashear_contraseña, verificar_contraseña, necesita_rehash,
+                       contar_rehash, limitador_ip, limitador_cuenta)
+from serializacion import configurar_json, respuesta_json_en_stream
+from compresion import configurar_compresion, codificaciones_disponibles, comprimir
+from metricas import METRICAS_PUBLICAS, METRICAS_TOKEN, configurar_metricas, exponer, medir_sobrecarga
+from perfilado import PERFILADO, configurar_perfilado, perfiles_recientes
+from eventos import publicar_evento_pedido, respuesta_sse
+from cambios import (nueva_version_catalogo, marcar_productos, registrar_eliminacion,
+                     en_rango, eliminados_desde)
+from reportes import (ESTADOS_SIN_VENTA, registrar_pedido, cambiar_estado, producto_eliminado,
+                      reconstruir_resumenes, reporte_ventas, reporte_inventario, ventas_por_dia)
+from generador import CONTRASEÑA_GENERADA, generar_datos
+from importacion import TIPOS_CONTENIDO, abrir_texto, detectar_formato, leer_filas, importar_productos, exportar_productos
+from migraciones import MIGRACIONES, aplicar_migraciones, migraciones_aplicadas, plan_usa_indice
+from datetime import date, datetime, timedelta
+import base64
+import hmac
 import json
 import os
-import bcrypt
+import random
+import tempfile
+import time
+import click
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
+# Proxies delante de la app que agregan X-Forwarded-For (Render: 1). Sin esto
+# request.remote_addr es la IP del proxy y todos los clientes comparten el
+# límite de intentos por IP. Solo detrás de un proxy: si la app recibe las
+# conexiones directamente, cualquier cliente elige su IP con el encabezado.
+PROXY_X_FOR = int(os.environ.get('PROXY_X_FOR', 0))
+if PROXY_X_FOR:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_X_FOR)
+
 # Inicializar CORS globalmente
 CORS(app)
 
+# Métricas por petición (antes que los demás hooks para medir también su costo)
+configurar_metricas(app)
+
+# Perfilado de SQL por petición y Server-Timing (solo con PERFILADO=1)
+configurar_perfilado(app)
+
+# Serialización JSON con orjson si está disponible
+configurar_json(app)
+
+# Compresión gzip/brotli de las respuestas según Accept-Encoding
+configurar_compresion(app)
+
 # Configurar Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -21,11 +64,26 @@ login_manager.session_protection = "strong"
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Cargar usuario para Flask-Login"""
+    """Cargar usuario para Flask-Login (en caché para no consultar en cada petición; los
+    cambios del usuario la invalidan en todos los workers)"""
     try:
-        return Usuario.get_by_id(user_id)
-    except Usuario.DoesNotExist:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
         return None
+    
+    datos = cache_usuarios.obtener(user_id)
+    if datos is None:
+        generacion = cache_usuarios.generacion()
+        try:
+            datos = dict(Usuario.get_by_id(user_id).__data__)
+        except Usuario.DoesNotExist:
+            return None
+        cache_usuarios.guardar(user_id, datos, generacion)
+    
+    # Cada petición recibe su propia instancia para no compartir estado entre hilos
+    usuario = Usuario(**datos)
+    usuario._dirty.clear()
+    return usuario
 
 def admin_required(f):
     """Decorador para verificar que el usuario es administrador"""
@@ -39,46 +97,338 @@ def admin_required(f):
 
 @app.before_request
 def before_request():
-    """Abrir conexión a la base de datos antes de cada petición"""
-    if db.is_closed():
-        db.connect()
+    """Tomar una conexión del pool antes de cada petición"""
+    db.connect(reuse_if_open=True)
 
-@app.after_request
-def after_request(response):
-    """Cerrar conexión a la base de datos después de cada petición"""
+@app.teardown_request
+def teardown_request(exc):
+    """Devolver la conexión al pool al terminar la petición (también si hubo error)"""
     if not db.is_closed():
         db.close()
-    return response
+
+def consulta_productos():
+    """Consulta de productos con su categoría en un solo JOIN (evita una consulta por producto)"""
+    return Producto.select(Producto, Categoria).join(Categoria, JOIN.LEFT_OUTER).switch(Producto)
+
+def producto_a_dict(p, tasa_bcv=None):
+    """Convertir un producto a diccionario; la categoría debe venir cargada en el mismo query.
+    
+    Con tasa_bcv se agrega el precio en bolívares (precio_bs).
+    """
+    datos = {
+        'id': p.id,
+        'nombre': p.nombre,
+        'precio': float(p.precio),
+        'stock': p.stock,
+        'imagen_url': p.imagen_url,
+        'categoria_id': p.categoria_id.id if p.categoria_id else None,
+        'categoria_nombre': p.categoria_id.nombre if p.categoria_id else None
+    }
+    if tasa_bcv is not None:
+        datos['precio_bs'] = round(datos['precio'] * tasa_bcv, 2)
+    return datos
+
+def cargar_tasa_bcv():
+    config = Configuracion.select(Configuracion.tasa_bcv).first()
+    return float(config.tasa_bcv) if config else 36.00
+
+def tasa_bcv_actual():
+    """Tasa BCV vigente, guardada en memoria del proceso hasta que un worker la modifica"""
+    return cache_tasa.valor('tasa_bcv', cargar_tasa_bcv)
+
+def tasa_solicitada():
+    """Tasa BCV si la petición pide precios en bolívares (bs=1), o None"""
+    if request.args.get('bs', '').lower() in ('1', 'true', 'si', 'sí'):
+        return tasa_bcv_actual()
+    return None
+
+# Ordenamientos permitidos en el catálogo: parámetro sort -> campo del modelo
+ORDENES_PRODUCTOS = {
+    'id': Producto.id,
+    'nombre': Producto.nombre,
+    'precio': Producto.precio,
+}
+LIMITE_PRODUCTOS_DEFECTO = 50
+LIMITE_PRODUCTOS_MAXIMO = 200
+LOTE_STREAM = 500  # Filas por consulta en las respuestas con stream=1
+
+def codificar_cursor(datos):
+    """Codificar la posición de la última fila como token opaco para el cliente"""
+    crudo = json.dumps(datos, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(crudo).decode('ascii').rstrip('=')
+
+def decodificar_cursor(token):
+    """Decodificar un token generado por codificar_cursor (ValueError si es inválido)"""
+    try:
+        relleno = '=' * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(token + relleno))
+    except Exception:
+        raise ValueError('Cursor inválido.')
+
+def filtrar_productos(consulta, args):
+    """Aplicar los filtros del catálogo (categoria_id, q, precio_min, precio_max, en_stock)"""
+    categoria_id = args.get('categoria_id')
+    if categoria_id:
+        if categoria_id == 'sin-categoria':
+            consulta = consulta.where(Producto.categoria_id.is_null())
+        else:
+            consulta = consulta.where(Producto.categoria_id == int(categoria_id))
+    
+    q = args.get('q', '').strip()
+    if q:
+        consulta = consulta.where(Producto.nombre.contains(q))
+    
+    if args.get('precio_min'):
+        consulta = consulta.where(Producto.precio >= float(args['precio_min']))
+    if args.get('precio_max'):
+        consulta = consulta.where(Producto.precio <= float(args['precio_max']))
+    
+    if args.get('en_stock', '').lower() in ('1', 'true', 'si', 'sí'):
+        consulta = consulta.where(Producto.stock > 0)
+    
+    return consulta
+
+def ordenar_productos(productos, sort):
+    """Ordenar por el campo de sort (prefijo - para descendente) y desempatar por id.
+    
+    Retorna (consulta, campo, descendente); ValueError si el orden no es válido.
+    """
+    descendente = sort.startswith('-')
+    campo_nombre = sort.lstrip('-')
+    if campo_nombre not in ORDENES_PRODUCTOS:
+        raise ValueError(f'Orden inválido. Valores válidos: {", ".join(ORDENES_PRODUCTOS)} (prefijo - para descendente).')
+    campo = ORDENES_PRODUCTOS[campo_nombre]
+    # El desempate por id da un orden estable para el cursor
+    if descendente:
+        return productos.order_by(campo.desc(), Producto.id.desc()), campo, descendente
+    return productos.order_by(campo.asc(), Producto.id.asc()), campo, descendente
+
+def consulta_pagina_productos(productos, campo, descendente, limite, cursor=None):
+    """Consulta de la página que sigue a cursor, con una fila extra para saber si hay más"""
+    if cursor:
+        ultimo_valor, ultimo_id = cursor['valor'], int(cursor['id'])
+        if descendente:
+            productos = productos.where((campo < ultimo_valor) | ((campo == ultimo_valor) & (Producto.id < ultimo_id)))
+        else:
+            productos = productos.where((campo > ultimo_valor) | ((campo == ultimo_valor) & (Producto.id > ultimo_id)))
+    return productos.limit(limite + 1)
+
+def pagina_productos(productos, campo, descendente, limite, cursor=None):
+    """Obtener una página de productos continuando después de cursor (keyset).
+    
+    productos debe venir de ordenar_productos. Retorna (filas, siguiente),
+    donde siguiente es la posición de la última fila o None si no hay más.
+    """
+    filas = list(consulta_pagina_productos(productos, campo, descendente, limite, cursor))
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = {'valor': getattr(filas[-1], campo.name), 'id': filas[-1].id}
+    return filas, siguiente
 
 @app.route('/api/productos', methods=['GET'])
+@cache_catalogo.cachear(excepto=lambda: 'en_stock' in request.args)
 def obtener_productos():
-    """Endpoint para obtener todos los productos"""
-    try:
-        # Obtener todos los productos
-        productos = Producto.select()
-        
-        # Convertir a lista de diccionarios
-        productos_list = []
-        for p in productos:
-            producto_dict = {
-                'id': p.id,
-                'nombre': p.nombre,
-                'precio': float(p.precio),
-                'stock': p.stock,
-                'imagen_url': p.imagen_url,
-                'categoria_id': p.categoria_id.id if p.categoria_id else None,
-                'categoria_nombre': p.categoria_id.nombre if p.categoria_id else None
-            }
-            productos_list.append(producto_dict)
-        
-        return jsonify(productos_list)
+    """Endpoint para obtener los productos del catálogo.
+    
+    Acepta filtros (categoria_id, q, precio_min, precio_max, en_stock) y orden
+    (sort=nombre|-nombre|precio|-precio|id|-id). Si se envía limite o cursor, la
+    respuesta se pagina por cursor (keyset) y se devuelve como
+    {'productos': [...], 'siguiente_cursor': token|None}. Con stream=1 la lista
+    completa se envía por lotes sin cargarla entera en memoria; si no, se
+    devuelve la lista completa como antes.
+    
+    El stock de las respuestas en caché es el del momento en que se generaron
+    (las compras no invalidan el catálogo); el vigente está en
+    /api/productos/stock. Con en_stock la respuesta no se guarda en caché.
+    """
+    try:
+        tasa_bcv = tasa_solicitada()
+        sort = request.args.get('sort', 'id')
+        try:
+            productos, campo, descendente = ordenar_productos(consulta_productos(), sort)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            productos = filtrar_productos(productos, request.args)
+        except ValueError:
+            return jsonify({'error': 'Filtros inválidos. categoria_id, precio_min y precio_max deben ser números.'}), 400
+        
+        if request.args.get('stream') == '1':
+            def paginas():
+                cursor = None
+                while True:
+                    filas, cursor = pagina_productos(productos, campo, descendente, LOTE_STREAM, cursor)
+                    yield [producto_a_dict(p, tasa_bcv) for p in filas]
+                    if cursor is None:
+                        break
+            return respuesta_json_en_stream(paginas())
+        
+        paginar = 'limite' in request.args or 'cursor' in request.args
+        if not paginar:
+            # Convertir a lista de diccionarios
+            productos_list = [producto_a_dict(p, tasa_bcv) for p in productos]
+            return jsonify(productos_list)
+        
+        try:
+            limite = int(request.args.get('limite', LIMITE_PRODUCTOS_DEFECTO))
+        except ValueError:
+            return jsonify({'error': 'El límite debe ser un número entero.'}), 400
+        limite = max(1, min(limite, LIMITE_PRODUCTOS_MAXIMO))
+        
+        # Continuar desde la última fila de la página anterior (keyset)
+        cursor = None
+        token = request.args.get('cursor')
+        if token:
+            try:
+                cursor = decodificar_cursor(token)
+                if cursor.get('sort') != sort:
+                    raise ValueError('Cursor inválido.')
+                int(cursor['id']), cursor['valor']
+            except (ValueError, KeyError, TypeError, AttributeError):
+                return jsonify({'error': 'Cursor inválido.'}), 400
+        
+        filas, siguiente = pagina_productos(productos, campo, descendente, limite, cursor)
+        siguiente_cursor = codificar_cursor(dict(siguiente, sort=sort)) if siguiente else None
+        
+        return jsonify({
+            'productos': [producto_a_dict(p, tasa_bcv) for p in filas],
+            'siguiente_cursor': siguiente_cursor
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/productos/stock', methods=['GET'])
+def obtener_stock():
+    """Endpoint con el stock vigente de los productos, sin caché: {id: stock}.
+    
+    Con ids=1,2,3 retorna solo esos productos (hasta LIMITE_PRODUCTOS_MAXIMO);
+    sin ids, los de todo el catálogo.
+    """
+    try:
+        consulta = Producto.select(Producto.id, Producto.stock).order_by(Producto.id)
+        if request.args.get('ids'):
+            try:
+                ids = [int(i) for i in request.args['ids'].split(',')]
+            except ValueError:
+                return jsonify({'error': 'ids debe ser una lista de números separados por comas.'}), 400
+            if len(ids) > LIMITE_PRODUCTOS_MAXIMO:
+                return jsonify({'error': f'Se aceptan hasta {LIMITE_PRODUCTOS_MAXIMO} ids.'}), 400
+            consulta = consulta.where(Producto.id.in_(ids))
+        
+        respuesta = jsonify({str(producto_id): stock for producto_id, stock in consulta.tuples()})
+        respuesta.headers['Cache-Control'] = 'no-store'
+        return respuesta
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def consultas_cambios(desde, hasta):
+    """Productos y categorías con versión de cambio en (desde, hasta], en el orden
+    del índice de version_cambio (sin ordenar aparte)"""
+    productos = (consulta_productos()
+                 .where(en_rango(Producto.version_cambio, desde, hasta))
+                 .order_by(Producto.version_cambio, Producto.id))
+    categorias = (Categoria
+                  .select(Categoria.id, Categoria.nombre)
+                  .where(en_rango(Categoria.version_cambio, desde, hasta))
+                  .order_by(Categoria.version_cambio, Categoria.id))
+    return productos, categorias
+
+@app.route('/api/productos/cambios', methods=['GET'])
+@cache_catalogo.cachear
+def obtener_cambios_catalogo():
+    """Endpoint para sincronizar un catálogo guardado en el cliente.
+    
+    Retorna los productos y categorías creados o modificados después de la
+    versión desde, y los ids eliminados. El cliente guarda 'version' y la envía
+    como desde en la siguiente llamada; desde=0 retorna el catálogo completo.
+    Las compras no cuentan como cambios: el stock vigente se pide a
+    /api/productos/stock.
+    """
+    try:
+        try:
+            desde = int(request.args['desde'])
+        except KeyError:
+            return jsonify({'error': 'Se requiere el parámetro desde (versión del catálogo del cliente).'}), 400
+        except ValueError:
+            return jsonify({'error': 'desde debe ser un número entero.'}), 400
+        
+        # Las filas con versión mayor a la leída aquí llegarán en la próxima sincronización
+        version = cache_catalogo.version_actual()
+        if desde > version:
+            return jsonify({'error': 'Versión desconocida. Sincroniza de nuevo con desde=0.'}), 409
+        
+        productos, categorias = consultas_cambios(desde, version)
+        
+        return jsonify({
+            'version': version,
+            'productos': [producto_a_dict(p) for p in productos],
+            'categorias': [{'id': c.id, 'nombre': c.nombre} for c in categorias],
+            'eliminados': eliminados_desde(desde, version) if desde else {'productos': [], 'categorias': []}
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/productos/buscar', methods=['GET'])
+@cache_catalogo.cachear
+def buscar_productos():
+    """Endpoint de búsqueda de texto completo por nombre de producto y categoría.
+    
+    Ignora acentos y mayúsculas, y cada término se trata como prefijo para
+    búsqueda mientras se escribe. Los resultados vienen ordenados por relevancia.
+    """
+    try:
+        q = request.args.get('q', '').strip()
+        if not q:
+            return jsonify({'error': 'Se requiere el parámetro q.'}), 400
+        
+        try:
+            limite = int(request.args.get('limite', 20))
+        except ValueError:
+            return jsonify({'error': 'El límite debe ser un número entero.'}), 400
+        limite = max(1, min(limite, LIMITE_PRODUCTOS_MAXIMO))
+        
+        ids = buscar_ids(q, limite)
+        if not ids:
+            return jsonify([])
+        
+        # Cargar los productos y respetar el orden de relevancia del índice
+        productos = {p.id: p for p in consulta_productos().where(Producto.id.in_(ids))}
+        tasa_bcv = tasa_solicitada()
+        return jsonify([producto_a_dict(productos[i], tasa_bcv) for i in ids if i in productos])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def respuesta_demasiados_intentos(espera):
+    """Respuesta 429 para intentos de autenticación limitados"""
+    respuesta = jsonify({'error': 'Demasiados intentos. Intenta de nuevo más tarde.'})
+    respuesta.status_code = 429
+    respuesta.headers['Retry-After'] = str(espera)
+    return respuesta
+
+def respuesta_servicio_ocupado(error):
+    """Respuesta 503 cuando el pool de bcrypt está saturado"""
+    respuesta = jsonify({'error': str(error)})
+    respuesta.status_code = 503
+    respuesta.headers['Retry-After'] = '5'
+    return respuesta
+
+def registrar_fallo_login(correo, ip):
+    """Contar un intento fallido para la cuenta y para la IP (los exitosos no cuentan)"""
+    limitador_cuenta.registrar(correo)
+    limitador_ip.registrar(ip)
+
 @app.route('/api/register', methods=['POST'])
 def register():
     """Endpoint para registrar un nuevo usuario"""
     try:
+        # Rechazar IPs con muchos intentos fallidos antes de llegar a bcrypt
+        ip = request.remote_addr
+        espera = limitador_ip.bloqueado(ip)
+        if espera:
+            return respuesta_demasiados_intentos(espera)
+        
         data = request.get_json()
         
         # Validar que se reciban los datos necesarios
@@ -99,12 +449,14 @@ def register():
         # Verificar si el correo ya existe
         try:
             Usuario.get(Usuario.correo == correo)
+            # Cuenta como intento fallido: limita la enumeración de correos registrados
+            limitador_ip.registrar(ip)
             return jsonify({'error': 'Este correo electrónico ya está registrado.'}), 400
         except Usuario.DoesNotExist:
             pass
         
-        # Hashear la contraseña
-        contraseña_hash = bcrypt.hashpw(contraseña.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        # Hashear la contraseña (en el pool acotado de bcrypt)
+        contraseña_hash = hashear_contraseña(contraseña)
         
         # Determinar si el usuario es administrador
         is_admin = (correo == 'admin@inversionesledezma.com')
@@ -131,6 +483,8 @@ def register():
             'correo': usuario.correo
         }), 201
         
+    except ServicioOcupado as e:
+        return respuesta_servicio_ocupado(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -147,15 +501,32 @@ def login():
         correo = data['correo'].strip().lower()
         contraseña = data['contraseña']
         
+        # Rechazar la cuenta o la IP con muchos intentos fallidos antes de llegar a bcrypt
+        ip = request.remote_addr
+        espera = max(limitador_cuenta.bloqueado(correo), limitador_ip.bloqueado(ip))
+        if espera:
+            return respuesta_demasiados_intentos(espera)
+        
         # Buscar el usuario
         try:
             usuario = Usuario.get(Usuario.correo == correo)
         except Usuario.DoesNotExist:
+            registrar_fallo_login(correo, ip)
             return jsonify({'error': 'Correo o contraseña incorrectos.'}), 401
         
         # Verificar la contraseña
-        if not bcrypt.checkpw(contraseña.encode('utf-8'), usuario.contraseña_hash.encode('utf-8')):
+        if not verificar_contraseña(contraseña, usuario.contraseña_hash):
+            registrar_fallo_login(correo, ip)
             return jsonify({'error': 'Correo o contraseña incorrectos.'}), 401
+        limitador_cuenta.limpiar(correo)
+        
+        # Actualizar el hash si se generó con otro costo de bcrypt
+        if necesita_rehash(usuario.contraseña_hash):
+            usuario.contraseña_hash = hashear_contraseña(contraseña)
+            with db.atomic():
+                Usuario.update(contraseña_hash=usuario.contraseña_hash).where(Usuario.id == usuario.id).execute()
+                cache_usuarios.invalidar(usuario.id)
+            contar_rehash()
         
         # Iniciar sesión
         login_user(usuario)
@@ -166,6 +537,8 @@ def login():
             'correo': usuario.correo
         }), 200
         
+    except ServicioOcupado as e:
+        return respuesta_servicio_ocupado(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -193,66 +566,120 @@ def usuario_actual():
     else:
         return jsonify({'error': 'No hay usuario autenticado.'}), 401
 
+def reservar_stock(cantidades):
+    """Restar el stock de todo el carrito con un único UPDATE condicional.
+    
+    cantidades es un dict producto_id -> cantidad. Solo se descuentan las filas
+    con stock suficiente (stock >= cantidad), de modo que dos compras simultáneas
+    no pueden dejar el stock en negativo. Retorna False si algún producto no
+    existe o no alcanza; en ese caso el llamador debe revertir la transacción.
+    """
+    ids = sorted(cantidades)
+    cantidad = Case(Producto.id, [(producto_id, cantidades[producto_id]) for producto_id in ids])
+    filtro = Producto.id.in_(ids)
+    if isinstance(db, PostgresqlDatabase):
+        # Bloquear las filas en orden de id para evitar interbloqueos entre pedidos concurrentes
+        filtro = Producto.id.in_(
+            Producto.select(Producto.id).where(Producto.id.in_(ids)).order_by(Producto.id).for_update()
+        )
+    filas = (Producto
+             .update(stock=Producto.stock - cantidad, fecha_actualizacion=datetime.now())
+             .where(filtro & (Producto.stock >= cantidad))
+             .execute())
+    return filas == len(ids)
+
+def cargar_productos_carrito(ids):
+    """Cargar id, nombre, precio, stock y categoría de todos los productos del carrito en una sola consulta"""
+    return {
+        p.id: p for p in Producto
+        .select(Producto.id, Producto.nombre, Producto.precio, Producto.stock, Producto.categoria_id)
+        .where(Producto.id.in_(list(ids)))
+    }
+
+def error_de_stock(productos, cantidades):
+    """Retornar la respuesta de error si algún producto no existe o no tiene stock suficiente"""
+    for producto_id in sorted(cantidades):
+        if producto_id not in productos:
+            return jsonify({'error': f'Producto con ID {producto_id} no encontrado.'}), 404
+        producto = productos[producto_id]
+        if producto.stock < cantidades[producto_id]:
+            return jsonify({
+                'error': f'Stock insuficiente para {producto.nombre}. Stock disponible: {producto.stock}, solicitado: {cantidades[producto_id]}'
+            }), 400
+    return None
+
 @app.route('/api/pedido', methods=['POST'])
 @login_required
 def crear_pedido():
-    """Endpoint para crear un nuevo pedido"""
+    """Endpoint para crear un nuevo pedido.
+    
+    El total se calcula en el servidor con los precios de la base de datos; el
+    'total' enviado por el cliente, si viene, se ignora.
+    """
     try:
         data = request.get_json()
         
         # Validar que se reciban los datos necesarios
-        if not data or 'carrito' not in data or 'total' not in data:
-            return jsonify({'error': 'Datos incompletos. Se requiere carrito y total.'}), 400
+        if not data or 'carrito' not in data:
+            return jsonify({'error': 'Datos incompletos. Se requiere carrito.'}), 400
         
         # Validar que se reciba la dirección de entrega
         if 'direccion_pedido' not in data or not data['direccion_pedido'] or not data['direccion_pedido'].strip():
             return jsonify({'error': 'Se requiere una dirección de entrega.'}), 400
         
         carrito = data['carrito']
-        total = float(data['total'])
         direccion_pedido = data['direccion_pedido'].strip()
         
         # Validar que el carrito no esté vacío
         if not carrito or len(carrito) == 0:
             return jsonify({'error': 'El carrito está vacío.'}), 400
         
-        # Iniciar transacción para validar y restar stock
-        with db.atomic():
-            # Primero, validar stock de todos los productos
-            productos_actualizados = []
-            for item in carrito:
-                producto_id = item.get('id')
-                cantidad_solicitada = item.get('cantidad', 1)
-                
-                if not producto_id:
-                    return jsonify({'error': 'Producto sin ID válido en el carrito.'}), 400
-                
-                try:
-                    producto = Producto.get_by_id(producto_id)
-                except Producto.DoesNotExist:
-                    return jsonify({'error': f'Producto con ID {producto_id} no encontrado.'}), 404
-                
-                # Validar que el stock sea suficiente
-                if producto.stock < cantidad_solicitada:
-                    return jsonify({
-                        'error': f'Stock insuficiente para {producto.nombre}. Stock disponible: {producto.stock}, solicitado: {cantidad_solicitada}'
-                    }), 400
-                
-                # Guardar referencia del producto para actualizar después
-                productos_actualizados.append({
-                    'producto': producto,
-                    'cantidad': cantidad_solicitada
-                })
+        # Agrupar las cantidades solicitadas por producto
+        cantidades = {}
+        for item in carrito:
+            producto_id = item.get('id')
             
-            # Si todas las validaciones pasaron, restar el stock
-            for item in productos_actualizados:
-                producto = item['producto']
-                cantidad = item['cantidad']
-                producto.stock -= cantidad
-                producto.save()
+            if not producto_id:
+                return jsonify({'error': 'Producto sin ID válido en el carrito.'}), 400
+            
+            try:
+                producto_id = int(producto_id)
+                cantidad_solicitada = int(item.get('cantidad', 1))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'ID o cantidad inválidos en el carrito.'}), 400
             
-            # Convertir el carrito a JSON string
-            productos_json = json.dumps(carrito)
+            if cantidad_solicitada < 1:
+                return jsonify({'error': 'La cantidad de cada producto debe ser al menos 1.'}), 400
+            
+            cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad_solicitada
+        
+        # Leer precios y stock de todo el carrito en una sola consulta
+        productos = cargar_productos_carrito(cantidades)
+        error = error_de_stock(productos, cantidades)
+        if error:
+            return error
+        
+        # Calcular el total en el servidor (USD y bolívares con la tasa BCV vigente)
+        total = round(sum(productos[pid].precio * cantidad for pid, cantidad in cantidades.items()), 2)
+        tasa_bcv = tasa_bcv_actual()
+        total_bs = round(total * tasa_bcv, 2)
+        
+        # Iniciar transacción para reservar stock y crear el pedido
+        with db.atomic() as transaccion:
+            # Restar el stock de todo el carrito en un solo UPDATE condicional
+            if not reservar_stock(cantidades):
+                # Otro pedido tomó el stock entre la lectura y el UPDATE
+                transaccion.rollback()
+                error = error_de_stock(cargar_productos_carrito(cantidades), cantidades)
+                return error or (jsonify({'error': 'El stock cambió mientras se procesaba el pedido. Intenta de nuevo.'}), 409)
+            
+            # Guardar el carrito con los precios y nombres del servidor
+            productos_json = json.dumps([{
+                'id': producto_id,
+                'nombre': productos[producto_id].nombre,
+                'precio': float(productos[producto_id].precio),
+                'cantidad': cantidad
+            } for producto_id, cantidad in cantidades.items()])
             
             # Crear el pedido asociado al usuario logueado
             pedido = Pedido.create(
@@ -263,11 +690,31 @@ def crear_pedido():
                 fecha_creacion=datetime.now(),
                 direccion_pedido=direccion_pedido
             )
+            
+            # Guardar las líneas del pedido en un solo INSERT
+            lineas = [{
+                'pedido_id': pedido.id,
+                'producto_id': producto_id,
+                'nombre_producto': productos[producto_id].nombre,
+                'cantidad': cantidad,
+                'precio_unitario': float(productos[producto_id].precio),
+                'categoria_id': productos[producto_id].categoria_id_id
+            } for producto_id, cantidad in cantidades.items()]
+            PedidoItem.insert_many(lineas).execute()
+            
+            # Sumar el pedido a los resúmenes de los reportes
+            registrar_pedido(pedido, [(l['producto_id'], l['categoria_id'], l['cantidad'], l['precio_unitario'])
+                                      for l in lineas])
+            
+            # El stock no cambia la versión del catálogo (ver /api/productos/stock)
+            publicar_evento_pedido(pedido, 'creado')
         
         # Retornar el pedido creado
         return jsonify({
             'id': pedido.id,
             'total': float(pedido.total),
+            'tasa_bcv': tasa_bcv,
+            'total_bs': total_bs,
             'estado': pedido.estado,
             'fecha_creacion': pedido.fecha_creacion.isoformat() if pedido.fecha_creacion else None
         }), 201
@@ -275,6 +722,26 @@ def crear_pedido():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def guardar_cambio_estado(pedido, estado_anterior):
+    """Guardar el pedido solo si sigue en estado_anterior y mover sus montos en los resúmenes.
+    
+    Retorna False si otra petición cambió el estado entre la lectura y el
+    UPDATE (los resúmenes restarían del estado equivocado).
+    """
+    campos = {campo: getattr(pedido, campo) for campo in
+              ('estado', 'referencia_pago', 'fecha_confirmacion', 'motivo_rechazo')}
+    filas = (Pedido
+             .update(**campos)
+             .where((Pedido.id == pedido.id) & (Pedido.estado == estado_anterior))
+             .execute())
+    if not filas:
+        return False
+    cambiar_estado(pedido, estado_anterior)
+    return True
+
+def respuesta_pedido_modificado():
+    return jsonify({'error': 'El pedido cambió mientras se actualizaba. Intenta de nuevo.'}), 409
+
 @app.route('/api/confirmar_pago', methods=['POST'])
 def confirmar_pago():
     """Endpoint para confirmar el pago de un pedido"""
@@ -303,10 +770,15 @@ def confirmar_pago():
             return jsonify({'error': 'Pedido no encontrado.'}), 404
         
         # Actualizar el pedido con la referencia y cambiar el estado
+        estado_anterior = pedido.estado
         pedido.referencia_pago = referencia_pago
         pedido.estado = 'Pago Revisión'
         pedido.fecha_confirmacion = datetime.now()
-        pedido.save()
+        with db.atomic() as transaccion:
+            if not guardar_cambio_estado(pedido, estado_anterior):
+                transaccion.rollback()
+                return respuesta_pedido_modificado()
+            publicar_evento_pedido(pedido, 'actualizado')
         
         # Retornar confirmación
         return jsonify({
@@ -330,55 +802,200 @@ def obtener_pedido(pedido_id):
             return jsonify({'error': 'Pedido no encontrado.'}), 404
         
         # Retornar información esencial
-        return jsonify({
+        datos = {
             'id': pedido.id,
             'total': float(pedido.total),
             'estado': pedido.estado
-        }), 200
+        }
+        tasa_bcv = tasa_solicitada()
+        if tasa_bcv is not None:
+            datos['total_bs'] = round(datos['total'] * tasa_bcv, 2)
+        return jsonify(datos), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def productos_de_pedido(pedido):
+    """Lista de productos de un pedido; requiere que pedido.items venga de prefetch.
+    
+    Los pedidos anteriores a PedidoItem que aún no se migraron se leen de productos_json.
+    """
+    if pedido.items:
+        return [{
+            'id': item.producto_id_id,
+            'nombre': item.nombre_producto,
+            'cantidad': item.cantidad,
+            'precio': float(item.precio_unitario)
+        } for item in pedido.items]
+    return [{
+        'id': fila['producto_id'],
+        'nombre': fila['nombre_producto'],
+        'cantidad': fila['cantidad'],
+        'precio': fila['precio_unitario']
+    } for fila in items_desde_json(pedido.productos_json)]
+
+# Estados posibles de un pedido
+ESTADOS_PEDIDO = ['Pendiente', 'Pago Revisión', 'Pago Rechazado', 'Enviado', 'Entregado']
+LIMITE_PEDIDOS_DEFECTO = 50
+LIMITE_PEDIDOS_MAXIMO = 200
+
+def leer_fecha(valor, fin_de_dia=False):
+    """Interpretar una fecha ISO (YYYY-MM-DD o con hora); fin_de_dia incluye todo el día si no trae hora"""
+    fecha = datetime.fromisoformat(valor)
+    if fin_de_dia and len(valor) == 10:
+        fecha = fecha.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return fecha
+
+def ordenar_pedidos(pedidos):
+    """Más recientes primero, en el orden del índice (fecha_creacion DESC, id DESC).
+    
+    Sin NULLS LAST, que impide usar el índice: los pedidos sin fecha (creados
+    fuera de la aplicación) quedan al final en SQLite y al principio en
+    PostgreSQL, y consulta_pagina_pedidos continúa según el motor.
+    """
+    return pedidos.order_by(Pedido.fecha_creacion.desc(), Pedido.id.desc())
+
+def pedidos_de_usuario(usuario_id):
+    """Pedidos del usuario (mis-pedidos), más recientes primero"""
+    return ordenar_pedidos(Pedido.select().where(Pedido.usuario_id == usuario_id))
+
+def pedidos_admin():
+    """Pedidos con el nombre del usuario en un solo JOIN, más recientes primero"""
+    return ordenar_pedidos(Pedido
+                           .select(Pedido, Usuario.id, Usuario.nombre_usuario)
+                           .join(Usuario, JOIN.LEFT_OUTER)
+                           .switch(Pedido))
+
+def consulta_pagina_pedidos(pedidos, limite, cursor=None):
+    """Consulta de la página que sigue a cursor, con una fila extra para saber si hay más"""
+    if cursor:
+        ultimo_id = int(cursor['id'])
+        sin_fecha = Pedido.fecha_creacion.is_null()
+        if cursor['fecha'] is None:
+            # Quedan los demás pedidos sin fecha y, si los NULL van primero, todos los fechados
+            condicion = sin_fecha & (Pedido.id < ultimo_id)
+            if es_postgres():
+                condicion |= Pedido.fecha_creacion.is_null(False)
+        else:
+            ultima_fecha = datetime.fromisoformat(cursor['fecha'])
+            condicion = ((Pedido.fecha_creacion < ultima_fecha) |
+                         ((Pedido.fecha_creacion == ultima_fecha) & (Pedido.id < ultimo_id)))
+            if not es_postgres():
+                condicion |= sin_fecha
+        pedidos = pedidos.where(condicion)
+    return pedidos.limit(limite + 1)
+
+def pagina_pedidos(pedidos, limite, cursor=None):
+    """Obtener una página de pedidos continuando después de cursor (keyset).
+    
+    pedidos debe venir de ordenar_pedidos. Retorna (pedidos con sus líneas
+    precargadas, siguiente posición o None).
+    """
+    # Las líneas de todos los pedidos de la página se cargan en una sola consulta
+    filas = prefetch(consulta_pagina_pedidos(pedidos, limite, cursor), PedidoItem)
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultimo = filas[-1]
+        fecha = ultimo.fecha_creacion.isoformat() if ultimo.fecha_creacion else None
+        siguiente = {'fecha': fecha, 'id': ultimo.id}
+    return filas, siguiente
+
+def pedido_a_dict(pedido, admin=False, tasa_bcv=None):
+    """Serializar un pedido con sus productos (con dirección y usuario para el panel de administración).
+    
+    Con tasa_bcv se agregan el total y los precios en bolívares a la tasa actual.
+    """
+    datos = {
+        'id': pedido.id,
+        'total': float(pedido.total),
+        'estado': pedido.estado,
+        'productos': productos_de_pedido(pedido),
+        'referencia_pago': pedido.referencia_pago,
+        'motivo_rechazo': pedido.motivo_rechazo,
+        'fecha_creacion': pedido.fecha_creacion.isoformat() if pedido.fecha_creacion else None,
+        'fecha_confirmacion': pedido.fecha_confirmacion.isoformat() if pedido.fecha_confirmacion else None
+    }
+    if admin:
+        datos['direccion_pedido'] = pedido.direccion_pedido
+        datos['nombre_usuario'] = pedido.usuario_id.nombre_usuario if pedido.usuario_id else None
+    if tasa_bcv is not None:
+        datos['total_bs'] = round(datos['total'] * tasa_bcv, 2)
+        for producto in datos['productos']:
+            producto['precio_bs'] = round(producto['precio'] * tasa_bcv, 2)
+    return datos
+
+def respuesta_pedidos_en_stream(pedidos, admin=False, tasa_bcv=None):
+    """Enviar todos los pedidos de la consulta por lotes de LOTE_STREAM"""
+    def paginas():
+        cursor = None
+        while True:
+            filas, cursor = pagina_pedidos(pedidos, LOTE_STREAM, cursor)
+            yield [pedido_a_dict(p, admin, tasa_bcv) for p in filas]
+            if cursor is None:
+                break
+    return respuesta_json_en_stream(paginas())
+
+def filtrar_pedidos(pedidos, args):
+    """Aplicar los filtros del panel de administración (estado, desde, hasta); ValueError si son inválidos"""
+    estado = args.get('estado')
+    if estado:
+        if estado not in ESTADOS_PEDIDO:
+            raise ValueError(f'Estado inválido. Estados válidos: {", ".join(ESTADOS_PEDIDO)}')
+        pedidos = pedidos.where(Pedido.estado == estado)
+    
+    try:
+        if args.get('desde'):
+            pedidos = pedidos.where(Pedido.fecha_creacion >= leer_fecha(args['desde']))
+        if args.get('hasta'):
+            pedidos = pedidos.where(Pedido.fecha_creacion <= leer_fecha(args['hasta'], fin_de_dia=True))
+    except ValueError:
+        raise ValueError('Fechas inválidas. Use el formato AAAA-MM-DD.')
+    return pedidos
+
 @app.route('/api/pedidos', methods=['GET'])
 @admin_required
 def obtener_pedidos():
-    """Endpoint para obtener todos los pedidos (Panel de Administración)"""
+    """Endpoint para obtener los pedidos (Panel de Administración).
+    
+    Acepta filtros estado, desde y hasta (fechas ISO). La respuesta se pagina
+    por cursor sobre (fecha_creacion, id), de a limite pedidos
+    (LIMITE_PEDIDOS_DEFECTO si no se envía), y se devuelve como
+    {'pedidos': [...], 'siguiente_cursor': token|None}. Con stream=1 la lista
+    completa se envía por lotes.
+    """
     try:
-        # Obtener todos los pedidos ordenados por fecha de creación (más recientes primero)
-        pedidos = Pedido.select().order_by(Pedido.fecha_creacion.desc())
+        try:
+            pedidos = filtrar_pedidos(pedidos_admin(), request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if request.args.get('stream') == '1':
+            return respuesta_pedidos_en_stream(pedidos, admin=True, tasa_bcv=tasa_solicitada())
         
-        # Convertir a lista de diccionarios
-        pedidos_list = []
-        for pedido in pedidos:
-            # Parsear los productos del JSON
+        try:
+            limite = int(request.args.get('limite', LIMITE_PEDIDOS_DEFECTO))
+        except ValueError:
+            return jsonify({'error': 'El límite debe ser un número entero.'}), 400
+        limite = max(1, min(limite, LIMITE_PEDIDOS_MAXIMO))
+        
+        cursor = None
+        token = request.args.get('cursor')
+        if token:
             try:
-                productos = json.loads(pedido.productos_json)
-            except:
-                productos = []
-            
-            # Obtener información del usuario asociado
-            nombre_usuario = None
-            if pedido.usuario_id:
-                try:
-                    usuario = Usuario.get_by_id(pedido.usuario_id.id)
-                    nombre_usuario = usuario.nombre_usuario
-                except Usuario.DoesNotExist:
-                    pass
-            
-            pedidos_list.append({
-                'id': pedido.id,
-                'total': float(pedido.total),
-                'estado': pedido.estado,
-                'productos': productos,
-                'referencia_pago': pedido.referencia_pago,
-                'motivo_rechazo': pedido.motivo_rechazo,
-                'direccion_pedido': pedido.direccion_pedido,
-                'nombre_usuario': nombre_usuario,
-                'fecha_creacion': pedido.fecha_creacion.isoformat() if pedido.fecha_creacion else None,
-                'fecha_confirmacion': pedido.fecha_confirmacion.isoformat() if pedido.fecha_confirmacion else None
-            })
-        
-        return jsonify(pedidos_list)
+                cursor = decodificar_cursor(token)
+                int(cursor['id'])
+                if cursor['fecha'] is not None:
+                    datetime.fromisoformat(cursor['fecha'])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                return jsonify({'error': 'Cursor inválido.'}), 400
+        
+        filas, siguiente = pagina_pedidos(pedidos, limite, cursor)
+        tasa_bcv = tasa_solicitada()
+        return jsonify({
+            'pedidos': [pedido_a_dict(p, admin=True, tasa_bcv=tasa_bcv) for p in filas],
+            'siguiente_cursor': codificar_cursor(siguiente) if siguiente else None
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -397,9 +1014,8 @@ def actualizar_estado_pedido():
         nuevo_estado = data['nuevo_estado']
         
         # Validar que el nuevo estado sea válido
-        estados_validos = ['Pendiente', 'Pago Revisión', 'Pago Rechazado', 'Enviado', 'Entregado']
-        if nuevo_estado not in estados_validos:
-            return jsonify({'error': f'Estado inválido. Estados válidos: {", ".join(estados_validos)}'}), 400
+        if nuevo_estado not in ESTADOS_PEDIDO:
+            return jsonify({'error': f'Estado inválido. Estados válidos: {", ".join(ESTADOS_PEDIDO)}'}), 400
         
         # Si el estado es 'Pago Rechazado', validar que se proporcione motivo_rechazo
         if nuevo_estado == 'Pago Rechazado':
@@ -413,6 +1029,7 @@ def actualizar_estado_pedido():
             return jsonify({'error': 'Pedido no encontrado.'}), 404
         
         # Actualizar el estado del pedido
+        estado_anterior = pedido.estado
         pedido.estado = nuevo_estado
         
         # Si el estado es 'Pago Rechazado', guardar el motivo
@@ -422,7 +1039,11 @@ def actualizar_estado_pedido():
             # Si cambia a otro estado, limpiar el motivo de rechazo
             pedido.motivo_rechazo = None
         
-        pedido.save()
+        with db.atomic() as transaccion:
+            if not guardar_cambio_estado(pedido, estado_anterior):
+                transaccion.rollback()
+                return respuesta_pedido_modificado()
+            publicar_evento_pedido(pedido, 'actualizado')
         
         # Retornar confirmación
         return jsonify({
@@ -434,35 +1055,25 @@ def actualizar_estado_pedido():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/pedidos/eventos', methods=['GET'])
+@login_required
+def eventos_pedidos():
+    """Endpoint SSE con los cambios de estado de los pedidos del usuario (de todos si es administrador)"""
+    return respuesta_sse(current_user.id, admin=current_user.is_admin)
+
 @app.route('/api/pedidos/mis-pedidos', methods=['GET'])
 @login_required
 def obtener_pedidos_usuario():
-    """Endpoint para obtener todos los pedidos del usuario actual"""
+    """Endpoint para obtener todos los pedidos del usuario actual (stream=1 los envía por lotes)"""
     try:
-        # Buscar todos los pedidos del usuario ordenados por fecha de creación (más recientes primero)
-        pedidos = Pedido.select().where(Pedido.usuario_id == current_user.id).order_by(Pedido.fecha_creacion.desc())
+        pedidos = pedidos_de_usuario(current_user.id)
         
-        # Convertir a lista de diccionarios
-        pedidos_list = []
-        for pedido in pedidos:
-            # Parsear los productos del JSON
-            try:
-                productos = json.loads(pedido.productos_json)
-            except:
-                productos = []
-            
-            pedidos_list.append({
-                'id': pedido.id,
-                'total': float(pedido.total),
-                'estado': pedido.estado,
-                'productos': productos,
-                'referencia_pago': pedido.referencia_pago,
-                'motivo_rechazo': pedido.motivo_rechazo,
-                'fecha_creacion': pedido.fecha_creacion.isoformat() if pedido.fecha_creacion else None,
-                'fecha_confirmacion': pedido.fecha_confirmacion.isoformat() if pedido.fecha_confirmacion else None
-            })
-        
-        return jsonify(pedidos_list)
+        if request.args.get('stream') == '1':
+            return respuesta_pedidos_en_stream(pedidos, tasa_bcv=tasa_solicitada())
+        
+        # Convertir a lista de diccionarios (las líneas se cargan en una sola consulta)
+        tasa_bcv = tasa_solicitada()
+        return jsonify([pedido_a_dict(p, tasa_bcv=tasa_bcv) for p in prefetch(pedidos, PedidoItem)])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -494,39 +1105,100 @@ def crear_producto():
             return jsonify({'error': 'El stock debe ser mayor o igual a 0.'}), 400
         
         # Obtener categoría si se proporciona
-        categoria_id = None
+        categoria = None
         if 'categoria_id' in data and data['categoria_id']:
             try:
                 categoria = Categoria.get_by_id(data['categoria_id'])
-                categoria_id = categoria.id
             except Categoria.DoesNotExist:
                 return jsonify({'error': 'Categoría no encontrada.'}), 400
         
-        # Crear el producto
-        producto = Producto.create(
-            nombre=nombre,
-            precio=precio,
-            stock=stock,
-            imagen_url=imagen_url,
-            categoria_id=categoria_id
-        )
+        # Crear el producto (se asigna la instancia para no volver a consultar la categoría)
+        with db.atomic():
+            producto = Producto.create(
+                nombre=nombre,
+                precio=precio,
+                stock=stock,
+                imagen_url=imagen_url,
+                categoria_id=categoria,
+                fecha_actualizacion=datetime.now(),
+                version_cambio=nueva_version_catalogo()
+            )
+            indexar_producto(producto.id, producto.nombre, categoria.nombre if categoria else None)
         
         # Retornar el producto creado
-        return jsonify({
-            'id': producto.id,
-            'nombre': producto.nombre,
-            'precio': float(producto.precio),
-            'stock': producto.stock,
-            'imagen_url': producto.imagen_url,
-            'categoria_id': producto.categoria_id.id if producto.categoria_id else None,
-            'categoria_nombre': producto.categoria_id.nombre if producto.categoria_id else None
-        }), 201
+        return jsonify(producto_a_dict(producto)), 201
         
     except ValueError:
         return jsonify({'error': 'Precio o stock inválidos. Deben ser números.'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/productos/importar', methods=['POST'])
+@admin_required
+def importar_productos_masivo():
+    """Endpoint para crear o actualizar productos en bloque desde un CSV o JSONL (solo administradores).
+    
+    El archivo se envía como cuerpo de la petición o en el campo 'archivo' de un
+    formulario multipart, y se procesa a medida que llega. formato=csv|jsonl es
+    opcional (se deduce del tipo de contenido o la extensión). Retorna cuántos
+    productos se crearon y actualizaron y los errores por número de línea.
+    """
+    try:
+        if request.mimetype == 'multipart/form-data':
+            archivo = request.files.get('archivo')
+            if archivo is None:
+                return jsonify({'error': 'Se requiere el archivo en el campo archivo.'}), 400
+            flujo, mimetype, nombre_archivo = archivo.stream, archivo.mimetype, archivo.filename
+        else:
+            flujo, mimetype, nombre_archivo = request.stream, request.mimetype, ''
+        
+        formato = detectar_formato(request.args.get('formato'), mimetype, nombre_archivo)
+        if formato is None:
+            return jsonify({'error': f'Formato inválido. Valores válidos: {", ".join(TIPOS_CONTENIDO)}.'}), 400
+        
+        texto = abrir_texto(flujo)
+        try:
+            resultado = importar_productos(leer_filas(texto, formato))
+        except UnicodeDecodeError:
+            return jsonify({'error': 'El archivo debe estar codificado en UTF-8.'}), 400
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(resultado), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/productos/exportar', methods=['GET'])
+@admin_required
+def exportar_catalogo():
+    """Endpoint para descargar el catálogo completo en CSV o JSONL (solo administradores).
+    
+    Se envía por lotes de LOTE_STREAM sin cargar la tabla en memoria, con las
+    mismas columnas que acepta /api/productos/importar.
+    """
+    try:
+        formato = request.args.get('formato', 'csv')
+        if formato not in TIPOS_CONTENIDO:
+            return jsonify({'error': f'Formato inválido. Valores válidos: {", ".join(TIPOS_CONTENIDO)}.'}), 400
+        
+        productos = consulta_productos().order_by(Producto.id)
+        
+        def paginas():
+            cursor = None
+            while True:
+                filas, cursor = pagina_productos(productos, Producto.id, False, LOTE_STREAM, cursor)
+                yield [producto_a_dict(p) for p in filas]
+                if cursor is None:
+                    break
+        
+        return Response(
+            stream_with_context(exportar_productos(paginas(), formato)),
+            mimetype=TIPOS_CONTENIDO[formato],
+            headers={'Content-Disposition': f'attachment; filename=productos.{formato}'}
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/productos/<int:producto_id>', methods=['PUT'])
 @admin_required
 def actualizar_producto(producto_id):
@@ -534,9 +1206,9 @@ def actualizar_producto(producto_id):
     try:
         data = request.get_json()
         
-        # Buscar el producto por ID
+        # Buscar el producto por ID junto con su categoría
         try:
-            producto = Producto.get_by_id(producto_id)
+            producto = consulta_productos().where(Producto.id == producto_id).get()
         except Producto.DoesNotExist:
             return jsonify({'error': 'Producto no encontrado.'}), 404
         
@@ -569,23 +1241,19 @@ def actualizar_producto(producto_id):
             else:
                 try:
                     categoria = Categoria.get_by_id(data['categoria_id'])
-                    producto.categoria_id = categoria.id
+                    producto.categoria_id = categoria
                 except Categoria.DoesNotExist:
                     return jsonify({'error': 'Categoría no encontrada.'}), 400
         
-        # Guardar los cambios
-        producto.save()
+        # Guardar los cambios y actualizar el índice de búsqueda
+        with db.atomic():
+            producto.version_cambio = nueva_version_catalogo()
+            producto.fecha_actualizacion = datetime.now()
+            producto.save()
+            indexar_producto(producto.id, producto.nombre, producto.categoria_id.nombre if producto.categoria_id else None)
         
         # Retornar el producto actualizado
-        return jsonify({
-            'id': producto.id,
-            'nombre': producto.nombre,
-            'precio': float(producto.precio),
-            'stock': producto.stock,
-            'imagen_url': producto.imagen_url,
-            'categoria_id': producto.categoria_id.id if producto.categoria_id else None,
-            'categoria_nombre': producto.categoria_id.nombre if producto.categoria_id else None
-        }), 200
+        return jsonify(producto_a_dict(producto)), 200
         
     except ValueError:
         return jsonify({'error': 'Precio o stock inválidos. Deben ser números.'}), 400
@@ -604,8 +1272,12 @@ def eliminar_producto(producto_id):
         except Producto.DoesNotExist:
             return jsonify({'error': 'Producto no encontrado.'}), 404
         
-        # Eliminar el producto
-        producto.delete_instance()
+        # Eliminar el producto y quitarlo del índice de búsqueda
+        with db.atomic():
+            producto_eliminado(producto_id)
+            producto.delete_instance()
+            eliminar_de_indice(producto_id)
+            registrar_eliminacion(nueva_version_catalogo(), 'producto', producto_id)
         
         # Retornar confirmación
         return jsonify({
@@ -617,6 +1289,7 @@ def eliminar_producto(producto_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/configuracion/tasa', methods=['GET'])
+@cache_tasa.cachear
 def obtener_tasa_bcv():
     """Endpoint para obtener la tasa BCV actual"""
     try:
@@ -651,14 +1324,16 @@ def actualizar_tasa_bcv():
         if tasa_bcv <= 0:
             return jsonify({'error': 'La tasa BCV debe ser un número mayor que 0.'}), 400
         
-        # Obtener el único registro de configuración
-        try:
-            config = Configuracion.get()
-            config.tasa_bcv = tasa_bcv
-            config.save()
-        except Configuracion.DoesNotExist:
-            # Si no existe, crear con el nuevo valor
-            config = Configuracion.create(tasa_bcv=tasa_bcv)
+        with db.atomic():
+            # Obtener el único registro de configuración
+            try:
+                config = Configuracion.get()
+                config.tasa_bcv = tasa_bcv
+                config.save()
+            except Configuracion.DoesNotExist:
+                # Si no existe, crear con el nuevo valor
+                config = Configuracion.create(tasa_bcv=tasa_bcv)
+            cache_tasa.incrementar_version()
         
         # Retornar la configuración actualizada
         return jsonify({
@@ -672,6 +1347,7 @@ def actualizar_tasa_bcv():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/categorias', methods=['GET'])
+@cache_catalogo.cachear
 def obtener_categorias():
     """Endpoint para obtener todas las categorías"""
     try:
@@ -707,7 +1383,12 @@ def crear_categoria():
             pass
         
         # Crear la categoría
-        categoria = Categoria.create(nombre=nombre)
+        with db.atomic():
+            categoria = Categoria.create(
+                nombre=nombre,
+                fecha_actualizacion=datetime.now(),
+                version_cambio=nueva_version_catalogo()
+            )
         
         return jsonify({
             'id': categoria.id,
@@ -743,7 +1424,15 @@ def actualizar_categoria(categoria_id):
                 pass
             
             categoria.nombre = nombre
-            categoria.save()
+            with db.atomic():
+                version = nueva_version_catalogo()
+                categoria.version_cambio = version
+                categoria.fecha_actualizacion = datetime.now()
+                categoria.save()
+                # Los productos muestran el nombre de la categoría
+                marcar_productos(version, Producto.categoria_id == categoria.id)
+                # El nombre de la categoría forma parte del índice de búsqueda
+                reindexar_categoria(categoria.id)
         
         return jsonify({
             'id': categoria.id,
@@ -764,20 +1453,29 @@ def eliminar_categoria(categoria_id):
         except Categoria.DoesNotExist:
             return jsonify({'error': 'Categoría no encontrada.'}), 404
         
-        # Verificar si hay productos usando esta categoría
-        productos_count = Producto.select().where(Producto.categoria_id == categoria_id).count()
-        if productos_count > 0:
-            # Obtener categoría "Sin Categoría" o crear una si no existe
-            try:
-                categoria_default = Categoria.get(Categoria.nombre == 'Sin Categoría')
-            except Categoria.DoesNotExist:
-                categoria_default = Categoria.create(nombre='Sin Categoría')
+        with db.atomic():
+            version = nueva_version_catalogo()
             
-            # Reasignar productos a "Sin Categoría"
-            Producto.update(categoria_id=categoria_default).where(Producto.categoria_id == categoria_id).execute()
-        
-        # Eliminar la categoría
-        categoria.delete_instance()
+            # Verificar si hay productos usando esta categoría
+            productos_count = Producto.select().where(Producto.categoria_id == categoria_id).count()
+            if productos_count > 0:
+                # Obtener categoría "Sin Categoría" o crear una si no existe
+                try:
+                    categoria_default = Categoria.get(Categoria.nombre == 'Sin Categoría')
+                except Categoria.DoesNotExist:
+                    categoria_default = Categoria.create(nombre='Sin Categoría', fecha_actualizacion=datetime.now(),
+                                                         version_cambio=version)
+                
+                # Reasignar productos a "Sin Categoría"
+                (Producto
+                 .update(categoria_id=categoria_default, version_cambio=version, fecha_actualizacion=datetime.now())
+                 .where(Producto.categoria_id == categoria_id)
+                 .execute())
+                reindexar_categoria(categoria_default.id)
+            
+            # Eliminar la categoría
+            categoria.delete_instance()
+            registrar_eliminacion(version, 'categoria', categoria_id)
         
         return jsonify({
             'mensaje': 'Categoría eliminada correctamente.',
@@ -787,6 +1485,370 @@ def eliminar_categoria(categoria_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+DIAS_REPORTE_DEFECTO = 30
+LIMITE_REPORTE_DEFECTO = 20
+LIMITE_REPORTE_MAXIMO = 200
+
+def estados_reporte():
+    """Estados pedidos con ?estado= (se puede repetir); por defecto los que cuentan como venta"""
+    estados = request.args.getlist('estado')
+    for estado in estados:
+        if estado not in ESTADOS_PEDIDO:
+            raise ValueError(f'Estado inválido. Estados válidos: {", ".join(ESTADOS_PEDIDO)}')
+    return estados or [e for e in ESTADOS_PEDIDO if e not in ESTADOS_SIN_VENTA]
+
+def entero_reporte(nombre, defecto, minimo, maximo):
+    try:
+        valor = int(request.args.get(nombre, defecto))
+    except ValueError:
+        raise ValueError(f'{nombre} debe ser un número entero.')
+    if not minimo <= valor <= maximo:
+        raise ValueError(f'{nombre} debe estar entre {minimo} y {maximo}.')
+    return valor
+
+@app.route('/api/reportes/ventas', methods=['GET'])
+@admin_required
+def obtener_reporte_ventas():
+    """Endpoint con los ingresos por día, estado, categoría y producto (solo administradores).
+    
+    Acepta desde y hasta (AAAA-MM-DD, por defecto los últimos 30 días),
+    estado (repetible) y limite de productos. Se calcula desde las tablas de
+    resumen, así que no recorre el historial de pedidos.
+    """
+    try:
+        try:
+            hasta = leer_fecha(request.args['hasta']).date() if request.args.get('hasta') else datetime.now().date()
+            desde = (leer_fecha(request.args['desde']).date() if request.args.get('desde')
+                     else hasta - timedelta(days=DIAS_REPORTE_DEFECTO - 1))
+        except ValueError:
+            return jsonify({'error': 'Fechas inválidas. Use el formato AAAA-MM-DD.'}), 400
+        if desde > hasta:
+            return jsonify({'error': 'La fecha desde no puede ser posterior a hasta.'}), 400
+        
+        try:
+            estados = estados_reporte()
+            limite = entero_reporte('limite', LIMITE_REPORTE_DEFECTO, 1, LIMITE_REPORTE_MAXIMO)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(reporte_ventas(desde, hasta, estados, limite)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reportes/inventario', methods=['GET'])
+@admin_required
+def obtener_reporte_inventario():
+    """Endpoint con los productos de stock bajo y la rotación de stock (solo administradores).
+    
+    Acepta umbral de stock bajo (5), dias del período de rotación (30),
+    estado (repetible) y limite de productos por lista.
+    """
+    try:
+        try:
+            umbral = entero_reporte('umbral', 5, 0, 1000000)
+            dias = entero_reporte('dias', DIAS_REPORTE_DEFECTO, 1, 3660)
+            estados = estados_reporte()
+            limite = entero_reporte('limite', LIMITE_REPORTE_DEFECTO, 1, LIMITE_REPORTE_MAXIMO)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(reporte_inventario(estados, umbral, dias, limite)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cache/estadisticas', methods=['GET'])
+@admin_required
+def estadisticas_cache():
+    """Endpoint para consultar aciertos, fallos e invalidaciones de las cachés (solo administradores)"""
+    return jsonify({
+        'catalogo': cache_catalogo.estadisticas(),
+        'tasa': cache_tasa.estadisticas(),
+        'usuarios': cache_usuarios.estadisticas()
+    }), 200
+
+@app.route('/api/perfilado/recientes', methods=['GET'])
+@admin_required
+def obtener_perfiles_recientes():
+    """Endpoint con el SQL de las últimas peticiones de este worker (solo administradores, PERFILADO=1)"""
+    return jsonify({
+        'activo': PERFILADO,
+        'perfiles': perfiles_recientes()
+    }), 200
+
+def metricas_autorizadas():
+    """Bearer METRICAS_TOKEN, sesión de administrador o METRICAS_PUBLICAS=1"""
+    if METRICAS_PUBLICAS:
+        return True
+    autorizacion = request.headers.get('Authorization', '').encode('utf-8')
+    if METRICAS_TOKEN and hmac.compare_digest(autorizacion, f'Bearer {METRICAS_TOKEN}'.encode('utf-8')):
+        return True
+    return current_user.is_authenticated and current_user.is_admin
+
+@app.route('/metrics', methods=['GET'])
+def metricas_prometheus():
+    """Endpoint con las métricas de todos los workers en formato de texto de Prometheus"""
+    if not metricas_autorizadas():
+        return jsonify({'error': 'No autorizado.'}), 401
+    return Response(exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.cli.command('rellenar-items-pedidos')
+@click.option('--lote', default=500, show_default=True, help='Pedidos por transacción.')
+def comando_rellenar_items_pedidos(lote):
+    """Crear las líneas de pedido (PedidoItem) de los pedidos antiguos a partir de productos_json"""
+    db.connect(reuse_if_open=True)
+    try:
+        db.create_tables([PedidoItem], safe=True)
+        procesados = rellenar_items_pedidos(lote)
+        print(f'✓ Migración de líneas de pedido completa: {procesados} pedidos')
+    finally:
+        db.close()
+
+@app.cli.command('reconstruir-reportes')
+@click.option('--lote', default=500, show_default=True, help='Pedidos por transacción al rellenar las líneas.')
+def comando_reconstruir_reportes(lote):
+    """Recalcular las tablas de resumen de los reportes desde el historial de pedidos"""
+    db.connect(reuse_if_open=True)
+    try:
+        # Los pedidos antiguos sin líneas también deben contar por producto y categoría
+        rellenar_items_pedidos(lote)
+        inicio = time.perf_counter()
+        por_dia, por_producto = reconstruir_resumenes()
+        print(f'✓ Reportes reconstruidos en {time.perf_counter() - inicio:.2f} s: '
+              f'{por_dia} filas por día y {por_producto} por producto')
+    finally:
+        db.close()
+
+def consultas_frecuentes():
+    """Consultas de los endpoints más usados, armadas con las mismas funciones que
+    los endpoints, para revisar con EXPLAIN que usen índices"""
+    def pagina_catalogo(sort, **filtros):
+        productos, campo, descendente = ordenar_productos(consulta_productos(), sort)
+        productos = filtrar_productos(productos, filtros)
+        return consulta_pagina_productos(productos, campo, descendente, LIMITE_PRODUCTOS_DEFECTO,
+                                         {'valor': 1, 'id': 1})
+    
+    cursor_pedidos = {'fecha': datetime.now().isoformat(), 'id': 1}
+    hoy = date.today()
+    return {
+        'catálogo por categoría': pagina_catalogo('id', categoria_id='1'),
+        'catálogo ordenado por nombre': pagina_catalogo('nombre'),
+        'catálogo por rango de precio': pagina_catalogo('-precio', precio_min='1', precio_max='5'),
+        'cambios del catálogo (productos)': consultas_cambios(100, 200)[0],
+        'cambios del catálogo (categorías)': consultas_cambios(100, 200)[1],
+        'mis pedidos': consulta_pagina_pedidos(pedidos_de_usuario(1), LOTE_STREAM, cursor_pedidos),
+        'pedidos del panel': consulta_pagina_pedidos(pedidos_admin(), LIMITE_PEDIDOS_DEFECTO, cursor_pedidos),
+        'pedidos del panel por estado': consulta_pagina_pedidos(
+            filtrar_pedidos(pedidos_admin(), {'estado': 'Pendiente'}), LIMITE_PEDIDOS_DEFECTO, cursor_pedidos),
+        'reporte de ventas por día': ventas_por_dia(hoy - timedelta(days=30), hoy, ESTADOS_PEDIDO),
+    }
+
+@app.cli.group('migraciones')
+def migraciones_cli():
+    """Migraciones versionadas del esquema"""
+
+@migraciones_cli.command('upgrade')
+def comando_migraciones_upgrade():
+    """Aplicar las migraciones pendientes"""
+    db.connect(reuse_if_open=True)
+    try:
+        aplicadas = aplicar_migraciones()
+        if not aplicadas:
+            print('✓ El esquema ya está actualizado')
+    finally:
+        db.close()
+
+@migraciones_cli.command('status')
+@click.option('--explain', is_flag=True, help='Verificar con EXPLAIN que las consultas frecuentes usan índices.')
+def comando_migraciones_status(explain):
+    """Mostrar las migraciones aplicadas y pendientes"""
+    db.connect(reuse_if_open=True)
+    try:
+        aplicadas = migraciones_aplicadas()
+        for nombre, _ in MIGRACIONES:
+            if nombre in aplicadas:
+                print(f'✓ {nombre} (aplicada {aplicadas[nombre].isoformat()})')
+            else:
+                print(f'  {nombre} (pendiente)')
+        sin_indice = []
+        if explain:
+            for nombre, consulta in consultas_frecuentes().items():
+                usa_indice, plan = plan_usa_indice(consulta)
+                print(f'{"✓" if usa_indice else "✗"} {nombre}: {"usa índice" if usa_indice else "SIN índice"}')
+                print('    ' + plan.replace('\n', '\n    '))
+                if not usa_indice:
+                    sin_indice.append(nombre)
+    finally:
+        db.close()
+    if sin_indice:
+        raise click.ClickException(f'Consultas que recorren o reordenan tablas completas: {", ".join(sin_indice)}')
+
+@app.cli.command('importar-productos')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--formato', type=click.Choice(list(TIPOS_CONTENIDO)), help='Por defecto según la extensión.')
+def comando_importar_productos(archivo, formato):
+    """Crear o actualizar productos desde un archivo CSV o JSONL"""
+    db.connect(reuse_if_open=True)
+    try:
+        with open(archivo, encoding='utf-8-sig', newline='') as texto:
+            resultado = importar_productos(leer_filas(texto, detectar_formato(formato, None, archivo)))
+        print(f'✓ {resultado["creados"]} creados, {resultado["actualizados"]} actualizados, '
+              f'{resultado["total_errores"]} errores en {resultado["lineas"]} filas')
+        for error in resultado['errores']:
+            print(f'  línea {error["linea"]}: {error["error"]}')
+    finally:
+        db.close()
+
+@app.cli.command('medir-importacion')
+@click.option('--filas', default=100000, show_default=True, help='Productos sintéticos a importar.')
+@click.option('--lote', default=1000, show_default=True, help='Filas por transacción.')
+def comando_medir_importacion(filas, lote):
+    """Medir la importación masiva (creación y actualización); los cambios se revierten al final"""
+    categorias = [c.nombre for c in Categoria.select(Categoria.nombre)]
+    azar = random.Random(0)
+    with tempfile.NamedTemporaryFile('w+', suffix='.csv', newline='', encoding='utf-8') as archivo:
+        archivo.write('nombre,precio,stock,categoria_nombre\n')
+        for i in range(filas):
+            categoria = azar.choice(categorias) if categorias else ''
+            archivo.write(f'Producto de prueba {i},{azar.uniform(0.5, 100):.2f},{azar.randint(0, 500)},{categoria}\n')
+        
+        db.connect(reuse_if_open=True)
+        try:
+            with db.atomic() as transaccion:
+                for etapa in ('creación', 'actualización'):
+                    archivo.seek(0)
+                    inicio = time.perf_counter()
+                    resultado = importar_productos(leer_filas(archivo, 'csv'), lote=lote)
+                    segundos = time.perf_counter() - inicio
+                    print(f'{etapa}: {filas} filas en {segundos:.2f} s ({filas / segundos:,.0f} filas/s), '
+                          f'{resultado["creados"]} creados, {resultado["actualizados"]} actualizados, '
+                          f'{resultado["total_errores"]} errores')
+                transaccion.rollback()
+        finally:
+            db.close()
+
+@app.cli.command('generar-datos')
+@click.option('--usuarios', default=50000, show_default=True)
+@click.option('--categorias', default=40, show_default=True)
+@click.option('--productos', default=100000, show_default=True)
+@click.option('--pedidos', default=1000000, show_default=True)
+@click.option('--dias', default=365, show_default=True, help='Días de historial de pedidos.')
+@click.option('--hasta', default=None, help='Fecha del último pedido (AAAA-MM-DD); por defecto hoy.')
+@click.option('--semilla', default=1, show_default=True, help='La misma semilla genera los mismos datos.')
+@click.option('--sesgo', default=1.0, show_default=True,
+              help='Exponente de Zipf de productos y compradores (0 = uniforme).')
+def comando_generar_datos(usuarios, categorias, productos, pedidos, dias, hasta, semilla, sesgo):
+    """Llenar la base con datos sintéticos a escala (usuarios, categorías, productos y pedidos)"""
+    try:
+        hasta = leer_fecha(hasta) if hasta else None
+    except ValueError:
+        raise click.BadParameter('Use el formato AAAA-MM-DD.', param_hint='--hasta')
+    init_db()
+    db.connect(reuse_if_open=True)
+    try:
+        inicio = time.perf_counter()
+        resumen = generar_datos(usuarios=usuarios, categorias=categorias, productos=productos, pedidos=pedidos,
+                                dias=dias, hasta=hasta, semilla=semilla, sesgo=sesgo)
+        segundos = time.perf_counter() - inicio
+        print(f'✓ {resumen["usuarios"]} usuarios, {resumen["productos"]} productos, {resumen["pedidos"]} pedidos '
+              f'y {resumen["lineas"]} líneas en {segundos:.1f} s '
+              f'(contraseña de los usuarios: {CONTRASEÑA_GENERADA})')
+    finally:
+        db.close()
+
+@app.cli.command('medir-compresion')
+@click.option('--repeticiones', default=50, show_default=True, help='Compresiones por medición.')
+def comando_medir_compresion(repeticiones):
+    """Medir bytes enviados y CPU por petición de cada codificación en los endpoints de lectura"""
+    cliente = app.test_client()
+    for ruta in ('/api/productos', '/api/categorias', '/api/configuracion/tasa'):
+        cuerpo = cliente.get(ruta, headers={'Accept-Encoding': 'identity'}).get_data()
+        print(f'{ruta}: {len(cuerpo)} bytes sin comprimir')
+        for codificacion in codificaciones_disponibles():
+            niveles = (1, 5, 9, 11) if codificacion == 'br' else (1, 6, 9)
+            for nivel in niveles:
+                inicio = time.process_time()
+                for _ in range(repeticiones):
+                    comprimido = comprimir(cuerpo, codificacion, nivel)
+                cpu_ms = (time.process_time() - inicio) * 1000 / repeticiones
+                print(f'  {codificacion:<4} nivel {nivel:>2}: {len(comprimido):>8} bytes '
+                      f'({len(comprimido) / max(len(cuerpo), 1):.1%}), {cpu_ms:.3f} ms CPU')
+
+@app.cli.command('medir-metricas')
+@click.option('--repeticiones', default=20000, show_default=True, help='Peticiones simuladas.')
+def comando_medir_metricas(repeticiones):
+    """Medir el costo de la instrumentación por petición y por consulta"""
+    with app.test_request_context('/api/productos'):
+        costos = medir_sobrecarga(repeticiones)
+    print(f'Hooks de petición: {costos["peticion_us"]:.2f} µs por petición')
+    print(f'Observador SQL: {costos["consulta_us"]:.2f} µs por consulta')
+    print(f'Generar /metrics: {costos["exponer_ms"]:.2f} ms')
+
+def memoria_proceso_kb(campo):
+    """Valor de /proc/self/status en KB (VmRSS, VmHWM); None fuera de Linux"""
+    try:
+        with open('/proc/self/status') as archivo:
+            for linea in archivo:
+                if linea.startswith(campo + ':'):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    return None
+
+@app.cli.command('medir-exportacion')
+@click.option('--usuario-id', type=int, default=None,
+              help='Usuario de mis-pedidos; por defecto el que tiene más pedidos.')
+def comando_medir_exportacion(usuario_id):
+    """Medir pico de RSS, tiempo al primer byte y tiempo total de las listas completas con y sin stream=1
+
+    Usa los datos de la base actual (por ejemplo, los de generar-datos). El pico de RSS se mide
+    en Linux reiniciando VmHWM antes de cada petición; el modo en stream va primero porque la
+    memoria que libera Python no siempre vuelve al sistema operativo.
+    """
+    db.connect(reuse_if_open=True)
+    try:
+        if usuario_id is None:
+            usuario_id = (Pedido
+                          .select(Pedido.usuario_id)
+                          .where(Pedido.usuario_id.is_null(False))
+                          .group_by(Pedido.usuario_id)
+                          .order_by(SQL('COUNT(*) DESC'))
+                          .scalar())
+        usuario = Usuario.get_or_none(Usuario.id == usuario_id) if usuario_id else None
+    finally:
+        db.close()
+
+    rutas = [('/api/productos', None)]
+    if usuario:
+        rutas.append(('/api/pedidos/mis-pedidos', usuario))
+    for ruta, usuario in rutas:
+        print(f'{ruta}' + (f' (usuario {usuario.id})' if usuario else ''))
+        for modo in ('stream=1', 'sin stream'):
+            with app.test_request_context(ruta + ('?stream=1' if modo == 'stream=1' else ''),
+                                          headers={'Accept-Encoding': 'identity'}):
+                if usuario:
+                    login_user(usuario)
+                rss_antes = memoria_proceso_kb('VmRSS')
+                try:
+                    with open('/proc/self/clear_refs', 'w') as archivo:
+                        archivo.write('5')  # Reiniciar VmHWM al RSS actual
+                except OSError:
+                    rss_antes = None
+                inicio = time.perf_counter()
+                respuesta = app.full_dispatch_request()
+                primer_byte, tamaño = None, 0
+                for fragmento in respuesta.response:
+                    if primer_byte is None and fragmento:
+                        primer_byte = time.perf_counter() - inicio
+                    tamaño += len(fragmento)
+                total = time.perf_counter() - inicio
+                respuesta.close()
+                pico = memoria_proceso_kb('VmHWM')
+            memoria = f'{(pico - rss_antes) / 1024:.1f} MB' if rss_antes is not None and pico else 'n/d'
+            print(f'  {modo:<10}: {tamaño / 1e6:.1f} MB, primer byte {primer_byte * 1000:.0f} ms, '
+                  f'total {total * 1000:.0f} ms, pico de RSS +{memoria}')
+
 # Manejar errores de autenticación
 @login_manager.unauthorized_handler
 def unauthorized():
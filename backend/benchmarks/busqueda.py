@@ -0,0 +1,117 @@
+"""Búsqueda de productos a escala: latencia de buscar_ids y costo de mantener el índice.
+
+Genera --productos productos (generar_datos, sin usuarios ni pedidos) en una
+base SQLite nueva en un directorio temporal, o en un PostgreSQL local
+(--database-url, usar una base dedicada), y mide en el mismo proceso:
+
+- buscar_ids con términos de una y dos palabras, prefijos y números de
+  producto (--busquedas búsquedas);
+- indexar_producto sobre productos ya indexados (lo que hace editar uno) y
+  eliminar_de_indice (--cambios de cada uno, en una transacción que se
+  revierte).
+
+Reporta p50/p95/p99 en ms de cada operación.
+
+Uso:
+    python benchmarks/busqueda.py
+    python benchmarks/busqueda.py --database-url postgresql://localhost/supermercado_bench
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from carga import percentil
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def medir(operacion, argumentos):
+    """Llamar operacion con cada tupla de argumentos; retorna p50/p95/p99 en ms"""
+    tiempos = []
+    for args in argumentos:
+        inicio = time.perf_counter()
+        operacion(*args)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return {'operaciones': len(tiempos),
+            **{f'p{p}_ms': round(percentil(tiempos, p) * 1000, 3) for p in (50, 95, 99)}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--productos', type=int, default=100000)
+    parser.add_argument('--busquedas', type=int, default=1000)
+    parser.add_argument('--cambios', type=int, default=500, help='Actualizaciones y eliminaciones del índice')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--database-url', help='PostgreSQL local (por defecto SQLite en un directorio temporal)')
+    parser.add_argument('--resultado', help='Archivo JSON donde escribir el resultado')
+    args = parser.parse_args()
+    resultado = os.path.abspath(args.resultado) if args.resultado else None
+
+    # models.py elige la base al importarse: SQLite crea supermercado.db en el directorio actual
+    directorio = tempfile.mkdtemp(prefix='supermercado-busqueda-')
+    os.chdir(directorio)
+    os.environ.pop('DATABASE_URL', None)
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    sys.path.insert(0, BACKEND)
+    from busqueda import buscar_ids, eliminar_de_indice, indexar_producto
+    from generador import ARTICULOS, MARCAS, generar_datos
+    from models import Producto, db, init_db
+
+    try:
+        init_db()
+        db.connect(reuse_if_open=True)
+        inicio = time.perf_counter()
+        generar_datos(usuarios=0, productos=args.productos, pedidos=0, semilla=args.semilla, progreso=lambda _: None)
+        print(f'{args.productos} productos generados e indexados en {time.perf_counter() - inicio:.1f} s')
+
+        azar = random.Random(args.semilla)
+        ids = [producto_id for producto_id, in Producto.select(Producto.id).tuples()]
+        terminos = [w.lower() for w in ARTICULOS + MARCAS]
+        busquedas = []
+        for i in range(args.busquedas):
+            tipo = i % 4
+            if tipo == 0:
+                texto = azar.choice(terminos)
+            elif tipo == 1:
+                texto = f'{azar.choice(ARTICULOS)} {azar.choice(MARCAS)}'
+            elif tipo == 2:
+                texto = azar.choice(terminos)[:3]
+            else:
+                texto = str(azar.choice(ids))
+            busquedas.append((texto,))
+
+        resultados = {'buscar': medir(buscar_ids, busquedas)}
+        elegidos = azar.sample(ids, min(args.cambios, len(ids)))
+        with db.atomic() as transaccion:
+            resultados['indexar_producto'] = medir(
+                indexar_producto, [(i, f'Producto renombrado {i}', 'Bebidas') for i in elegidos])
+            resultados['eliminar_de_indice'] = medir(eliminar_de_indice, [(i,) for i in elegidos])
+            transaccion.rollback()
+    finally:
+        if not db.is_closed():
+            db.close()
+        os.chdir(BACKEND)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    print(f'{"operación":<20}{"operaciones":>12}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for operacion, datos in resultados.items():
+        print(f'{operacion:<20}{datos["operaciones"]:>12}{datos["p50_ms"]:>10}{datos["p95_ms"]:>10}'
+              f'{datos["p99_ms"]:>10}')
+
+    if resultado:
+        with open(resultado, 'w', encoding='utf-8') as archivo:
+            json.dump({'configuracion': {k: v for k, v in vars(args).items() if k not in ('resultado', 'database_url')},
+                       'motor': 'postgres' if args.database_url else 'sqlite', 'operaciones': resultados},
+                      archivo, ensure_ascii=False, indent=2)
+            archivo.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Generador de carga HTTP: clientes concurrentes contra un servidor en marcha.
+
+Cada cliente es un hilo que repite peticiones GET durante --duracion
+segundos. Se reporta peticiones por segundo y latencias p50/p95/p99.
+
+Uso:
+    python benchmarks/carga.py http://127.0.0.1:8000/api/productos --clientes 200 --duracion 20
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    indice = min(len(valores_ordenados) - 1, int(round(p / 100 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[indice]
+
+
+def ejecutar_carga(url, clientes, duracion, cabeceras=None):
+    """Lanzar la carga y retornar un dict con throughput, latencias (ms) y errores"""
+    partes = urlsplit(url)
+    ruta = partes.path + (f'?{partes.query}' if partes.query else '')
+    latencias = []
+    errores = [0]
+    lock = threading.Lock()
+    fin = time.monotonic() + duracion
+    inicio_barrera = threading.Barrier(clientes)
+
+    def cliente():
+        conexion = http.client.HTTPConnection(partes.hostname, partes.port or 80, timeout=30)
+        propias, fallidas = [], 0
+        inicio_barrera.wait()
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            try:
+                conexion.request('GET', ruta, headers=cabeceras or {})
+                respuesta = conexion.getresponse()
+                respuesta.read()
+                if respuesta.status >= 500:
+                    fallidas += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                fallidas += 1
+                conexion.close()
+                conexion = http.client.HTTPConnection(partes.hostname, partes.port or 80, timeout=30)
+                continue
+            propias.append(time.perf_counter() - inicio)
+        conexion.close()
+        with lock:
+            latencias.extend(propias)
+            errores[0] += fallidas
+
+    hilos = [threading.Thread(target=cliente, daemon=True) for _ in range(clientes)]
+    inicio = time.monotonic()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = time.monotonic() - inicio
+
+    latencias.sort()
+    return {
+        'peticiones': len(latencias),
+        'errores': errores[0],
+        'peticiones_por_seg': round(len(latencias) / transcurrido, 1),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url')
+    parser.add_argument('--clientes', type=int, default=200)
+    parser.add_argument('--duracion', type=float, default=20)
+    args = parser.parse_args()
+    resultado = ejecutar_carga(args.url, args.clientes, args.duracion)
+    for clave, valor in resultado.items():
+        print(f'{clave}: {valor}')
+
+
+if __name__ == '__main__':
+    main()
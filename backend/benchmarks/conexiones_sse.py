@@ -0,0 +1,235 @@
+"""Escalado de conexiones SSE: la API JSON con miles de conexiones de eventos abiertas.
+
+Arranca gunicorn como suite.py (por defecto con workers gevent, el modo por
+defecto de gunicorn.conf.py) y abre conexiones a /api/pedidos/eventos en
+escalones (--escalones, total acumulado). En cada escalón, con todas las
+conexiones abiertas, mide:
+
+- latencia y throughput de GET /api/productos con --clientes clientes
+  durante --duracion segundos (carga.py);
+- cuánto tarda un evento de pedido en llegar a todas las conexiones.
+
+Las conexiones SSE se leen desde un solo hilo con selectors, así que el
+cliente no necesita un hilo por conexión. Cada una ocupa un descriptor de
+archivo en el cliente y otro en el servidor: el límite (ulimit -n) debe
+superar el escalón más alto. Con gevent cada worker acepta hasta
+GUNICORN_WORKER_CONNECTIONS conexiones (SSE incluidas); el script lo sube
+para el escalón más alto salvo que se pase --conexiones-por-worker.
+
+Uso:
+    python benchmarks/conexiones_sse.py --escalones 0,1000,2000,4000
+    python benchmarks/conexiones_sse.py --worker-class gthread --escalones 0,8,32   # comparación
+"""
+import argparse
+import json
+import os
+import resource
+import selectors
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from carga import ejecutar_carga
+from suite import CONTRASEÑA, CORREO_ADMIN, Sesion, detener_servidor, iniciar_servidor, puerto_libre
+
+MARCA_EVENTO = b'event: pedido'
+
+
+class ConexionesSSE:
+    """Conexiones abiertas a /api/pedidos/eventos con la sesión de un usuario, leídas por un hilo"""
+
+    def __init__(self, puerto, cookie):
+        self.peticion = (f'GET /api/pedidos/eventos HTTP/1.1\r\nHost: 127.0.0.1:{puerto}\r\n'
+                         f'Cookie: {cookie}\r\nAccept: text/event-stream\r\n\r\n').encode()
+        self.puerto = puerto
+        self.selector = selectors.DefaultSelector()
+        self.estados = {}  # socket -> {'abierta', 'eventos', 'resto'}
+        self.lock = threading.Lock()
+        self.activo = True
+        self.hilo = threading.Thread(target=self._leer, daemon=True)
+        self.hilo.start()
+
+    def abrir(self, cantidad):
+        """Abrir hasta cantidad conexiones; retorna las que se pudieron conectar"""
+        for i in range(cantidad):
+            try:
+                conexion = socket.create_connection(('127.0.0.1', self.puerto), timeout=10)
+                conexion.sendall(self.peticion)
+            except OSError:
+                # El servidor dejó de aceptar conexiones (GUNICORN_WORKER_CONNECTIONS o backlog lleno)
+                return i
+            conexion.setblocking(False)
+            with self.lock:
+                self.estados[conexion] = {'abierta': False, 'eventos': 0, 'resto': b''}
+                self.selector.register(conexion, selectors.EVENT_READ)
+        return cantidad
+
+    def _leer(self):
+        while self.activo:
+            with self.lock:
+                vacio = not self.estados
+            if vacio:
+                time.sleep(0.05)
+                continue
+            for clave, _ in self.selector.select(timeout=0.2):
+                conexion = clave.fileobj
+                try:
+                    datos = conexion.recv(65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    datos = b''
+                with self.lock:
+                    estado = self.estados.get(conexion)
+                    if estado is None:
+                        continue
+                    if not datos:
+                        self.selector.unregister(conexion)
+                        del self.estados[conexion]
+                        conexion.close()
+                        continue
+                    texto = estado['resto'] + datos
+                    if not estado['abierta'] and b'\r\n\r\n' in texto:
+                        estado['abierta'] = texto.startswith(b'HTTP/1.1 200')
+                    estado['eventos'] += texto.count(MARCA_EVENTO)
+                    # Lo que cabe sin repetir una marca ya contada, por si llega partida entre dos lecturas
+                    estado['resto'] = texto[-(len(MARCA_EVENTO) - 1):]
+
+    def abiertas(self):
+        with self.lock:
+            return sum(1 for estado in self.estados.values() if estado['abierta'])
+
+    def esperar_abiertas(self, cantidad, segundos):
+        limite = time.monotonic() + segundos
+        while self.abiertas() < cantidad and time.monotonic() < limite:
+            time.sleep(0.1)
+        return self.abiertas()
+
+    def minimo_eventos(self):
+        with self.lock:
+            return min((e['eventos'] for e in self.estados.values() if e['abierta']), default=0)
+
+    def cerrar(self):
+        self.activo = False
+        self.hilo.join(timeout=5)
+        with self.lock:
+            for conexion in self.estados:
+                conexion.close()
+            self.estados.clear()
+        self.selector.close()
+
+
+def ajustar_limite_archivos(necesarios):
+    """Subir el límite de descriptores hasta el máximo permitido; lo heredan el servidor y sus workers"""
+    blando, duro = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if blando < necesarios and (duro == resource.RLIM_INFINITY or duro > blando):
+        blando = necesarios if duro == resource.RLIM_INFINITY else min(duro, necesarios)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (blando, duro))
+    return blando
+
+
+def preparar(puerto):
+    """Administrador con un producto y un usuario comprador; retorna (usuario, producto_id)"""
+    admin = Sesion('127.0.0.1', puerto)
+    codigo, _, _ = admin.pedir('POST', '/api/register', {'correo': CORREO_ADMIN, 'contraseña': CONTRASEÑA})
+    if codigo != 201:
+        admin.pedir('POST', '/api/login', {'correo': CORREO_ADMIN, 'contraseña': CONTRASEÑA})
+    codigo, producto, _ = admin.pedir('POST', '/api/productos',
+                                      {'nombre': 'Producto eventos', 'precio': 1.0, 'stock': 1000000})
+    if codigo != 201:
+        raise RuntimeError(f'No se pudo crear el producto ({codigo}): {producto}')
+    admin.cerrar()
+
+    usuario = Sesion('127.0.0.1', puerto)
+    codigo, _, _ = usuario.pedir('POST', '/api/register', {'correo': 'eventos@bench.local', 'contraseña': CONTRASEÑA})
+    if codigo != 201:
+        raise RuntimeError(f'No se pudo registrar el usuario de las conexiones ({codigo})')
+    return usuario, producto['id']
+
+
+def medir_entrega(conexiones, usuario, producto_id, segundos):
+    """Crear un pedido y retornar los ms hasta que el evento llegó a todas las conexiones (None si no llegó)"""
+    objetivo = conexiones.minimo_eventos() + 1
+    inicio = time.perf_counter()
+    codigo, _, _ = usuario.pedir('POST', '/api/pedido', {'carrito': [{'id': producto_id, 'cantidad': 1}],
+                                                          'direccion_pedido': 'Calle de prueba'})
+    if codigo != 201:
+        return None
+    limite = time.monotonic() + segundos
+    while conexiones.minimo_eventos() < objetivo:
+        if time.monotonic() > limite:
+            return None
+        time.sleep(0.005)
+    return round((time.perf_counter() - inicio) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--escalones', default='0,500,1000,2000,4000',
+                        help='Conexiones SSE abiertas en cada medición (total acumulado)')
+    parser.add_argument('--clientes', type=int, default=8, help='Clientes concurrentes de la API JSON')
+    parser.add_argument('--duracion', type=float, default=10, help='Segundos de carga JSON por escalón')
+    parser.add_argument('--espera', type=float, default=60, help='Segundos máximos para abrir las conexiones')
+    parser.add_argument('--database-url', help='PostgreSQL local (por defecto SQLite en un directorio temporal)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--hilos', type=int, default=8, help='Hilos por worker (gthread)')
+    parser.add_argument('--conexiones-por-worker', type=int,
+                        help='GUNICORN_WORKER_CONNECTIONS (gevent); por defecto alcanza para el escalón más alto')
+    parser.add_argument('--worker-class', default='gevent', choices=('gevent', 'gthread'))
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    parser.add_argument('--resultado', help='Archivo JSON donde escribir el resultado')
+    args = parser.parse_args()
+    try:
+        escalones = sorted(int(valor) for valor in args.escalones.split(','))
+    except ValueError:
+        parser.error('--escalones debe ser una lista de enteros separados por comas')
+
+    limite = ajustar_limite_archivos(escalones[-1] + 1000)
+    if limite < escalones[-1] + 200:
+        parser.error(f'El límite de archivos abiertos ({limite}) no alcanza para {escalones[-1]} conexiones')
+
+    # Los workers no se reparten las conexiones en partes iguales: cada uno debe poder con todas
+    por_worker = args.conexiones_por_worker or escalones[-1] + 2 * args.clientes + 50
+    os.environ['GUNICORN_WORKER_CONNECTIONS'] = str(por_worker)
+
+    directorio = tempfile.mkdtemp(prefix='supermercado-sse-')
+    puerto = puerto_libre()
+    servidor = iniciar_servidor(args, directorio, puerto)
+    conexiones = None
+    filas = []
+    try:
+        usuario, producto_id = preparar(puerto)
+        cookie = '; '.join(f'{k}={v}' for k, v in usuario.cookies.items())
+        conexiones = ConexionesSSE(puerto, cookie)
+        print(f'{"SSE pedidas":>11} {"abiertas":>9} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+              f'{"errores":>8} {"entrega ms":>11}')
+        solicitadas = 0
+        for escalon in escalones:
+            solicitadas += conexiones.abrir(escalon - solicitadas)
+            abiertas = conexiones.esperar_abiertas(solicitadas, args.espera)
+            carga = ejecutar_carga(f'http://127.0.0.1:{puerto}/api/productos?limite=20', args.clientes, args.duracion)
+            entrega = medir_entrega(conexiones, usuario, producto_id, 30) if abiertas else None
+            fila = dict(conexiones_pedidas=escalon, conexiones_abiertas=abiertas, entrega_ms=entrega, **carga)
+            filas.append(fila)
+            print(f'{escalon:>11} {abiertas:>9} {carga["peticiones_por_seg"]:>8} {carga["p50_ms"]:>8} '
+                  f'{carga["p95_ms"]:>8} {carga["p99_ms"]:>8} {carga["errores"]:>8} '
+                  f'{"-" if entrega is None else entrega:>11}', flush=True)
+        usuario.cerrar()
+    finally:
+        if conexiones is not None:
+            conexiones.cerrar()
+        detener_servidor(servidor)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    if args.resultado:
+        with open(args.resultado, 'w', encoding='utf-8') as archivo:
+            json.dump({'configuracion': {k: v for k, v in vars(args).items() if k not in ('resultado', 'database_url')},
+                       'motor': 'postgres' if args.database_url else 'sqlite', 'escalones': filas},
+                      archivo, ensure_ascii=False, indent=2)
+            archivo.write('\n')
+
+
+if __name__ == '__main__':
+    main()
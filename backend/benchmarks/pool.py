@@ -0,0 +1,109 @@
+"""Pool de conexiones: latencia de la API con el pool (DB_POOL=1) y sin él (DB_POOL=0).
+
+Arranca gunicorn como suite.py una vez por modo, sobre una base nueva, y
+mide con carga.py (--clientes clientes durante --duracion segundos) cada
+ruta de --rutas: sin pool cada petición abre y cierra su conexión, con pool
+la toma del pool y la devuelve. Los modos se alternan --repeticiones veces
+y se reporta la mediana de cada métrica.
+
+Con SQLite abrir una conexión es abrir un archivo; la diferencia importante
+está en PostgreSQL, donde cada conexión nueva es un handshake TCP y una
+autenticación (--database-url, usar una base dedicada).
+
+Uso:
+    python benchmarks/pool.py
+    python benchmarks/pool.py --database-url postgresql://localhost/supermercado_bench
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+
+from carga import ejecutar_carga
+from suite import CONTRASEÑA, CORREO_ADMIN, Sesion, detener_servidor, iniciar_servidor, puerto_libre
+
+MODOS = {'pool': '1', 'sin pool': '0'}
+METRICAS = ('peticiones_por_seg', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def preparar(puerto, productos):
+    """Administrador y productos (importación CSV) para que el catálogo no esté vacío"""
+    admin = Sesion('127.0.0.1', puerto)
+    codigo, _, _ = admin.pedir('POST', '/api/register', {'correo': CORREO_ADMIN, 'contraseña': CONTRASEÑA})
+    if codigo != 201:
+        admin.pedir('POST', '/api/login', {'correo': CORREO_ADMIN, 'contraseña': CONTRASEÑA})
+    lineas = ['nombre,precio,stock'] + [f'Producto pool {i},{1 + i % 50}.25,1000' for i in range(productos)]
+    codigo, resultado, _ = admin.pedir('POST', '/api/productos/importar', cuerpo='\n'.join(lineas) + '\n',
+                                       tipo='text/csv')
+    if codigo != 200 or resultado['total_errores']:
+        raise RuntimeError(f'Falló la importación de productos: {resultado}')
+    admin.cerrar()
+
+
+def medir_modo(args, modo, rutas):
+    """Arrancar el servidor en el modo dado y medir cada ruta; retorna {ruta: resultado de carga}"""
+    os.environ['DB_POOL'] = MODOS[modo]
+    directorio = tempfile.mkdtemp(prefix='supermercado-pool-')
+    puerto = puerto_libre()
+    servidor = iniciar_servidor(args, directorio, puerto)
+    try:
+        preparar(puerto, args.productos)
+        resultados = {}
+        for ruta in rutas:
+            url = f'http://127.0.0.1:{puerto}{ruta}'
+            ejecutar_carga(url, args.clientes, 2)  # calentamiento
+            resultados[ruta] = ejecutar_carga(url, args.clientes, args.duracion)
+        return resultados
+    finally:
+        detener_servidor(servidor)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rutas', default='/api/configuracion/tasa,/api/productos?limite=20',
+                        help='Rutas GET a medir, separadas por comas')
+    parser.add_argument('--clientes', type=int, default=8, help='Clientes concurrentes')
+    parser.add_argument('--duracion', type=float, default=10, help='Segundos de carga por ruta')
+    parser.add_argument('--repeticiones', type=int, default=3, help='Veces que se mide cada modo (mediana)')
+    parser.add_argument('--productos', type=int, default=200)
+    parser.add_argument('--database-url', help='PostgreSQL local (por defecto SQLite en un directorio temporal)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--hilos', type=int, default=8, help='Hilos por worker (gthread)')
+    parser.add_argument('--worker-class', default='gevent', choices=('gevent', 'gthread', 'sync'))
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    parser.add_argument('--resultado', help='Archivo JSON donde escribir el resultado')
+    args = parser.parse_args()
+    rutas = [ruta for ruta in args.rutas.split(',') if ruta]
+
+    mediciones = {modo: [] for modo in MODOS}
+    for repeticion in range(args.repeticiones):
+        # Alternar el orden para que la deriva de la máquina no favorezca a un modo
+        for modo in (list(MODOS) if repeticion % 2 == 0 else list(MODOS)[::-1]):
+            mediciones[modo].append(medir_modo(args, modo, rutas))
+
+    resumen = {modo: {ruta: {metrica: round(statistics.median(m[ruta][metrica] for m in lista), 2)
+                             for metrica in METRICAS}
+                      | {'errores': sum(m[ruta]['errores'] for m in lista)}
+                      for ruta in rutas}
+               for modo, lista in mediciones.items()}
+
+    print(f'{"ruta":<28}{"modo":<10}{"pet/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errores":>9}')
+    for ruta in rutas:
+        for modo in MODOS:
+            datos = resumen[modo][ruta]
+            print(f'{ruta:<28}{modo:<10}{datos["peticiones_por_seg"]:>9}{datos["p50_ms"]:>9}'
+                  f'{datos["p95_ms"]:>9}{datos["p99_ms"]:>9}{datos["errores"]:>9}')
+
+    if args.resultado:
+        with open(args.resultado, 'w', encoding='utf-8') as archivo:
+            json.dump({'configuracion': {k: v for k, v in vars(args).items() if k not in ('resultado', 'database_url')},
+                       'motor': 'postgres' if args.database_url else 'sqlite', 'modos': resumen},
+                      archivo, ensure_ascii=False, indent=2)
+            archivo.write('\n')
+
+
+if __name__ == '__main__':
+    main()
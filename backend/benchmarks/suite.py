@@ -0,0 +1,477 @@
+"""Suite de benchmarks de la API: escenarios reales contra un servidor local.
+
+Arranca gunicorn (gunicorn.conf.py) sobre una base SQLite nueva en un
+directorio temporal o sobre un PostgreSQL local (--database-url, usar una
+base dedicada), crea los datos por la propia API y simula clientes
+concurrentes que navegan el catálogo, buscan, inician sesión, crean pedidos
+y confirman el pago, más administradores que consultan la lista de pedidos.
+Cada cliente elige sus acciones con un generador con semilla, así que dos
+ejecuciones con los mismos parámetros hacen las mismas peticiones.
+
+Por operación reporta p50/p95/p99 (ms), peticiones por segundo, errores y
+consultas SQL por petición (de los histogramas de /metrics, sumando todos
+los workers), como mediana de --repeticiones fases medidas. El resultado se
+escribe en JSON y se compara con la línea base guardada para el mismo motor
+y la misma configuración: la suite termina con código 1 si hay errores, si
+p50 sube o el throughput baja más que --umbral (p95 más del doble de
+--umbral), o si las consultas por petición suben más que --umbral-consultas. linea_base.json trae la medición
+de referencia; la latencia depende de la máquina, así que conviene
+regenerarla (--guardar-linea-base) en la que corre la suite.
+
+Uso:
+    python benchmarks/suite.py --resultado resultado.json
+    python benchmarks/suite.py --database-url postgresql://localhost/supermercado_bench
+    python benchmarks/suite.py --guardar-linea-base   # después de un cambio aceptado
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from urllib.parse import quote
+
+from carga import percentil
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINEA_BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'linea_base.json')
+
+CORREO_ADMIN = 'admin@inversionesledezma.com'
+CONTRASEÑA = 'benchmark123'
+PALABRAS = ('Arroz', 'Leche', 'Café', 'Harina', 'Aceite', 'Jabón', 'Pasta', 'Azúcar', 'Queso', 'Galletas')
+
+# operación -> (método, regla de la ruta en Flask, como aparece en /metrics)
+OPERACIONES = {
+    'catalogo': ('GET', '/api/productos'),
+    'buscar': ('GET', '/api/productos/buscar'),
+    'login': ('POST', '/api/login'),
+    'crear_pedido': ('POST', '/api/pedido'),
+    'confirmar_pago': ('POST', '/api/confirmar_pago'),
+    'pedidos_admin': ('GET', '/api/pedidos'),
+}
+
+# Peso de cada acción de un cliente; 'comprar' hace crear_pedido y confirmar_pago
+MEZCLA = {'catalogo': 60, 'buscar': 20, 'comprar': 15, 'login': 5}
+
+# Entorno del servidor: métricas escritas a menudo para leerlas al terminar cada fase
+ENTORNO_SERVIDOR = {
+    'METRICAS': '1',
+    'METRICAS_TOKEN': 'suite-de-rendimiento',
+    'METRICAS_INTERVALO': '0.2',
+    'PERFILADO': '0',
+}
+
+
+class Sesion:
+    """Conexión HTTP keep-alive de un cliente con sus cookies"""
+
+    def __init__(self, host, puerto):
+        self.host, self.puerto = host, puerto
+        self.cookies = {}
+        self.conexion = http.client.HTTPConnection(host, puerto, timeout=60)
+
+    def pedir(self, metodo, ruta, datos=None, cuerpo=None, tipo='application/json'):
+        """Retornar (código, cuerpo JSON o None, segundos); código 0 si falló la conexión"""
+        cabeceras = {}
+        if datos is not None:
+            cuerpo = json.dumps(datos)
+        if cuerpo is not None:
+            cabeceras['Content-Type'] = tipo
+        if self.cookies:
+            cabeceras['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        if isinstance(cuerpo, str):
+            cuerpo = cuerpo.encode()
+        for intento in range(2):
+            inicio = time.perf_counter()
+            try:
+                self.conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+                respuesta = self.conexion.getresponse()
+                contenido = respuesta.read()
+                break
+            except (OSError, http.client.HTTPException) as error:
+                self.conexion.close()
+                self.conexion = http.client.HTTPConnection(self.host, self.puerto, timeout=60)
+                # El servidor cerró una conexión keep-alive inactiva: reintentar una vez, como un navegador
+                if intento or not isinstance(error, (http.client.RemoteDisconnected, ConnectionResetError,
+                                                     BrokenPipeError)):
+                    return 0, None, time.perf_counter() - inicio
+        segundos = time.perf_counter() - inicio
+        for cookie in respuesta.msg.get_all('Set-Cookie') or []:
+            nombre, _, valor = cookie.split(';', 1)[0].partition('=')
+            self.cookies[nombre.strip()] = valor
+        try:
+            datos = json.loads(contenido) if contenido else None
+        except ValueError:
+            datos = None
+        return respuesta.status, datos, segundos
+
+    def cerrar(self):
+        self.conexion.close()
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(args, directorio, puerto):
+    """Arrancar gunicorn con la configuración del repositorio; la base SQLite queda en directorio"""
+    entorno = dict(os.environ, **ENTORNO_SERVIDOR)
+    entorno.update({
+        'PYTHONPATH': BACKEND,
+        'METRICAS_DIR': os.path.join(directorio, 'metricas'),
+        'GUNICORN_WORKERS': str(args.workers),
+        'GUNICORN_THREADS': str(args.hilos),
+        'GUNICORN_WORKER_CLASS': args.worker_class,
+        'BCRYPT_ROUNDS': str(args.bcrypt_rounds),
+    })
+    entorno.pop('DATABASE_URL', None)
+    if args.database_url:
+        entorno['DATABASE_URL'] = args.database_url
+    registro = open(os.path.join(directorio, 'servidor.log'), 'w')
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BACKEND, 'gunicorn.conf.py'),
+         '--bind', f'127.0.0.1:{puerto}'],
+        cwd=directorio, env=entorno, stdout=registro, stderr=subprocess.STDOUT)
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f'El servidor terminó al arrancar; ver {registro.name}')
+        try:
+            conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=5)
+            conexion.request('GET', '/api/categorias')
+            if conexion.getresponse().status == 200:
+                return proceso
+        except OSError:
+            time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError('El servidor no respondió en 60 s')
+
+
+def detener_servidor(proceso):
+    proceso.terminate()
+    try:
+        proceso.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proceso.kill()
+
+
+def preparar_datos(puerto, args):
+    """Crear por la API el administrador, los productos (importación CSV) y una cuenta por cliente"""
+    admin = Sesion('127.0.0.1', puerto)
+    codigo, _, _ = admin.pedir('POST', '/api/register', {'correo': CORREO_ADMIN, 'contraseña': CONTRASEÑA})
+    if codigo != 201:
+        codigo, _, _ = admin.pedir('POST', '/api/login', {'correo': CORREO_ADMIN, 'contraseña': CONTRASEÑA})
+    if codigo not in (200, 201):
+        raise RuntimeError(f'No se pudo crear ni iniciar sesión como administrador ({codigo})')
+
+    azar = random.Random(args.semilla)
+    lineas = ['nombre,precio,stock']
+    for i in range(args.productos):
+        lineas.append(f'{azar.choice(PALABRAS)} bench {i},{azar.uniform(0.5, 50):.2f},100000000')
+    codigo, resultado, _ = admin.pedir('POST', '/api/productos/importar', cuerpo='\n'.join(lineas) + '\n',
+                                       tipo='text/csv')
+    if codigo != 200 or resultado['total_errores']:
+        raise RuntimeError(f'Falló la importación de productos: {resultado}')
+
+    codigo, productos, _ = admin.pedir('GET', '/api/productos')
+    _, categorias, _ = admin.pedir('GET', '/api/categorias')
+    ids = [p['id'] for p in productos if p['nombre'].split(' ', 2)[1:2] == ['bench']]
+
+    cuentas = []
+    for i in range(args.clientes):
+        cliente = Sesion('127.0.0.1', puerto)
+        correo = f'cliente{i}@bench.local'
+        codigo, _, _ = cliente.pedir('POST', '/api/register', {'correo': correo, 'contraseña': CONTRASEÑA})
+        if codigo != 201:
+            codigo, _, _ = cliente.pedir('POST', '/api/login', {'correo': correo, 'contraseña': CONTRASEÑA})
+        if codigo not in (200, 201):
+            raise RuntimeError(f'No se pudo preparar la cuenta {correo} ({codigo})')
+        cuentas.append((correo, cliente))
+    return admin, cuentas, ids, [c['id'] for c in categorias]
+
+
+def ejecutar_fase(admin, cuentas, ids, categorias, args, iteraciones, semilla):
+    """Correr iteraciones acciones por cliente y por administrador; retorna (latencias, errores, segundos)"""
+    latencias = defaultdict(list)
+    errores = defaultdict(int)
+    lock = threading.Lock()
+    sesiones_admin = [admin] + [Sesion('127.0.0.1', admin.puerto) for _ in range(args.admins - 1)]
+    for sesion in sesiones_admin[1:]:
+        sesion.cookies = dict(admin.cookies)
+    barrera = threading.Barrier(len(cuentas) + len(sesiones_admin))
+    acciones, pesos = list(MEZCLA), list(MEZCLA.values())
+
+    def registrar(propias, fallidas):
+        with lock:
+            for operacion, valores in propias.items():
+                latencias[operacion].extend(valores)
+            for operacion, cantidad in fallidas.items():
+                errores[operacion] += cantidad
+
+    def medir(sesion, propias, fallidas, operacion, ruta, datos=None, esperado=200):
+        codigo, respuesta, segundos = sesion.pedir(OPERACIONES[operacion][0], ruta, datos)
+        if codigo != esperado:
+            fallidas[operacion] += 1
+            return None
+        propias[operacion].append(segundos)
+        return respuesta
+
+    def cliente(indice, correo, sesion):
+        azar = random.Random(f'{semilla}-{indice}')
+        propias, fallidas = defaultdict(list), defaultdict(int)
+        barrera.wait()
+        for _ in range(iteraciones):
+            accion = azar.choices(acciones, pesos)[0]
+            if accion == 'catalogo':
+                ruta = '/api/productos?limite=50'
+                if azar.random() < 0.5:
+                    ruta += f'&categoria_id={azar.choice(categorias)}'
+                medir(sesion, propias, fallidas, 'catalogo', ruta)
+            elif accion == 'buscar':
+                medir(sesion, propias, fallidas, 'buscar', f'/api/productos/buscar?q={quote(azar.choice(PALABRAS)[:3])}')
+            elif accion == 'login':
+                medir(sesion, propias, fallidas, 'login', '/api/login', {'correo': correo, 'contraseña': CONTRASEÑA})
+            else:
+                carrito = [{'id': producto_id, 'cantidad': azar.randint(1, 3)}
+                           for producto_id in azar.sample(ids, azar.randint(1, min(5, len(ids))))]
+                pedido = medir(sesion, propias, fallidas, 'crear_pedido', '/api/pedido',
+                               {'carrito': carrito, 'direccion_pedido': 'Calle Benchmark'}, esperado=201)
+                if pedido:
+                    medir(sesion, propias, fallidas, 'confirmar_pago', '/api/confirmar_pago',
+                          {'pedido_id': pedido['id'], 'referencia_pago': str(azar.randint(1000, 999999))})
+        registrar(propias, fallidas)
+
+    def administrador(sesion):
+        propias, fallidas = defaultdict(list), defaultdict(int)
+        barrera.wait()
+        for _ in range(iteraciones):
+            medir(sesion, propias, fallidas, 'pedidos_admin', '/api/pedidos?limite=50')
+        registrar(propias, fallidas)
+
+    hilos = [threading.Thread(target=cliente, args=(i, correo, sesion), daemon=True)
+             for i, (correo, sesion) in enumerate(cuentas)]
+    hilos += [threading.Thread(target=administrador, args=(sesion,), daemon=True) for sesion in sesiones_admin]
+    inicio = time.monotonic()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return latencias, errores, time.monotonic() - inicio
+
+
+def leer_consultas(puerto):
+    """(método, ruta) -> [consultas, peticiones] según el histograma db_consultas_por_peticion de /metrics"""
+    conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=60)
+    conexion.request('GET', '/metrics', headers={'Authorization': f'Bearer {ENTORNO_SERVIDOR["METRICAS_TOKEN"]}'})
+    texto = conexion.getresponse().read().decode()
+    conexion.close()
+    totales = defaultdict(lambda: [0.0, 0.0])
+    patron = re.compile(r'^db_consultas_por_peticion_(sum|count)\{(.*)\} (\S+)$')
+    for linea in texto.splitlines():
+        coincidencia = patron.match(linea)
+        if not coincidencia:
+            continue
+        etiquetas = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', coincidencia.group(2)))
+        clave = (etiquetas.get('metodo'), etiquetas.get('ruta'))
+        totales[clave][0 if coincidencia.group(1) == 'sum' else 1] += float(coincidencia.group(3))
+    return totales
+
+
+def resumir(latencias, errores, segundos, consultas_antes, consultas_despues):
+    operaciones = {}
+    for operacion, (metodo, ruta) in OPERACIONES.items():
+        valores = sorted(latencias.get(operacion, []))
+        if not valores and not errores.get(operacion):
+            continue
+        antes = consultas_antes.get((metodo, ruta), [0.0, 0.0])
+        despues = consultas_despues.get((metodo, ruta), [0.0, 0.0])
+        peticiones_servidor = despues[1] - antes[1]
+        operaciones[operacion] = {
+            'peticiones': len(valores),
+            'errores': errores.get(operacion, 0),
+            'peticiones_por_seg': round(len(valores) / segundos, 1),
+            'p50_ms': round(percentil(valores, 50) * 1000, 2),
+            'p95_ms': round(percentil(valores, 95) * 1000, 2),
+            'p99_ms': round(percentil(valores, 99) * 1000, 2),
+            'consultas_por_peticion': (round((despues[0] - antes[0]) / peticiones_servidor, 2)
+                                       if peticiones_servidor else None),
+        }
+    todas = sorted(v for valores in latencias.values() for v in valores)
+    total = {
+        'peticiones': len(todas),
+        'errores': sum(errores.values()),
+        'segundos': round(segundos, 2),
+        'peticiones_por_seg': round(len(todas) / segundos, 1),
+        'p50_ms': round(percentil(todas, 50) * 1000, 2),
+        'p95_ms': round(percentil(todas, 95) * 1000, 2),
+        'p99_ms': round(percentil(todas, 99) * 1000, 2),
+    }
+    return operaciones, total
+
+
+def _mediana(valores):
+    valores = sorted(v for v in valores if v is not None)
+    if not valores:
+        return None
+    medio = len(valores) // 2
+    return valores[medio] if len(valores) % 2 else round((valores[medio - 1] + valores[medio]) / 2, 2)
+
+
+def combinar(repeticiones):
+    """Mediana de cada métrica entre repeticiones (los errores se suman)"""
+    def combinar_datos(lista):
+        return {clave: (sum(d[clave] for d in lista) if clave == 'errores'
+                        else _mediana([d.get(clave) for d in lista]))
+                for clave in lista[0]}
+
+    operaciones = {}
+    for operacion in OPERACIONES:
+        lista = [ops[operacion] for ops, _ in repeticiones if operacion in ops]
+        if lista:
+            operaciones[operacion] = combinar_datos(lista)
+    return operaciones, combinar_datos([total for _, total in repeticiones])
+
+
+def comparar(resultado, base, umbral, umbral_consultas, tolerancia_ms):
+    """Lista de regresiones de resultado frente a base (vacía si no hay)"""
+    regresiones = []
+    if resultado['total']['errores']:
+        regresiones.append(f'{resultado["total"]["errores"]} peticiones con error')
+    if resultado['total']['peticiones_por_seg'] < base['total']['peticiones_por_seg'] * (1 - umbral):
+        regresiones.append(f'throughput: {resultado["total"]["peticiones_por_seg"]} peticiones/s '
+                           f'(línea base {base["total"]["peticiones_por_seg"]})')
+    for operacion, actual in resultado['operaciones'].items():
+        previo = base['operaciones'].get(operacion)
+        if not previo:
+            continue
+        # p95 varía más entre ejecuciones que p50 (esperas por el bloqueo de escritura), así que
+        # tolera el doble; p99 se reporta pero no se compara: depende de 1 o 2 muestras
+        for clave, tolerado in (('p50_ms', umbral), ('p95_ms', umbral * 2)):
+            if actual[clave] > previo[clave] * (1 + tolerado) + tolerancia_ms:
+                regresiones.append(f'{operacion} {clave}: {actual[clave]} (línea base {previo[clave]})')
+        consultas, consultas_base = actual['consultas_por_peticion'], previo['consultas_por_peticion']
+        if consultas is not None and consultas_base is not None and consultas > consultas_base * (1 + umbral_consultas) + 0.5:
+            regresiones.append(f'{operacion} consultas_por_peticion: {consultas} (línea base {consultas_base})')
+    return regresiones
+
+
+def imprimir(resultado):
+    print(f'{"operación":<16}{"peticiones":>11}{"errores":>9}{"pet/s":>9}{"p50 ms":>9}{"p95 ms":>9}'
+          f'{"p99 ms":>9}{"consultas":>11}')
+    filas = list(resultado['operaciones'].items()) + [('TOTAL', resultado['total'])]
+    for operacion, datos in filas:
+        consultas = datos.get('consultas_por_peticion')
+        print(f'{operacion:<16}{datos["peticiones"]:>11}{datos["errores"]:>9}{datos["peticiones_por_seg"]:>9}'
+              f'{datos["p50_ms"]:>9}{datos["p95_ms"]:>9}{datos["p99_ms"]:>9}'
+              f'{"" if consultas is None else consultas:>11}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='PostgreSQL local (por defecto SQLite en un directorio temporal)')
+    parser.add_argument('--clientes', type=int, default=8, help='Clientes concurrentes')
+    parser.add_argument('--admins', type=int, default=1, help='Administradores concurrentes consultando pedidos')
+    parser.add_argument('--iteraciones', type=int, default=200, help='Acciones por cliente en la fase medida')
+    parser.add_argument('--repeticiones', type=int, default=3,
+                        help='Veces que se repite la fase medida (se reporta la mediana)')
+    parser.add_argument('--calentamiento', type=int, default=10, help='Acciones por cliente antes de medir')
+    parser.add_argument('--productos', type=int, default=500)
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--hilos', type=int, default=8, help='Hilos por worker (gthread)')
+    parser.add_argument('--worker-class', default='gthread', choices=('gthread', 'gevent', 'sync'))
+    parser.add_argument('--bcrypt-rounds', type=int, default=10)
+    parser.add_argument('--resultado', help='Archivo JSON donde escribir el resultado')
+    parser.add_argument('--linea-base', default=LINEA_BASE)
+    parser.add_argument('--umbral', type=float, default=0.25, help='Empeoramiento relativo tolerado de latencia y throughput')
+    parser.add_argument('--umbral-consultas', type=float, default=0.1,
+                        help='Aumento relativo tolerado de consultas por petición (casi no varía entre ejecuciones)')
+    parser.add_argument('--tolerancia-ms', type=float, default=2.0, help='Diferencia de latencia absoluta ignorada')
+    parser.add_argument('--guardar-linea-base', action='store_true',
+                        help='Guardar este resultado como línea base del motor en lugar de comparar')
+    args = parser.parse_args()
+    if min(args.clientes, args.admins, args.repeticiones) < 1:
+        parser.error('--clientes, --admins y --repeticiones deben ser al menos 1')
+
+    motor = 'postgres' if args.database_url else 'sqlite'
+    configuracion = {clave: getattr(args, clave) for clave in
+                     ('clientes', 'admins', 'iteraciones', 'repeticiones', 'calentamiento', 'productos', 'semilla',
+                      'workers', 'hilos', 'worker_class', 'bcrypt_rounds')}
+
+    directorio = tempfile.mkdtemp(prefix='supermercado-bench-')
+    puerto = puerto_libre()
+    servidor = iniciar_servidor(args, directorio, puerto)
+    try:
+        admin, cuentas, ids, categorias = preparar_datos(puerto, args)
+        ejecutar_fase(admin, cuentas, ids, categorias, args, args.calentamiento, f'{args.semilla}-calentamiento')
+        time.sleep(float(ENTORNO_SERVIDOR['METRICAS_INTERVALO']) * 3)
+        repeticiones = []
+        for repeticion in range(args.repeticiones):
+            consultas_antes = leer_consultas(puerto)
+            latencias, errores, segundos = ejecutar_fase(admin, cuentas, ids, categorias, args,
+                                                         args.iteraciones, f'{args.semilla}-{repeticion}')
+            time.sleep(float(ENTORNO_SERVIDOR['METRICAS_INTERVALO']) * 3)
+            repeticiones.append(resumir(latencias, errores, segundos, consultas_antes, leer_consultas(puerto)))
+        for sesion in [admin] + [sesion for _, sesion in cuentas]:
+            sesion.cerrar()
+    finally:
+        detener_servidor(servidor)
+    shutil.rmtree(directorio, ignore_errors=True)
+
+    operaciones, total = combinar(repeticiones)
+    resultado = {
+        'motor': motor,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'configuracion': configuracion,
+        'total': total,
+        'operaciones': operaciones,
+    }
+    imprimir(resultado)
+
+    lineas_base = {}
+    if os.path.exists(args.linea_base):
+        with open(args.linea_base, encoding='utf-8') as archivo:
+            lineas_base = json.load(archivo)
+
+    codigo = 0
+    if args.guardar_linea_base:
+        lineas_base[motor] = resultado
+        with open(args.linea_base, 'w', encoding='utf-8') as archivo:
+            json.dump(lineas_base, archivo, ensure_ascii=False, indent=2)
+            archivo.write('\n')
+        print(f'✓ Línea base de {motor} guardada en {args.linea_base}')
+    elif motor not in lineas_base:
+        print(f'Sin línea base para {motor}; ejecutar con --guardar-linea-base para crearla.')
+    elif lineas_base[motor]['configuracion'] != configuracion:
+        print(f'La línea base de {motor} se midió con otra configuración: {lineas_base[motor]["configuracion"]}')
+        codigo = 2
+    else:
+        regresiones = comparar(resultado, lineas_base[motor], args.umbral, args.umbral_consultas, args.tolerancia_ms)
+        resultado['regresiones'] = regresiones
+        for regresion in regresiones:
+            print(f'✗ Regresión: {regresion}')
+        if regresiones:
+            codigo = 1
+        else:
+            print(f'✓ Sin regresiones frente a la línea base de {motor} (umbral {args.umbral:.0%})')
+
+    if args.resultado:
+        with open(args.resultado, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+            archivo.write('\n')
+    return codigo
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""Tormenta de inicios de sesión: latencia del catálogo mientras muchos clientes inician sesión.
+
+Arranca gunicorn como suite.py y mide GET /api/productos con --clientes
+clientes durante --duracion segundos (carga.py) dos veces: sola (base) y
+mientras --atacantes hilos repiten POST /api/login sin pausa (tormenta).
+Cada inicio de sesión usa una de --cuentas cuentas registradas; una fracción
+--fallidos lleva una contraseña incorrecta (también pasa por bcrypt hasta que
+la cuenta queda bloqueada). Cada petición trae una IP distinta en
+X-Forwarded-For y el servidor corre con PROXY_X_FOR=1, como detrás del proxy
+de Render, así que la tormenta no la frena el límite por IP: simula muchos
+clientes a la vez, no uno solo.
+
+Por defecto usa el costo de bcrypt de producción (12): lo que se mide es
+cuánto le quita bcrypt al resto de la API. Reporta p50/p95/p99 del catálogo
+en cada fase y los códigos de respuesta del login (429: bloqueado por
+intentos, 503: pool de bcrypt saturado).
+
+Uso:
+    python benchmarks/tormenta_login.py --atacantes 32
+    python benchmarks/tormenta_login.py --worker-class gthread   # comparación
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from carga import ejecutar_carga, percentil
+from suite import CONTRASEÑA, CORREO_ADMIN, Sesion, detener_servidor, iniciar_servidor, puerto_libre
+
+
+def preparar(puerto, productos, cuentas):
+    """Administrador, productos (importación CSV) y cuentas para iniciar sesión; retorna los correos"""
+    admin = Sesion('127.0.0.1', puerto)
+    codigo, _, _ = admin.pedir('POST', '/api/register', {'correo': CORREO_ADMIN, 'contraseña': CONTRASEÑA})
+    if codigo != 201:
+        admin.pedir('POST', '/api/login', {'correo': CORREO_ADMIN, 'contraseña': CONTRASEÑA})
+    lineas = ['nombre,precio,stock'] + [f'Producto tormenta {i},{1 + i % 50}.50,1000' for i in range(productos)]
+    codigo, resultado, _ = admin.pedir('POST', '/api/productos/importar', cuerpo='\n'.join(lineas) + '\n',
+                                       tipo='text/csv')
+    if codigo != 200 or resultado['total_errores']:
+        raise RuntimeError(f'Falló la importación de productos: {resultado}')
+    admin.cerrar()
+
+    correos = []
+    for i in range(cuentas):
+        sesion = Sesion('127.0.0.1', puerto)
+        correo = f'tormenta{i}@bench.local'
+        codigo, _, _ = sesion.pedir('POST', '/api/register', {'correo': correo, 'contraseña': CONTRASEÑA})
+        if codigo != 201:
+            raise RuntimeError(f'No se pudo registrar la cuenta {correo} ({codigo})')
+        sesion.cerrar()
+        correos.append(correo)
+    return correos
+
+
+class Tormenta:
+    """Hilos que inician sesión sin pausa hasta detener(); cuentan códigos y latencias"""
+
+    def __init__(self, puerto, correos, atacantes, fallidos, semilla):
+        self.puerto, self.correos, self.fallidos = puerto, correos, fallidos
+        self.codigos = Counter()
+        self.latencias = []
+        self.lock = threading.Lock()
+        self.activa = threading.Event()
+        self.activa.set()
+        self.hilos = [threading.Thread(target=self._atacar, args=(f'{semilla}-{i}',), daemon=True)
+                      for i in range(atacantes)]
+        for hilo in self.hilos:
+            hilo.start()
+
+    def _atacar(self, semilla):
+        azar = random.Random(semilla)
+        conexion = http.client.HTTPConnection('127.0.0.1', self.puerto, timeout=60)
+        codigos, latencias = Counter(), []
+        while self.activa.is_set():
+            contraseña = 'incorrecta' if azar.random() < self.fallidos else CONTRASEÑA
+            cuerpo = json.dumps({'correo': azar.choice(self.correos), 'contraseña': contraseña})
+            ip = f'10.{azar.randint(0, 255)}.{azar.randint(0, 255)}.{azar.randint(1, 254)}'
+            inicio = time.perf_counter()
+            try:
+                # Sin cookies: cada petición es un cliente nuevo
+                conexion.request('POST', '/api/login', body=cuerpo,
+                                 headers={'Content-Type': 'application/json', 'X-Forwarded-For': ip})
+                respuesta = conexion.getresponse()
+                respuesta.read()
+                codigos[respuesta.status] += 1
+            except (OSError, http.client.HTTPException):
+                codigos[0] += 1
+                conexion.close()
+                conexion = http.client.HTTPConnection('127.0.0.1', self.puerto, timeout=60)
+                continue
+            latencias.append(time.perf_counter() - inicio)
+        conexion.close()
+        with self.lock:
+            self.codigos.update(codigos)
+            self.latencias.extend(latencias)
+
+    def detener(self, segundos):
+        self.activa.clear()
+        for hilo in self.hilos:
+            hilo.join()
+        self.latencias.sort()
+        return {
+            'peticiones_por_seg': round(sum(self.codigos.values()) / segundos, 1),
+            'p50_ms': round(percentil(self.latencias, 50) * 1000, 2),
+            'p99_ms': round(percentil(self.latencias, 99) * 1000, 2),
+            'codigos': {str(codigo): cantidad for codigo, cantidad in sorted(self.codigos.items())},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clientes', type=int, default=8, help='Clientes concurrentes del catálogo')
+    parser.add_argument('--atacantes', type=int, default=16, help='Hilos que inician sesión sin pausa')
+    parser.add_argument('--cuentas', type=int, default=20, help='Cuentas registradas para la tormenta')
+    parser.add_argument('--fallidos', type=float, default=0.5, help='Fracción de intentos con contraseña incorrecta')
+    parser.add_argument('--duracion', type=float, default=15, help='Segundos de cada fase')
+    parser.add_argument('--productos', type=int, default=500)
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--database-url', help='PostgreSQL local (por defecto SQLite en un directorio temporal)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--hilos', type=int, default=8, help='Hilos por worker (gthread)')
+    parser.add_argument('--worker-class', default='gevent', choices=('gevent', 'gthread', 'sync'))
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--resultado', help='Archivo JSON donde escribir el resultado')
+    args = parser.parse_args()
+
+    # El servidor confía en X-Forwarded-For como detrás del proxy de Render
+    os.environ['PROXY_X_FOR'] = '1'
+    directorio = tempfile.mkdtemp(prefix='supermercado-tormenta-')
+    puerto = puerto_libre()
+    servidor = iniciar_servidor(args, directorio, puerto)
+    url = f'http://127.0.0.1:{puerto}/api/productos?limite=20'
+    try:
+        correos = preparar(puerto, args.productos, args.cuentas)
+        ejecutar_carga(url, args.clientes, 2)  # calentamiento
+        base = ejecutar_carga(url, args.clientes, args.duracion)
+        tormenta = Tormenta(puerto, correos, args.atacantes, args.fallidos, args.semilla)
+        inicio = time.monotonic()
+        durante = ejecutar_carga(url, args.clientes, args.duracion)
+        login = tormenta.detener(time.monotonic() - inicio)
+    finally:
+        detener_servidor(servidor)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    print(f'{"catálogo":<10}{"pet/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errores":>9}')
+    for fase, datos in (('base', base), ('tormenta', durante)):
+        print(f'{fase:<10}{datos["peticiones_por_seg"]:>9}{datos["p50_ms"]:>9}{datos["p95_ms"]:>9}'
+              f'{datos["p99_ms"]:>9}{datos["errores"]:>9}')
+    codigos = ', '.join(f'{codigo}: {cantidad}' for codigo, cantidad in login['codigos'].items())
+    print(f'login: {login["peticiones_por_seg"]} pet/s, p50 {login["p50_ms"]} ms, p99 {login["p99_ms"]} ms '
+          f'(códigos {codigos})')
+
+    if args.resultado:
+        with open(args.resultado, 'w', encoding='utf-8') as archivo:
+            json.dump({'configuracion': {k: v for k, v in vars(args).items() if k not in ('resultado', 'database_url')},
+                       'motor': 'postgres' if args.database_url else 'sqlite',
+                       'catalogo': {'base': base, 'tormenta': durante}, 'login': login},
+                      archivo, ensure_ascii=False, indent=2)
+            archivo.write('\n')
+
+
+if __name__ == '__main__':
+    main()
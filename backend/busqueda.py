@@ -0,0 +1,169 @@
+"""Índice de búsqueda de texto completo para el catálogo.
+
+En SQLite se usa una tabla virtual FTS5 y en PostgreSQL una tabla con una
+columna tsvector e índice GIN. En ambos casos el texto se guarda normalizado
+(minúsculas y sin acentos) para que "lacteos" encuentre "Lácteos".
+
+En FTS5 el id del producto es el rowid de la tabla: actualizar o quitar un
+producto es una búsqueda por clave y no un recorrido de todo el índice.
+"""
+import re
+import unicodedata
+
+from peewee import JOIN, PostgresqlDatabase, fn
+from models import db, Producto, Categoria
+
+TABLA_BUSQUEDA = 'productos_busqueda'
+LOTE_INDICE = 1000  # Productos por sentencia al indexar en bloque (límite de parámetros de SQLite)
+
+
+def es_postgres():
+    return isinstance(db, PostgresqlDatabase)
+
+
+def normalizar_texto(texto):
+    """Pasar a minúsculas y quitar acentos (á -> a, ñ -> n)"""
+    if not texto:
+        return ''
+    descompuesto = unicodedata.normalize('NFKD', texto)
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return sin_acentos.lower()
+
+
+def terminos_busqueda(texto):
+    """Separar el texto de búsqueda en términos alfanuméricos normalizados"""
+    return re.findall(r'\w+', normalizar_texto(texto))
+
+
+def _documento(nombre_producto, nombre_categoria):
+    return normalizar_texto(f'{nombre_producto or ""} {nombre_categoria or ""}'.strip())
+
+
+def crear_indice_busqueda():
+    """Crear la tabla del índice si no existe (idempotente)"""
+    if es_postgres():
+        db.execute_sql(
+            f'CREATE TABLE IF NOT EXISTS {TABLA_BUSQUEDA} ('
+            'producto_id INTEGER PRIMARY KEY REFERENCES productos (id) ON DELETE CASCADE, '
+            'documento TSVECTOR NOT NULL)'
+        )
+        db.execute_sql(
+            f'CREATE INDEX IF NOT EXISTS {TABLA_BUSQUEDA}_documento '
+            f'ON {TABLA_BUSQUEDA} USING GIN (documento)'
+        )
+    else:
+        db.execute_sql(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_BUSQUEDA} USING fts5('
+            "documento, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def indice_con_columna_producto_id():
+    """True si la tabla FTS5 es la anterior, con el id en una columna producto_id en lugar del rowid"""
+    if es_postgres():
+        return False
+    columnas = [fila[1] for fila in db.execute_sql(f'PRAGMA table_info({TABLA_BUSQUEDA})').fetchall()]
+    return 'producto_id' in columnas
+
+
+def indice_vacio():
+    cursor = db.execute_sql(f'SELECT 1 FROM {TABLA_BUSQUEDA} LIMIT 1')
+    return cursor.fetchone() is None
+
+
+def indexar_producto(producto_id, nombre_producto, nombre_categoria):
+    """Agregar o actualizar un producto en el índice"""
+    p = db.param
+    documento = _documento(nombre_producto, nombre_categoria)
+    if es_postgres():
+        db.execute_sql(
+            f'INSERT INTO {TABLA_BUSQUEDA} (producto_id, documento) '
+            f"VALUES ({p}, to_tsvector('simple', {p})) "
+            "ON CONFLICT (producto_id) DO UPDATE SET documento = EXCLUDED.documento",
+            (producto_id, documento)
+        )
+    else:
+        # FTS5 no soporta UPSERT, pero sí reemplazar la fila con el mismo rowid
+        db.execute_sql(
+            f'INSERT OR REPLACE INTO {TABLA_BUSQUEDA} (rowid, documento) VALUES ({p}, {p})',
+            (producto_id, documento)
+        )
+
+
+def indexar_productos(condicion):
+    """Indexar los productos que cumplen condicion con sentencias de LOTE_INDICE filas (no una por producto)"""
+    filas = [(fila['id'], _documento(fila['nombre'], fila['categoria_nombre']))
+             for fila in (Producto
+                          .select(Producto.id, Producto.nombre, Categoria.nombre.alias('categoria_nombre'))
+                          .join(Categoria, JOIN.LEFT_OUTER)
+                          .where(condicion)
+                          .dicts())]
+    p = db.param
+    for inicio in range(0, len(filas), LOTE_INDICE):
+        lote = filas[inicio:inicio + LOTE_INDICE]
+        params = [valor for fila in lote for valor in fila]
+        if es_postgres():
+            valores = ', '.join([f"({p}, to_tsvector('simple', {p}))"] * len(lote))
+            db.execute_sql(
+                f'INSERT INTO {TABLA_BUSQUEDA} (producto_id, documento) VALUES {valores} '
+                'ON CONFLICT (producto_id) DO UPDATE SET documento = EXCLUDED.documento',
+                params
+            )
+        else:
+            db.execute_sql(
+                f'INSERT OR REPLACE INTO {TABLA_BUSQUEDA} (rowid, documento) '
+                f'VALUES {", ".join([f"({p}, {p})"] * len(lote))}',
+                params
+            )
+    return len(filas)
+
+
+def eliminar_de_indice(producto_id):
+    """Quitar un producto del índice"""
+    columna = 'producto_id' if es_postgres() else 'rowid'
+    db.execute_sql(f'DELETE FROM {TABLA_BUSQUEDA} WHERE {columna} = {db.param}', (producto_id,))
+
+
+def reindexar_categoria(categoria_id):
+    """Volver a indexar los productos de una categoría (p. ej. al renombrarla)"""
+    indexar_productos(Producto.categoria_id == categoria_id)
+
+
+def reconstruir_indice():
+    """Reconstruir el índice completo desde las tablas de productos y categorías"""
+    with db.atomic():
+        db.execute_sql(f'DELETE FROM {TABLA_BUSQUEDA}')
+        maximo = Producto.select(fn.MAX(Producto.id)).scalar() or 0
+        for inicio in range(0, maximo, LOTE_INDICE):
+            indexar_productos((Producto.id > inicio) & (Producto.id <= inicio + LOTE_INDICE))
+
+
+def buscar_ids(texto, limite=20):
+    """Retornar los ids de productos que coinciden, ordenados por relevancia.
+
+    Cada término se busca como prefijo ("azu" encuentra "azúcar") y todos los
+    términos deben coincidir.
+    """
+    terminos = terminos_busqueda(texto)
+    if not terminos:
+        return []
+    p = db.param
+    if es_postgres():
+        consulta = ' & '.join(f'{t}:*' for t in terminos)
+        cursor = db.execute_sql(
+            f"SELECT producto_id FROM {TABLA_BUSQUEDA}, to_tsquery('simple', {p}) AS consulta "
+            'WHERE documento @@ consulta '
+            'ORDER BY ts_rank(documento, consulta) DESC, producto_id '
+            f'LIMIT {p}',
+            (consulta, limite)
+        )
+    else:
+        consulta = ' '.join(f'"{t}"*' for t in terminos)
+        cursor = db.execute_sql(
+            f'SELECT rowid FROM {TABLA_BUSQUEDA} '
+            f'WHERE {TABLA_BUSQUEDA} MATCH {p} '
+            f'ORDER BY bm25({TABLA_BUSQUEDA}), rowid '
+            f'LIMIT {p}',
+            (consulta, limite)
+        )
+    return [fila[0] for fila in cursor.fetchall()]
@@ -0,0 +1,357 @@
+"""Cachés en memoria de cada worker.
+
+- CacheVersionada: bytes ya serializados (y sus versiones comprimidas) de las
+  respuestas del catálogo. La validez se controla con un contador de versión
+  guardado en la base de datos (tabla versiones_cache), así que cuando un
+  worker modifica productos o categorías e incrementa la versión, los demás
+  workers descartan su copia en la siguiente petición. La fecha del último
+  incremento se envía como Last-Modified. Una caché notificada (la de la
+  tasa BCV, que cambia pocas veces al día) no lee el contador en cada
+  petición: lo guarda en memoria hasta que llega un aviso de cambio por el
+  canal de eventos (eventos.py), enviado al confirmar la transacción.
+- CacheTTL: datos con expiración por tiempo. Con nombre (la de los usuarios
+  de la sesión), quien modifica una entrada publica su invalidación por el
+  canal de eventos en la misma transacción y todos los workers la descartan
+  al recibirla; el tiempo de expiración queda como respaldo para los avisos
+  perdidos y los cambios hechos fuera de la aplicación.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import make_response, request
+from werkzeug.http import is_resource_modified
+
+from compresion import comprimir, elegir_codificacion
+from eventos import central_eventos
+from models import VersionCache
+
+CACHE_CATALOGO_MAX_ENTRADAS = int(os.environ.get('CACHE_CATALOGO_MAX_ENTRADAS', 256))
+CACHE_USUARIOS_TTL = float(os.environ.get('CACHE_USUARIOS_TTL', 30))  # Segundos que un usuario cargado sigue vigente si se pierde un aviso
+CACHE_USUARIOS_MAX_ENTRADAS = int(os.environ.get('CACHE_USUARIOS_MAX_ENTRADAS', 1024))
+CACHE_NOTIFICADA_VIGENCIA = float(os.environ.get('CACHE_NOTIFICADA_VIGENCIA', 60))  # Segundos máximos sin releer la versión aunque no lleguen avisos
+CACHE_TASA_MAX_AGE = int(os.environ.get('CACHE_TASA_MAX_AGE', 300))  # Segundos que el navegador usa la tasa sin revalidar
+
+
+class CacheVersionada:
+    """Caché LRU de respuestas que se invalida cuando cambia un contador en la base de datos.
+
+    notificada: guardar la versión en memoria hasta recibir un aviso de cambio.
+    depende_de: otras cachés cuya versión también invalida las respuestas.
+    max_age: segundos que el cliente puede usar la respuesta sin revalidarla.
+    """
+
+    def __init__(self, nombre, max_entradas=CACHE_CATALOGO_MAX_ENTRADAS, notificada=False, depende_de=(), max_age=0):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.notificada = notificada
+        self.depende_de = tuple(depende_de)
+        self.max_age = max_age
+        self._entradas = OrderedDict()  # clave -> (version, cuerpo, etag, mimetype, modificado, comprimidos)
+        self._valores = {}  # clave -> (version, valor) de valor()
+        self._estado = None  # (versión, fecha) en memoria de una caché notificada
+        self._estado_leido = 0.0
+        self._generacion = 0  # Aumenta con cada aviso: descarta lecturas que empezaron antes
+        self._lock = threading.Lock()
+        self._estadisticas = {
+            'aciertos': 0,
+            'fallos': 0,
+            'invalidaciones': 0,
+            'no_modificados': 0,
+            'versiones_incrementadas': 0,
+            'compresiones': 0,
+            'lecturas_version': 0,
+        }
+        if notificada:
+            central_eventos.agregar_oyente(self._recibir_aviso)
+
+    def _contar(self, clave, cantidad=1):
+        with self._lock:
+            self._estadisticas[clave] += cantidad
+
+    def _recibir_aviso(self, evento):
+        # None: el canal se (re)conectó y pudo perderse algún aviso
+        if evento is None or (evento.get('tipo') == 'cache' and evento.get('nombre') == self.nombre):
+            self._descartar_estado()
+
+    def _descartar_estado(self):
+        with self._lock:
+            self._estado = None
+            self._generacion += 1
+
+    def _leer_estado(self):
+        fila = VersionCache.get_or_none(VersionCache.nombre == self.nombre)
+        self._contar('lecturas_version')
+        if fila is None:
+            return 0, None
+        modificado = fila.fecha_modificacion
+        return fila.version, modificado.replace(tzinfo=timezone.utc) if modificado else None
+
+    def estado_actual(self):
+        """(versión, fecha de modificación UTC o None): de memoria si la caché es notificada y
+        no hubo avisos; si no, desde la base de datos (una consulta por clave primaria)"""
+        if self.notificada:
+            central_eventos.iniciar()
+            with self._lock:
+                if (self._estado is not None and central_eventos.escuchando.is_set()
+                        and time.monotonic() - self._estado_leido < CACHE_NOTIFICADA_VIGENCIA):
+                    return self._estado
+                generacion = self._generacion
+
+        estado = self._leer_estado()
+        if self.notificada:
+            with self._lock:
+                if generacion == self._generacion:
+                    self._estado = estado
+                    self._estado_leido = time.monotonic()
+        return estado
+
+    def version_actual(self):
+        return self.estado_actual()[0]
+
+    def incrementar_version(self):
+        """Invalidar la caché en todos los workers y retornar la nueva versión.
+
+        Llamar dentro de la transacción de escritura: la fila queda bloqueada
+        hasta el commit, así que las escrituras concurrentes obtienen versiones
+        en el mismo orden en que se confirman. Como el bloqueo serializa a
+        todas las escrituras, conviene que sea la última de la transacción. En
+        una caché notificada el aviso a los workers se publica en la misma
+        transacción.
+        """
+        ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+        filas = (VersionCache
+                 .update(version=VersionCache.version + 1, fecha_modificacion=ahora)
+                 .where(VersionCache.nombre == self.nombre)
+                 .execute())
+        if not filas:
+            (VersionCache
+             .insert(nombre=self.nombre, version=1, fecha_modificacion=ahora)
+             .on_conflict_ignore()
+             .execute())
+        self._contar('versiones_incrementadas')
+        # Leída de la base de datos y no guardada en memoria: aún no está confirmada
+        version = self._leer_estado()[0]
+        if self.notificada:
+            self._descartar_estado()
+            central_eventos.publicar({'tipo': 'cache', 'nombre': self.nombre, 'version': version})
+        return version
+
+    def valor(self, clave, cargar):
+        """Valor de cargar() para la versión actual; solo se vuelve a calcular cuando la versión cambia"""
+        version = self.version_actual()
+        with self._lock:
+            entrada = self._valores.get(clave)
+        if entrada is not None and entrada[0] == version:
+            return entrada[1]
+        valor = cargar()
+        with self._lock:
+            self._valores[clave] = (version, valor)
+        return valor
+
+    def obtener(self, clave, version):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self._estadisticas['fallos'] += 1
+                return None
+            if entrada[0] != version:
+                del self._entradas[clave]
+                self._estadisticas['invalidaciones'] += 1
+                self._estadisticas['fallos'] += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._estadisticas['aciertos'] += 1
+            return entrada
+
+    def guardar(self, clave, version, cuerpo, mimetype, modificado=None):
+        etag = hashlib.sha1(cuerpo).hexdigest()
+        entrada = (version, cuerpo, etag, mimetype, modificado, {})
+        with self._lock:
+            self._entradas[clave] = entrada
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return entrada
+
+    def comprimido(self, entrada, codificacion):
+        """Cuerpo de la entrada comprimido con codificacion (se comprime una sola vez por versión)"""
+        comprimidos = entrada[5]
+        cuerpo = comprimidos.get(codificacion)
+        if cuerpo is None:
+            cuerpo = comprimir(entrada[1], codificacion)
+            with self._lock:
+                comprimidos[codificacion] = cuerpo
+                self._estadisticas['compresiones'] += 1
+        return cuerpo
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self._estadisticas)
+            datos['entradas'] = len(self._entradas)
+        consultas = datos['aciertos'] + datos['fallos']
+        datos['tasa_aciertos'] = round(datos['aciertos'] / consultas, 4) if consultas else 0.0
+        return datos
+
+    def cachear(self, vista=None, excepto=None):
+        """Decorador para vistas GET: sirve los bytes en caché (comprimidos si el cliente
+        lo acepta) con ETag y Last-Modified, y responde 304 si no cambió.
+
+        excepto: función sin argumentos; si retorna True la petición no usa la caché.
+        """
+        if vista is None:
+            return lambda vista: self.cachear(vista, excepto)
+
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            if excepto is not None and excepto():
+                return vista(*args, **kwargs)
+            clave = request.full_path
+            version, modificado = self.estado_actual()
+            for otra in self.depende_de:
+                otra_version, otra_modificado = otra.estado_actual()
+                version = (version, otra_version)
+                if otra_modificado and (modificado is None or otra_modificado > modificado):
+                    modificado = otra_modificado
+            entrada = self.obtener(clave, version)
+            if entrada is None:
+                respuesta = make_response(vista(*args, **kwargs))
+                # Solo se guardan respuestas exitosas y completas (no las enviadas en stream)
+                if respuesta.status_code != 200 or respuesta.is_streamed:
+                    return respuesta
+                entrada = self.guardar(clave, version, respuesta.get_data(), respuesta.mimetype, modificado)
+            _, cuerpo, etag, mimetype, modificado, _ = entrada
+
+            # Cada codificación es una representación distinta con su propio ETag
+            codificacion = elegir_codificacion(len(cuerpo), mimetype)
+            if codificacion:
+                etag = f'{etag}-{codificacion}'
+
+            respuesta = make_response(b'')
+            respuesta.mimetype = mimetype
+            respuesta.set_etag(etag)
+            if modificado:
+                respuesta.last_modified = modificado
+            if self.max_age:
+                respuesta.headers['Cache-Control'] = f'public, max-age={self.max_age}'
+            else:
+                # El cliente puede guardar la respuesta pero debe revalidarla con If-None-Match/If-Modified-Since
+                respuesta.headers['Cache-Control'] = 'no-cache'
+            respuesta.vary.add('Accept-Encoding')
+            if not is_resource_modified(request.environ, etag=etag, last_modified=modificado):
+                self._contar('no_modificados')
+                respuesta.status_code = 304
+                return respuesta
+
+            if codificacion:
+                respuesta.set_data(self.comprimido(entrada, codificacion))
+                respuesta.headers['Content-Encoding'] = codificacion
+            else:
+                respuesta.set_data(cuerpo)
+            return respuesta
+        return envoltura
+
+
+class CacheTTL:
+    """Caché LRU con expiración por tiempo.
+
+    nombre: recibir las invalidaciones de los demás workers por el canal de
+    eventos (ver invalidar); sin nombre, cada worker solo ve las propias.
+    """
+
+    def __init__(self, ttl, max_entradas, nombre=None):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.nombre = nombre
+        self._entradas = OrderedDict()  # clave -> (expira, valor)
+        self._generacion = 0  # Aumenta con cada aviso: descarta valores leídos antes
+        self._lock = threading.Lock()
+        self._estadisticas = {
+            'aciertos': 0,
+            'fallos': 0,
+            'expirados': 0,
+            'invalidaciones': 0,
+        }
+        if nombre:
+            central_eventos.agregar_oyente(self._recibir_aviso)
+
+    def _recibir_aviso(self, evento):
+        # None: el canal se (re)conectó y pudo perderse algún aviso
+        if evento is None:
+            with self._lock:
+                self._entradas.clear()
+                self._generacion += 1
+        elif evento.get('tipo') == 'cache' and evento.get('nombre') == self.nombre:
+            self._descartar(evento.get('clave'))
+
+    def _descartar(self, clave):
+        with self._lock:
+            self._generacion += 1
+            if self._entradas.pop(clave, None) is not None:
+                self._estadisticas['invalidaciones'] += 1
+
+    def generacion(self):
+        """Marca a pasar a guardar(): el valor no se guarda si llegó un aviso mientras se leía"""
+        if self.nombre:
+            central_eventos.iniciar()
+        with self._lock:
+            return self._generacion
+
+    def obtener(self, clave):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self._estadisticas['fallos'] += 1
+                return None
+            if entrada[0] <= ahora:
+                del self._entradas[clave]
+                self._estadisticas['expirados'] += 1
+                self._estadisticas['fallos'] += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._estadisticas['aciertos'] += 1
+            return entrada[1]
+
+    def guardar(self, clave, valor, generacion=None):
+        with self._lock:
+            if generacion is not None and generacion != self._generacion:
+                return
+            self._entradas[clave] = (time.monotonic() + self.ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, clave):
+        """Descartar la entrada; con nombre, también en los demás workers (llamar
+        dentro de la transacción de escritura: el aviso sale al confirmarla)"""
+        self._descartar(clave)
+        if self.nombre:
+            central_eventos.publicar({'tipo': 'cache', 'nombre': self.nombre, 'clave': clave})
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self._estadisticas)
+            datos['entradas'] = len(self._entradas)
+        consultas = datos['aciertos'] + datos['fallos']
+        datos['tasa_aciertos'] = round(datos['aciertos'] / consultas, 4) if consultas else 0.0
+        return datos
+
+
+cache_tasa = CacheVersionada('tasa', notificada=True, max_age=CACHE_TASA_MAX_AGE)
+# Las respuestas del catálogo pueden incluir precios en bolívares (bs=1)
+cache_catalogo = CacheVersionada('catalogo', depende_de=(cache_tasa,))
+# Datos de los usuarios con sesión activa (Flask-Login user_loader), por id
+cache_usuarios = CacheTTL(CACHE_USUARIOS_TTL, CACHE_USUARIOS_MAX_ENTRADAS, nombre='usuarios')
@@ -0,0 +1,52 @@
+"""Versiones de cambio del catálogo para la sincronización incremental.
+
+Cada escritura de productos o categorías incrementa el contador 'catalogo'
+de versiones_cache (el mismo que invalida la caché del catálogo) y marca las
+filas que modificó con esa versión en version_cambio. El stock que descuentan
+las compras no cuenta: cambia con cada pedido y se consulta aparte, sin
+caché, en /api/productos/stock. Las eliminaciones
+dejan una lápida en catalogo_eliminados. Un cliente que ya tiene el catálogo
+hasta la versión N pide GET /api/productos/cambios?desde=N y recibe solo lo
+que cambió después.
+"""
+from datetime import datetime
+
+from cache import cache_catalogo
+from models import Producto, CatalogoEliminado
+
+
+def nueva_version_catalogo():
+    """Versión para las filas de la escritura en curso (llamar dentro de su transacción)"""
+    return cache_catalogo.incrementar_version()
+
+
+def marcar_productos(version, condicion):
+    """Marcar con version los productos que cumplen condicion (p. ej. los de una categoría)"""
+    return (Producto
+            .update(version_cambio=version, fecha_actualizacion=datetime.now())
+            .where(condicion)
+            .execute())
+
+
+def registrar_eliminacion(version, tipo, registro_id):
+    CatalogoEliminado.create(tipo=tipo, registro_id=registro_id, version_cambio=version, fecha=datetime.now())
+
+
+def en_rango(campo, desde, hasta):
+    """Condición version_cambio en (desde, hasta]; con desde=0 incluye las filas
+    sin versión (creadas antes de la migración o por init_db)"""
+    if desde <= 0:
+        return campo <= hasta
+    return (campo > desde) & (campo <= hasta)
+
+
+def eliminados_desde(desde, hasta):
+    """Ids de productos y categorías eliminados con versión en (desde, hasta]"""
+    eliminados = {'productos': [], 'categorias': []}
+    lapidas = (CatalogoEliminado
+               .select(CatalogoEliminado.tipo, CatalogoEliminado.registro_id)
+               .where(en_rango(CatalogoEliminado.version_cambio, desde, hasta))
+               .order_by(CatalogoEliminado.id))
+    for lapida in lapidas:
+        eliminados['productos' if lapida.tipo == 'producto' else 'categorias'].append(lapida.registro_id)
+    return eliminados
@@ -0,0 +1,96 @@
+"""Compresión gzip/brotli negociada con Accept-Encoding.
+
+Se comprimen las respuestas de texto (JSON, HTML, CSS, JS) de al menos
+COMPRESION_MINIMO bytes. brotli se usa solo si el paquete está instalado y
+el cliente lo acepta; si no, gzip. Las respuestas en stream se comprimen con
+gzip a medida que se envían. COMPRESION=0 desactiva todo.
+"""
+import gzip
+import os
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+COMPRESION = os.environ.get('COMPRESION', '1') != '0'
+COMPRESION_MINIMO = int(os.environ.get('COMPRESION_MINIMO', 1024))  # Bytes; por debajo no compensa
+COMPRESION_NIVEL_GZIP = int(os.environ.get('COMPRESION_NIVEL_GZIP', 6))  # 1-9
+COMPRESION_NIVEL_BROTLI = int(os.environ.get('COMPRESION_NIVEL_BROTLI', 5))  # 0-11
+
+TIPOS_COMPRIMIBLES = ('application/json', 'application/x-ndjson', 'application/javascript', 'text/')
+
+
+def codificaciones_disponibles():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def comprimible(mimetype):
+    # Los eventos SSE deben llegar al cliente en cuanto se generan, sin búfer del compresor
+    return bool(mimetype) and mimetype.startswith(TIPOS_COMPRIMIBLES) and mimetype != 'text/event-stream'
+
+
+def elegir_codificacion(tamano=None, mimetype='application/json'):
+    """Codificación a usar para la petición actual, o None si no conviene comprimir"""
+    if not COMPRESION or not comprimible(mimetype):
+        return None
+    if tamano is not None and tamano < COMPRESION_MINIMO:
+        return None
+    aceptadas = request.accept_encodings
+    for codificacion in codificaciones_disponibles():
+        if aceptadas[codificacion]:
+            return codificacion
+    return None
+
+
+def comprimir(cuerpo, codificacion, nivel=None):
+    """Comprimir bytes con 'gzip' o 'br' (nivel None usa el configurado)"""
+    if codificacion == 'br':
+        return brotli.compress(cuerpo, quality=COMPRESION_NIVEL_BROTLI if nivel is None else nivel)
+    # mtime=0 para que el mismo cuerpo produzca siempre los mismos bytes
+    return gzip.compress(cuerpo, compresslevel=COMPRESION_NIVEL_GZIP if nivel is None else nivel, mtime=0)
+
+
+def _gzip_en_stream(fragmentos):
+    compresor = zlib.compressobj(COMPRESION_NIVEL_GZIP, zlib.DEFLATED, 31)  # 31: formato gzip
+    for fragmento in fragmentos:
+        if isinstance(fragmento, str):
+            fragmento = fragmento.encode('utf-8')
+        datos = compresor.compress(fragmento)
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+
+def comprimir_respuesta(respuesta):
+    """after_request: comprimir la respuesta si el cliente lo acepta y vale la pena"""
+    if (respuesta.status_code != 200 or respuesta.direct_passthrough
+            or 'Content-Encoding' in respuesta.headers or not comprimible(respuesta.mimetype)):
+        return respuesta
+    respuesta.vary.add('Accept-Encoding')
+
+    if respuesta.is_streamed:
+        if not COMPRESION or not request.accept_encodings['gzip']:
+            return respuesta
+        respuesta.response = _gzip_en_stream(respuesta.response)
+        respuesta.headers['Content-Encoding'] = 'gzip'
+        return respuesta
+
+    cuerpo = respuesta.get_data()
+    codificacion = elegir_codificacion(len(cuerpo), respuesta.mimetype)
+    if codificacion is None:
+        return respuesta
+    respuesta.set_data(comprimir(cuerpo, codificacion))
+    respuesta.headers['Content-Encoding'] = codificacion
+    # La representación comprimida es distinta: su ETag también debe serlo
+    etag, debil = respuesta.get_etag()
+    if etag:
+        respuesta.set_etag(f'{etag}-{codificacion}', weak=debil)
+    return respuesta
+
+
+def configurar_compresion(app):
+    app.after_request(comprimir_respuesta)
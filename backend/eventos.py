@@ -0,0 +1,220 @@
+"""Cambios de estado de pedidos en tiempo real (Server-Sent Events).
+
+crear_pedido, confirmar_pago y actualizar_estado_pedido publican un evento
+dentro de su transacción, así que solo se entrega si se confirma. El mismo
+canal lleva los avisos de cambio de las cachés notificadas (tipo 'cache',
+ver cache.py). Los eventos llegan a todos los workers a través de la base
+de datos:
+
+- PostgreSQL: NOTIFY en el canal 'pedidos'.
+- SQLite: tabla eventos_pedidos, que cada worker consulta cada
+  EVENTOS_INTERVALO segundos y purga pasados EVENTOS_RETENCION segundos.
+
+En cada worker un hilo recibe los eventos y los reparte a las conexiones SSE
+abiertas (una cola por conexión): cada usuario recibe los de sus pedidos y
+los administradores, todos. Cada conexión queda abierta mientras la página
+está visible, así que el servidor usa workers gevent por defecto (un greenlet
+por conexión); con gthread cada una ocuparía uno de los hilos del worker.
+"""
+import json
+import os
+import queue
+import select
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import Response
+from peewee import PostgresqlDatabase, fn
+
+from busqueda import es_postgres
+from models import db, EventoPedido
+
+CANAL_PEDIDOS = 'pedidos'
+EVENTOS_INTERVALO = float(os.environ.get('EVENTOS_INTERVALO', 0.5))  # Segundos entre consultas (SQLite)
+EVENTOS_RETENCION = int(os.environ.get('EVENTOS_RETENCION', 300))  # Segundos que se guardan los eventos (SQLite)
+EVENTOS_LATIDO = float(os.environ.get('EVENTOS_LATIDO', 15))  # Segundos entre comentarios para mantener viva la conexión
+EVENTOS_MAX_EN_COLA = int(os.environ.get('EVENTOS_MAX_EN_COLA', 100))  # Eventos sin enviar antes de cerrar una conexión lenta
+EVENTOS_REINTENTO_MS = 3000  # Espera del navegador antes de reconectar
+
+
+class Suscripcion:
+    """Una conexión SSE: recibe los eventos de usuario_id, o todos si es admin"""
+
+    def __init__(self, usuario_id, admin=False):
+        self.usuario_id = usuario_id
+        self.admin = admin
+        self.cola = queue.Queue(maxsize=EVENTOS_MAX_EN_COLA)
+        self.desbordada = False
+
+
+class CentralEventos:
+    """Suscripciones SSE del proceso y el hilo que recibe los eventos de los demás workers"""
+
+    def __init__(self):
+        self._oyentes = []
+        self._reiniciar()
+        # Los hilos no sobreviven a un fork: cada worker inicia el suyo
+        os.register_at_fork(after_in_child=self._reiniciar)
+
+    def _reiniciar(self):
+        self._suscripciones = set()
+        self._lock = threading.Lock()
+        self._hilo = None
+        # Activo mientras el hilo recibe eventos: antes, o tras perder la conexión, pueden faltar algunos
+        self.escuchando = threading.Event()
+
+    def agregar_oyente(self, funcion):
+        """Llamar funcion(evento) con cada evento recibido, y funcion(None) cuando pudo perderse alguno"""
+        self._oyentes.append(funcion)
+
+    def iniciar(self):
+        """Iniciar el hilo que recibe los eventos de los demás workers (idempotente)"""
+        with self._lock:
+            if self._hilo is None:
+                destino = self._escuchar_postgres if es_postgres() else self._consultar_tabla
+                self._hilo = threading.Thread(target=destino, name='eventos', daemon=True)
+                self._hilo.start()
+
+    def suscribir(self, usuario_id, admin=False):
+        suscripcion = Suscripcion(usuario_id, admin)
+        with self._lock:
+            self._suscripciones.add(suscripcion)
+        self.iniciar()
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def conexiones(self):
+        with self._lock:
+            return len(self._suscripciones)
+
+    def _avisar_oyentes(self, evento):
+        for oyente in self._oyentes:
+            try:
+                oyente(evento)
+            except Exception as e:
+                print(f'Error en un oyente de eventos: {e}')
+
+    def repartir(self, evento):
+        """Entregar un evento a los oyentes y a las suscripciones locales interesadas"""
+        self._avisar_oyentes(evento)
+        if 'pedido_id' not in evento:
+            return
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+        for suscripcion in suscripciones:
+            if not (suscripcion.admin or suscripcion.usuario_id == evento.get('usuario_id')):
+                continue
+            try:
+                suscripcion.cola.put_nowait(evento)
+            except queue.Full:
+                # El cliente no está leyendo: se cierra y al reconectar vuelve a cargar los pedidos
+                suscripcion.desbordada = True
+                self.cancelar(suscripcion)
+
+    def publicar(self, evento):
+        """Enviar el evento a todos los workers (llamar dentro de la transacción de escritura)"""
+        datos = json.dumps(evento)
+        if es_postgres():
+            db.execute_sql('SELECT pg_notify(%s, %s)', (CANAL_PEDIDOS, datos))
+        else:
+            EventoPedido.insert(datos=datos, fecha=datetime.now()).execute()
+
+    def _escuchar_postgres(self):
+        while True:
+            conexion = None
+            try:
+                # Conexión propia fuera del pool: queda ocupada esperando notificaciones
+                conexion = PostgresqlDatabase._connect(db)
+                conexion.autocommit = True
+                cursor = conexion.cursor()
+                cursor.execute(f'LISTEN {CANAL_PEDIDOS}')
+                self.escuchando.set()
+                self._avisar_oyentes(None)
+                while True:
+                    if select.select([conexion], [], [], EVENTOS_LATIDO) == ([], [], []):
+                        continue
+                    conexion.poll()
+                    while conexion.notifies:
+                        notificacion = conexion.notifies.pop(0)
+                        self.repartir(json.loads(notificacion.payload))
+            except Exception as e:
+                self.escuchando.clear()
+                print(f'Error escuchando eventos de pedidos: {e}')
+                time.sleep(EVENTOS_INTERVALO * 10)
+            finally:
+                if conexion is not None:
+                    try:
+                        conexion.close()
+                    except Exception:
+                        pass
+
+    def _consultar_tabla(self):
+        ultimo_id = None
+        ultima_purga = 0
+        while True:
+            try:
+                with db.connection_context():
+                    if ultimo_id is None:
+                        ultimo_id = EventoPedido.select(fn.MAX(EventoPedido.id)).scalar() or 0
+                        self.escuchando.set()
+                        self._avisar_oyentes(None)
+                    for evento in (EventoPedido
+                                   .select()
+                                   .where(EventoPedido.id > ultimo_id)
+                                   .order_by(EventoPedido.id)):
+                        ultimo_id = evento.id
+                        self.repartir(dict(json.loads(evento.datos), id=evento.id))
+                    if time.monotonic() - ultima_purga > EVENTOS_RETENCION:
+                        limite = datetime.now() - timedelta(seconds=EVENTOS_RETENCION)
+                        EventoPedido.delete().where(EventoPedido.fecha < limite).execute()
+                        ultima_purga = time.monotonic()
+            except Exception as e:
+                print(f'Error consultando eventos de pedidos: {e}')
+            time.sleep(EVENTOS_INTERVALO)
+
+
+central_eventos = CentralEventos()
+
+
+def publicar_evento_pedido(pedido, tipo):
+    """Publicar el estado actual de un pedido ('creado' o 'actualizado')"""
+    central_eventos.publicar({
+        'tipo': tipo,
+        'pedido_id': pedido.id,
+        'usuario_id': pedido.usuario_id_id,
+        'estado': pedido.estado,
+        'motivo_rechazo': pedido.motivo_rechazo,
+        'fecha': datetime.now().isoformat(),
+    })
+
+
+def respuesta_sse(usuario_id, admin=False):
+    """Respuesta text/event-stream con los eventos de pedidos del usuario (o todos si es admin).
+
+    No usa stream_with_context: el contexto de la petición, y con él la
+    conexión a la base de datos, se libera antes de empezar a enviar.
+    """
+    suscripcion = central_eventos.suscribir(usuario_id, admin)
+
+    def generar():
+        try:
+            yield f'retry: {EVENTOS_REINTENTO_MS}\n\n'
+            while not suscripcion.desbordada:
+                try:
+                    evento = suscripcion.cola.get(timeout=EVENTOS_LATIDO)
+                except queue.Empty:
+                    yield ': latido\n\n'
+                    continue
+                identificador = f'id: {evento["id"]}\n' if 'id' in evento else ''
+                yield f'{identificador}event: pedido\ndata: {json.dumps(evento)}\n\n'
+        finally:
+            central_eventos.cancelar(suscripcion)
+
+    return Response(generar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Evita que un proxy nginx acumule los eventos
+    })
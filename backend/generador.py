@@ -0,0 +1,262 @@
+"""Generador de datos sintéticos para pruebas de escala.
+
+Llena usuarios, categorías, productos y pedidos (con sus líneas) en volumen
+configurable, con la distribución de un supermercado real: pocos productos
+concentran la mayoría de las ventas y pocos clientes hacen la mayoría de los
+pedidos (ley de Zipf con exponente --sesgo), los pedidos se reparten en el
+tiempo y los más antiguos ya están entregados. productos_json tiene el mismo
+formato que escribe crear_pedido.
+
+Todo sale de un random.Random(semilla), así que la misma semilla sobre la
+misma base produce los mismos datos (salvo el salt del hash de la contraseña,
+que es uno solo para todos los usuarios). Las filas se escriben con INSERT
+de muchas filas por sentencia y muchas sentencias por transacción, con ids
+asignados aquí para enlazar las líneas sin releerlos.
+Al terminar se reconstruyen el índice de búsqueda y los resúmenes de los
+reportes, se toma una versión nueva del catálogo para invalidar las cachés
+y se ejecuta ANALYZE.
+"""
+import json
+import math
+import random
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from peewee import fn
+
+from busqueda import es_postgres, reconstruir_indice
+from cambios import nueva_version_catalogo
+from models import db, Usuario, Categoria, Producto, Pedido, PedidoItem
+from reportes import reconstruir_resumenes
+from seguridad import hashear_contraseña
+
+LIMITE_PARAMETROS = 30000  # Parámetros por sentencia (SQLite admite 32766, PostgreSQL 65535)
+GENERADOR_TRANSACCION = 50000  # Filas principales por transacción
+CONTRASEÑA_GENERADA = 'generado123'
+
+SECCIONES = ('Lácteos', 'Panadería', 'Limpieza', 'Granos y Pastas', 'Frutas y Verduras', 'Carnes', 'Bebidas',
+             'Snacks', 'Congelados', 'Higiene Personal', 'Charcutería', 'Enlatados', 'Mascotas', 'Bebés',
+             'Licores', 'Desayuno', 'Condimentos', 'Dulces', 'Hogar', 'Pescadería')
+ARTICULOS = ('Arroz', 'Leche', 'Café', 'Harina', 'Aceite', 'Jabón', 'Pasta', 'Azúcar', 'Queso', 'Galletas',
+             'Jugo', 'Atún', 'Detergente', 'Yogur', 'Pan', 'Huevos', 'Mantequilla', 'Salsa', 'Cereal', 'Agua')
+MARCAS = ('Del Valle', 'La Granja', 'Doña Rosa', 'El Sol', 'Andino', 'Caribe', 'Premium', 'Económico',
+          'Natural', 'Tropical')
+PRESENTACIONES = ('250g', '500g', '1kg', '2kg', '500ml', '1L', '1.5L', '2L', 'x6', 'x12')
+NOMBRES = ('María', 'José', 'Ana', 'Luis', 'Carmen', 'Carlos', 'Rosa', 'Jesús', 'Luisa', 'Pedro', 'Elena',
+           'Miguel', 'Isabel', 'Juan', 'Gabriela', 'Andrés', 'Daniela', 'Rafael', 'Valentina', 'Diego')
+APELLIDOS = ('González', 'Rodríguez', 'Pérez', 'Hernández', 'García', 'Martínez', 'López', 'Díaz', 'Sánchez',
+             'Ramírez', 'Torres', 'Rojas', 'Flores', 'Morales', 'Castillo', 'Medina', 'Vargas', 'Romero')
+ZONAS = ('Chacao', 'Altamira', 'Los Palos Grandes', 'El Paraíso', 'La Candelaria', 'Sabana Grande',
+         'El Cafetal', 'Los Dos Caminos', 'La Trinidad', 'Catia', 'Petare', 'El Hatillo')
+
+
+class DistribucionZipf:
+    """Elegir elementos con probabilidad proporcional a 1 / rango^sesgo.
+
+    Los rangos se asignan a los elementos en un orden barajado con la misma
+    semilla, para que los más vendidos no sean siempre los de id más bajo.
+    """
+
+    def __init__(self, elementos, sesgo, azar):
+        self.elementos = list(elementos)
+        azar.shuffle(self.elementos)
+        self.acumulado = list(accumulate(1 / (rango ** sesgo) for rango in range(1, len(self.elementos) + 1)))
+        self.azar = azar
+
+    def elegir(self):
+        posicion = bisect_left(self.acumulado, self.azar.random() * self.acumulado[-1])
+        return self.elementos[min(posicion, len(self.elementos) - 1)]
+
+
+def _escribir(modelo, campos, filas):
+    """INSERT de filas (tuplas en el orden de campos) con tantas filas por sentencia como permita el límite.
+
+    El SQL se arma a mano una vez por tamaño de lote: generarlo con
+    insert_many valor por valor costaba más que escribir las filas.
+    """
+    por_sentencia = max(1, LIMITE_PARAMETROS // len(campos))
+    columnas = ', '.join(f'"{campo.column_name}"' for campo in campos)
+    fila = f'({", ".join([db.param] * len(campos))})'
+    sentencias = {}
+    for inicio in range(0, len(filas), por_sentencia):
+        lote = filas[inicio:inicio + por_sentencia]
+        if len(lote) not in sentencias:
+            sentencias[len(lote)] = (f'INSERT INTO "{modelo._meta.table_name}" ({columnas}) '
+                                     f'VALUES {", ".join([fila] * len(lote))}')
+        db.execute_sql(sentencias[len(lote)], [valor for valores in lote for valor in valores])
+
+
+def _siguiente_id(modelo):
+    return (modelo.select(fn.MAX(modelo.id)).scalar() or 0) + 1
+
+
+def _ajustar_secuencias(modelos):
+    """En PostgreSQL, mover las secuencias de id después de los ids asignados aquí"""
+    if not es_postgres():
+        return
+    for modelo in modelos:
+        tabla = modelo._meta.table_name
+        db.execute_sql(f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), "
+                       f'(SELECT COALESCE(MAX(id), 1) FROM {tabla}))')
+
+
+def generar_categorias(cantidad, fecha):
+    """Crear hasta cantidad categorías nuevas; retorna los ids de todas las categorías"""
+    nombres = []
+    for i in range(cantidad):
+        seccion = SECCIONES[i % len(SECCIONES)]
+        nombres.append(seccion if i < len(SECCIONES) else f'{seccion} {i // len(SECCIONES) + 1}')
+    with db.atomic():
+        Categoria.insert_many([{'nombre': nombre, 'fecha_actualizacion': fecha} for nombre in nombres]
+                              ).on_conflict_ignore().execute()
+    return [c.id for c in Categoria.select(Categoria.id).order_by(Categoria.id)]
+
+
+def generar_usuarios(cantidad, azar):
+    """Crear cantidad usuarios clientes (todos con CONTRASEÑA_GENERADA); retorna sus ids"""
+    contraseña_hash = hashear_contraseña(CONTRASEÑA_GENERADA)
+    primero = _siguiente_id(Usuario)
+    campos = [Usuario.id, Usuario.correo, Usuario.contraseña_hash, Usuario.is_admin,
+              Usuario.nombre_usuario, Usuario.direccion_principal]
+    for inicio in range(0, cantidad, GENERADOR_TRANSACCION):
+        filas = []
+        for i in range(inicio, min(cantidad, inicio + GENERADOR_TRANSACCION)):
+            nombre = f'{azar.choice(NOMBRES)} {azar.choice(APELLIDOS)}'
+            direccion = f'{azar.choice(ZONAS)}, calle {azar.randint(1, 40)}, casa {azar.randint(1, 200)}'
+            filas.append((primero + i, f'cliente{primero + i}@generado.local', contraseña_hash, False,
+                          nombre, direccion))
+        with db.atomic():
+            _escribir(Usuario, campos, filas)
+    return list(range(primero, primero + cantidad))
+
+
+def generar_productos(cantidad, categorias, sesgo, fecha, azar):
+    """Crear cantidad productos; retorna {id: (nombre, precio, categoria_id)} de los creados"""
+    primero = _siguiente_id(Producto)
+    por_categoria = DistribucionZipf(categorias, sesgo, azar)
+    campos = [Producto.id, Producto.nombre, Producto.precio, Producto.stock, Producto.imagen_url,
+              Producto.categoria_id, Producto.fecha_actualizacion, Producto.version_cambio]
+    creados = {}
+    for inicio in range(0, cantidad, GENERADOR_TRANSACCION):
+        filas = []
+        for i in range(inicio, min(cantidad, inicio + GENERADOR_TRANSACCION)):
+            producto_id = primero + i
+            nombre = (f'{azar.choice(ARTICULOS)} {azar.choice(MARCAS)} '
+                      f'{azar.choice(PRESENTACIONES)} #{producto_id}')[:Producto.nombre.max_length]
+            # Precios con distribución log-normal: muchos baratos y pocos caros
+            precio = round(min(250.0, math.exp(azar.gauss(1.0, 0.8))), 2)
+            categoria_id = por_categoria.elegir()
+            filas.append((producto_id, nombre, precio, azar.randint(0, 500), None, categoria_id, fecha, 0))
+            creados[producto_id] = (nombre, precio, categoria_id)
+        with db.atomic():
+            _escribir(Producto, campos, filas)
+    return creados
+
+
+def _estado_segun_antiguedad(dias, azar):
+    """Estado de un pedido con esa antigüedad: los recientes siguen en curso, los antiguos ya se entregaron"""
+    if azar.random() < 0.05:
+        return 'Pago Rechazado'
+    if dias < 1:
+        return azar.choice(('Pendiente', 'Pendiente', 'Pago Revisión'))
+    if dias < 3:
+        return azar.choice(('Pago Revisión', 'Enviado', 'Enviado'))
+    if dias < 7:
+        return azar.choice(('Enviado', 'Entregado', 'Entregado'))
+    return 'Entregado'
+
+
+def generar_pedidos(cantidad, usuarios, productos, dias, hasta, sesgo, azar):
+    """Crear cantidad pedidos repartidos en los dias anteriores a hasta; retorna (pedidos, líneas)"""
+    compradores = DistribucionZipf(usuarios, sesgo, azar)
+    mas_vendidos = DistribucionZipf(productos, sesgo, azar)
+    primer_pedido = _siguiente_id(Pedido)
+    primera_linea = _siguiente_id(PedidoItem)
+    campos_pedido = [Pedido.id, Pedido.usuario_id, Pedido.total, Pedido.productos_json, Pedido.estado,
+                     Pedido.fecha_creacion, Pedido.referencia_pago, Pedido.fecha_confirmacion,
+                     Pedido.motivo_rechazo, Pedido.direccion_pedido]
+    campos_linea = [PedidoItem.id, PedidoItem.pedido_id, PedidoItem.producto_id, PedidoItem.nombre_producto,
+                    PedidoItem.cantidad, PedidoItem.precio_unitario, PedidoItem.categoria_id]
+
+    # Llegadas de un proceso de Poisson: fechas crecientes junto con los ids
+    desde = hasta - timedelta(days=dias)
+    intervalo_medio = dias * 86400 / max(cantidad, 1)
+    fecha = desde
+    lineas_creadas = 0
+    for inicio in range(0, cantidad, GENERADOR_TRANSACCION):
+        pedidos, lineas = [], []
+        for i in range(inicio, min(cantidad, inicio + GENERADOR_TRANSACCION)):
+            pedido_id = primer_pedido + i
+            fecha = min(hasta, fecha + timedelta(seconds=azar.expovariate(1 / intervalo_medio)))
+
+            # Carrito: casi siempre pocos productos, a veces una compra grande
+            cantidades = {}
+            for _ in range(min(40, 1 + int(azar.expovariate(1 / 3)))):
+                producto_id = mas_vendidos.elegir()
+                cantidades[producto_id] = cantidades.get(producto_id, 0) + azar.choice((1, 1, 1, 2, 2, 3, 6))
+            carrito = []
+            for producto_id, unidades in cantidades.items():
+                nombre, precio, categoria_id = productos[producto_id]
+                carrito.append({'id': producto_id, 'nombre': nombre, 'precio': precio, 'cantidad': unidades})
+                lineas.append((primera_linea + lineas_creadas, pedido_id, producto_id, nombre, unidades, precio,
+                               categoria_id))
+                lineas_creadas += 1
+            total = round(sum(item['precio'] * item['cantidad'] for item in carrito), 2)
+
+            estado = _estado_segun_antiguedad((hasta - fecha).total_seconds() / 86400, azar)
+            pagado = estado != 'Pendiente'
+            pedidos.append((
+                pedido_id, compradores.elegir(), total, json.dumps(carrito), estado, fecha,
+                str(azar.randint(1000, 999999)) if pagado else None,
+                fecha + timedelta(minutes=azar.randint(5, 240)) if pagado else None,
+                'Referencia de pago no encontrada.' if estado == 'Pago Rechazado' else None,
+                f'{azar.choice(ZONAS)}, calle {azar.randint(1, 40)}, casa {azar.randint(1, 200)}',
+            ))
+        with db.atomic():
+            _escribir(Pedido, campos_pedido, pedidos)
+            _escribir(PedidoItem, campos_linea, lineas)
+    return cantidad, lineas_creadas
+
+
+def generar_datos(usuarios=50000, categorias=40, productos=100000, pedidos=1000000, dias=365, hasta=None,
+                  semilla=1, sesgo=1.0, progreso=print):
+    """Generar el conjunto de datos completo; retorna un resumen con cantidades y segundos por etapa"""
+    azar = random.Random(semilla)
+    hasta = hasta or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    resumen = {}
+
+    def etapa(nombre, funcion):
+        inicio = datetime.now()
+        resultado = funcion()
+        resumen[nombre] = round((datetime.now() - inicio).total_seconds(), 2)
+        progreso(f'✓ {nombre}: {resumen[nombre]} s')
+        return resultado
+
+    ids_categorias = etapa('categorías', lambda: generar_categorias(categorias, hasta))
+    ids_usuarios = etapa('usuarios', lambda: generar_usuarios(usuarios, azar))
+    creados = etapa('productos', lambda: generar_productos(productos, ids_categorias, sesgo, hasta, azar))
+    if pedidos and not (ids_usuarios and creados):
+        raise ValueError('Para generar pedidos se necesitan usuarios y productos nuevos.')
+    _, lineas = etapa('pedidos', lambda: generar_pedidos(pedidos, ids_usuarios, creados, dias, hasta, sesgo, azar)
+                      if pedidos else (0, 0))
+    _ajustar_secuencias([Usuario, Producto, Pedido, PedidoItem])
+
+    def actualizar_catalogo():
+        # Los productos nuevos entran en la sincronización incremental y en la búsqueda
+        with db.atomic():
+            version = nueva_version_catalogo()
+            (Producto
+             .update(version_cambio=version)
+             .where(Producto.id.between(min(creados), max(creados)))
+             .execute())
+        reconstruir_indice()
+
+    if creados:
+        etapa('índice de búsqueda', actualizar_catalogo)
+    etapa('resúmenes de reportes', reconstruir_resumenes)
+    # Estadísticas del planificador al día después de la carga masiva
+    etapa('estadísticas (ANALYZE)', lambda: db.execute_sql('ANALYZE'))
+    resumen.update({'usuarios': len(ids_usuarios), 'productos': len(creados), 'pedidos': pedidos,
+                    'lineas': lineas})
+    return resumen
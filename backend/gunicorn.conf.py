@@ -0,0 +1,47 @@
+"""Configuración de gunicorn (se carga automáticamente desde este directorio)
+
+Modos de servicio (GUNICORN_WORKER_CLASS):
+- gevent (por defecto): miles de conexiones por worker
+  (GUNICORN_WORKER_CONNECTIONS); la app se carga desde servidor_gevent.py,
+  que aplica el monkey patching antes de importar Peewee. Las peticiones
+  esperan su turno en el pool de conexiones (DB_POOL_MAX_CONNECTIONS por
+  worker) sin bloquear el proceso. Es el modo por defecto porque cada
+  conexión SSE (/api/pedidos/eventos) queda abierta mientras la página está
+  visible: ver benchmarks/conexiones_sse.py.
+- gthread: GUNICORN_THREADS hilos por worker. Cada conexión SSE ocupa un
+  hilo, así que con workers * hilos conexiones abiertas la API deja de
+  responder.
+- sync: un proceso por petición, como el despliegue original (sin SSE).
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = 120
+
+# Con gevent el monkey patching debe ocurrir antes de importar la aplicación
+wsgi_app = 'servidor_gevent:app' if worker_class == 'gevent' else 'app:app'
+
+# Directorio compartido por los workers para las métricas de /metrics
+os.environ.setdefault('METRICAS_DIR', os.path.join(tempfile.gettempdir(), 'supermercado-metricas'))
+
+
+def on_starting(server):
+    # Descartar las instantáneas de una ejecución anterior del servidor
+    shutil.rmtree(os.environ['METRICAS_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['METRICAS_DIR'], exist_ok=True)
+
+    # Esquema y datos iniciales una sola vez, antes de crear los workers (también con --preload).
+    # En un proceso aparte: el maestro no importa Peewee (los workers gevent deben aplicar el
+    # monkey patching antes) ni deja conexiones abiertas que heredarían los workers.
+    resultado = subprocess.run([sys.executable, '-c', 'from models import init_db; init_db()'],
+                               cwd=server.cfg.chdir)
+    if resultado.returncode:
+        # No arrancar workers sobre un esquema a medio migrar
+        raise RuntimeError(f'init_db terminó con código {resultado.returncode}; revisar el error anterior')
@@ -0,0 +1,284 @@
+"""Importación y exportación masiva de productos en CSV o JSONL.
+
+La importación lee el archivo como stream y procesa las filas en lotes de
+IMPORTACION_LOTE. Cada lote se escribe en una transacción con insert_many:
+los productos existentes con ON CONFLICT (id) DO UPDATE y los nuevos con un
+INSERT de varias filas. La transacción también toma una versión del catálogo
+(invalida la caché y alimenta la sincronización incremental) e indexa los
+productos para la búsqueda. Una fila inválida se reporta con su número de
+línea sin detener las demás.
+
+Cada fila se asocia a un producto por id o, si no trae id, por nombre exacto;
+si no existe se crea. Las celdas vacías conservan el valor actual. La
+categoría se indica con categoria_id o categoria_nombre, que se resuelve con
+un mapa cargado una sola vez.
+"""
+import csv
+import io
+import json
+import math
+import os
+
+from datetime import datetime
+from flask import current_app
+
+from busqueda import indexar_productos
+from cambios import nueva_version_catalogo
+from models import db, Producto, Categoria
+
+IMPORTACION_LOTE = int(os.environ.get('IMPORTACION_LOTE', 1000))  # Filas por transacción
+IMPORTACION_MAX_ERRORES = int(os.environ.get('IMPORTACION_MAX_ERRORES', 1000))  # Errores detallados en la respuesta
+
+COLUMNAS = ('id', 'nombre', 'precio', 'stock', 'imagen_url', 'categoria_id', 'categoria_nombre')
+TIPOS_CONTENIDO = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+CAMPOS_ACTUALIZABLES = [Producto.nombre, Producto.precio, Producto.stock, Producto.imagen_url,
+                        Producto.categoria_id, Producto.version_cambio, Producto.fecha_actualizacion]
+
+
+def detectar_formato(formato=None, mimetype=None, nombre_archivo=''):
+    """'csv' o 'jsonl' según el parámetro, la extensión o el tipo de contenido (None si no se reconoce)"""
+    if formato:
+        return formato if formato in TIPOS_CONTENIDO else None
+    extension = os.path.splitext(nombre_archivo or '')[1].lower()
+    if extension in ('.jsonl', '.ndjson') or mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return 'jsonl'
+    return 'csv'
+
+
+class _FlujoBinario(io.RawIOBase):
+    """Adaptar un stream con read() (p. ej. el wsgi.input de gunicorn, sin readable()) a io"""
+
+    def __init__(self, fuente):
+        self.fuente = fuente
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        datos = self.fuente.read(len(destino))
+        destino[:len(datos)] = datos
+        return len(datos)
+
+
+def abrir_texto(flujo):
+    """Leer como texto UTF-8 el cuerpo de la petición o un archivo subido, sin cargarlo entero"""
+    return io.TextIOWrapper(io.BufferedReader(_FlujoBinario(flujo)), encoding='utf-8-sig', newline='')
+
+
+def leer_filas(archivo, formato):
+    """Generar (línea, fila) desde un archivo de texto; una fila ilegible se genera como ValueError"""
+    if formato == 'csv':
+        lector = csv.DictReader(archivo)
+        if not lector.fieldnames:
+            return
+        lector.fieldnames = [(columna or '').strip().lower() for columna in lector.fieldnames]
+        if not {'id', 'nombre'} & set(lector.fieldnames):
+            raise ValueError('El encabezado del CSV debe incluir la columna id o nombre.')
+        for fila in lector:
+            yield lector.line_num, fila
+        return
+
+    for linea, texto in enumerate(archivo, 1):
+        if not texto.strip():
+            continue
+        try:
+            fila = json.loads(texto)
+        except ValueError:
+            yield linea, ValueError('JSON inválido.')
+            continue
+        yield linea, fila if isinstance(fila, dict) else ValueError('Cada línea debe ser un objeto JSON.')
+
+
+def _vacio(valor):
+    return valor is None or (isinstance(valor, str) and not valor.strip())
+
+
+def _entero(valor, campo):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f'{campo} inválido: {valor!r}.')
+
+
+def validar_fila(fila, categorias):
+    """Campos a escribir de una fila (solo los que trae), validados como en POST /api/productos.
+
+    categorias es un dict nombre en minúsculas -> id.
+    """
+    campos = {}
+    if not _vacio(fila.get('id')):
+        campos['id'] = _entero(fila['id'], 'id')
+
+    if not _vacio(fila.get('nombre')):
+        nombre = str(fila['nombre']).strip()
+        if len(nombre) > Producto.nombre.max_length:
+            raise ValueError(f'El nombre no puede superar {Producto.nombre.max_length} caracteres.')
+        campos['nombre'] = nombre
+
+    if not _vacio(fila.get('precio')):
+        try:
+            precio = float(fila['precio'])
+        except (TypeError, ValueError):
+            raise ValueError(f'Precio inválido: {fila["precio"]!r}.')
+        if not math.isfinite(precio) or precio < 0:
+            raise ValueError('El precio debe ser mayor o igual a 0.')
+        campos['precio'] = precio
+
+    if not _vacio(fila.get('stock')):
+        stock = _entero(fila['stock'], 'Stock')
+        if stock < 0:
+            raise ValueError('El stock debe ser mayor o igual a 0.')
+        campos['stock'] = stock
+
+    if not _vacio(fila.get('imagen_url')):
+        imagen_url = str(fila['imagen_url']).strip()
+        if len(imagen_url) > Producto.imagen_url.max_length:
+            raise ValueError(f'imagen_url no puede superar {Producto.imagen_url.max_length} caracteres.')
+        campos['imagen_url'] = imagen_url
+
+    if not _vacio(fila.get('categoria_nombre')):
+        nombre_categoria = str(fila['categoria_nombre']).strip()
+        if nombre_categoria.lower() not in categorias:
+            raise ValueError(f'Categoría no encontrada: {nombre_categoria}.')
+        campos['categoria_id'] = categorias[nombre_categoria.lower()]
+    elif not _vacio(fila.get('categoria_id')):
+        categoria_id = _entero(fila['categoria_id'], 'categoria_id')
+        if categoria_id not in categorias.values():
+            raise ValueError(f'Categoría con ID {categoria_id} no encontrada.')
+        campos['categoria_id'] = categoria_id
+
+    if not campos or campos.keys() == {'id'}:
+        raise ValueError('La fila no tiene datos.')
+    return campos
+
+
+def _registrar_error(resultado, linea, mensaje):
+    resultado['total_errores'] += 1
+    if len(resultado['errores']) < IMPORTACION_MAX_ERRORES:
+        resultado['errores'].append({'linea': linea, 'error': str(mensaje)})
+
+
+def _existentes(lote):
+    """Productos del lote que ya existen (por id o por nombre) en una sola consulta"""
+    ids = {campos['id'] for _, campos in lote if 'id' in campos}
+    nombres = {campos['nombre'] for _, campos in lote if 'id' not in campos and 'nombre' in campos}
+    if not ids and not nombres:
+        return {}, {}
+    condicion = Producto.id.in_(list(ids)) if ids else None
+    if nombres:
+        por_nombres = Producto.nombre.in_(list(nombres))
+        condicion = por_nombres if condicion is None else (condicion | por_nombres)
+    existentes, por_nombre = {}, {}
+    consulta = (Producto
+                .select(Producto.id, Producto.nombre, Producto.precio, Producto.stock,
+                        Producto.imagen_url, Producto.categoria_id)
+                .where(condicion)
+                .dicts())
+    for fila in consulta:
+        existentes[fila['id']] = fila
+        por_nombre.setdefault(fila['nombre'], []).append(fila['id'])
+    return existentes, por_nombre
+
+
+def _escribir_lote(lote, resultado):
+    """Escribir un lote en una transacción; retorna (creados, actualizados) o lanza si la base de datos falla"""
+    errores = []
+    with db.atomic():
+        version = nueva_version_catalogo()
+        existentes, por_nombre = _existentes(lote)
+
+        # Varias líneas del mismo producto se combinan en una fila (la última gana)
+        actualizar, crear = {}, {}
+        for linea, campos in lote:
+            if 'id' in campos:
+                producto_id = campos['id']
+                if producto_id not in existentes:
+                    errores.append((linea, f'Producto con ID {producto_id} no encontrado.'))
+                    continue
+            else:
+                coincidencias = por_nombre.get(campos.get('nombre'), [])
+                if len(coincidencias) > 1:
+                    errores.append((linea, f'Hay {len(coincidencias)} productos llamados {campos["nombre"]}; indica el id.'))
+                    continue
+                producto_id = coincidencias[0] if coincidencias else None
+
+            if producto_id is not None:
+                actualizar[producto_id] = {**actualizar.get(producto_id, existentes[producto_id]), **campos, 'id': producto_id}
+            elif 'nombre' in campos and (campos['nombre'] in crear or {'nombre', 'precio', 'stock'} <= campos.keys()):
+                base = crear.get(campos['nombre'], {'imagen_url': None, 'categoria_id': None})
+                crear[campos['nombre']] = {**base, **campos}
+            else:
+                errores.append((linea, 'Datos incompletos para un producto nuevo. Se requiere nombre, precio y stock.'))
+
+        marca = {'version_cambio': version, 'fecha_actualizacion': datetime.now()}
+        if actualizar:
+            (Producto
+             .insert_many([{**fila, **marca} for fila in actualizar.values()])
+             .on_conflict(conflict_target=[Producto.id], preserve=CAMPOS_ACTUALIZABLES)
+             .execute())
+        if crear:
+            Producto.insert_many([{**fila, **marca} for fila in crear.values()]).execute()
+        indexar_productos(Producto.version_cambio == version)
+
+    for linea, mensaje in errores:
+        _registrar_error(resultado, linea, mensaje)
+    return len(crear), len(actualizar)
+
+
+def _procesar_lote(lote, resultado):
+    try:
+        creados, actualizados = _escribir_lote(lote, resultado)
+    except Exception:
+        # La base de datos rechazó el lote: repetir fila por fila para aislar la culpable
+        creados = actualizados = 0
+        for linea, campos in lote:
+            try:
+                c, a = _escribir_lote([(linea, campos)], resultado)
+            except Exception as e:
+                _registrar_error(resultado, linea, e)
+                continue
+            creados += c
+            actualizados += a
+    resultado['creados'] += creados
+    resultado['actualizados'] += actualizados
+
+
+def importar_productos(filas, lote=IMPORTACION_LOTE):
+    """Importar las filas de leer_filas por lotes; retorna el resumen con los errores por línea"""
+    resultado = {'lineas': 0, 'creados': 0, 'actualizados': 0, 'total_errores': 0, 'errores': []}
+    categorias = {c.nombre.strip().lower(): c.id for c in Categoria.select(Categoria.id, Categoria.nombre)}
+    pendientes = []
+    for linea, fila in filas:
+        resultado['lineas'] += 1
+        try:
+            if isinstance(fila, Exception):
+                raise fila
+            pendientes.append((linea, validar_fila(fila, categorias)))
+        except ValueError as e:
+            _registrar_error(resultado, linea, e)
+        if len(pendientes) >= lote:
+            _procesar_lote(pendientes, resultado)
+            pendientes = []
+    if pendientes:
+        _procesar_lote(pendientes, resultado)
+    resultado['errores'].sort(key=lambda error: error['linea'])
+    return resultado
+
+
+def exportar_productos(paginas, formato):
+    """Generar el archivo por fragmentos a partir de páginas de productos (dicts de producto_a_dict)"""
+    if formato == 'jsonl':
+        dumps = current_app.json.dumps
+        for filas in paginas:
+            if filas:
+                yield ''.join(f'{dumps({c: fila[c] for c in COLUMNAS})}\n' for fila in filas)
+        return
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUMNAS)
+    for filas in paginas:
+        escritor.writerows([fila[c] for c in COLUMNAS] for fila in filas)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
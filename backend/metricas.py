@@ -0,0 +1,358 @@
+"""Métricas de la aplicación en formato de texto de Prometheus (GET /metrics).
+
+Cada proceso acumula en memoria contadores e histogramas (peticiones por ruta
+y estado, latencias, consultas a la base de datos por petición) y, al
+exponerlas, agrega también las estadísticas que ya llevan el pool, las
+cachés y bcrypt.
+
+Con varios workers de gunicorn cada uno solo ve sus propias peticiones. Si
+METRICAS_DIR apunta a un directorio compartido, cada proceso escribe ahí una
+instantánea cada METRICAS_INTERVALO segundos y /metrics suma las de todos:
+los contadores de procesos ya terminados se conservan y los medidores
+(conexiones en uso, entradas en caché) solo se suman de procesos vivos.
+gunicorn.conf.py vacía el directorio al arrancar el servidor.
+
+/metrics exige la sesión de un administrador o Authorization: Bearer
+<METRICAS_TOKEN> (para Prometheus); queda abierta solo con METRICAS_PUBLICAS=1.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+
+METRICAS = os.environ.get('METRICAS', '1') != '0'
+METRICAS_DIR = os.environ.get('METRICAS_DIR')  # Directorio compartido entre workers (multiproceso)
+METRICAS_INTERVALO = float(os.environ.get('METRICAS_INTERVALO', 1))  # Segundos entre instantáneas
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')  # /metrics acepta Authorization: Bearer <token>
+METRICAS_PUBLICAS = os.environ.get('METRICAS_PUBLICAS', '0') == '1'  # /metrics sin autenticación (red interna)
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# nombre -> (tipo, ayuda)
+DEFINICIONES = {
+    'http_peticiones_total': ('counter', 'Peticiones HTTP atendidas por método, ruta y código de estado'),
+    'http_duracion_peticion_segundos': ('histogram', 'Duración de las peticiones HTTP hasta generar la respuesta'),
+    'db_consultas_total': ('counter', 'Consultas SQL ejecutadas durante peticiones, por ruta'),
+    'db_tiempo_consultas_segundos_total': ('counter', 'Tiempo total en consultas SQL durante peticiones, por ruta'),
+    'db_consultas_por_peticion': ('histogram', 'Consultas SQL por petición'),
+    'db_pool_conexiones_en_uso': ('gauge', 'Conexiones del pool prestadas en este momento'),
+    'db_pool_conexiones_libres': ('gauge', 'Conexiones abiertas disponibles en el pool'),
+    'db_pool_conexiones_max': ('gauge', 'Máximo de conexiones del pool (suma de todos los procesos)'),
+    'db_pool_en_espera': ('gauge', 'Peticiones esperando una conexión del pool'),
+    'db_pool_checkouts_total': ('counter', 'Conexiones tomadas del pool'),
+    'db_pool_timeouts_total': ('counter', 'Esperas por una conexión que superaron DB_POOL_TIMEOUT'),
+    'db_pool_espera_segundos_total': ('counter', 'Tiempo total esperando conexiones del pool'),
+    'db_pool_conexiones_descartadas_total': ('counter', 'Conexiones descartadas por estar cerradas o caídas'),
+    'cache_aciertos_total': ('counter', 'Aciertos de las cachés en memoria'),
+    'cache_fallos_total': ('counter', 'Fallos de las cachés en memoria'),
+    'cache_entradas': ('gauge', 'Entradas guardadas en las cachés en memoria'),
+    'cache_tasa_aciertos': ('gauge', 'Aciertos / (aciertos + fallos) de cada caché, en todos los procesos'),
+    'bcrypt_operaciones_total': ('counter', 'Hashes y verificaciones bcrypt calculados'),
+    'bcrypt_tiempo_segundos_total': ('counter', 'Tiempo total en bcrypt, incluida la espera en la cola'),
+    'bcrypt_rechazos_total': ('counter', 'Peticiones rechazadas por tener la cola de bcrypt llena'),
+}
+
+
+def _etiquetas(diccionario):
+    return tuple(sorted(diccionario.items()))
+
+
+class Metricas:
+    """Registro de contadores e histogramas del proceso actual"""
+
+    def __init__(self):
+        self._recolectores = []
+        self._reiniciar()
+        # Tras un fork (workers de gunicorn con --preload) cada hijo empieza de cero
+        os.register_at_fork(after_in_child=self._reiniciar)
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._archivo = None
+        if METRICAS_DIR:
+            self._archivo = os.path.join(METRICAS_DIR, f'metricas_{self._pid}_{time.time_ns()}.json')
+        self._contadores = defaultdict(float)  # (nombre, etiquetas) -> valor
+        self._histogramas = {}  # (nombre, etiquetas) -> [buckets, conteos por bucket + inf, suma]
+        self._hilo = None
+
+    def incrementar(self, nombre, etiquetas, valor=1):
+        with self._lock:
+            self._contadores[(nombre, etiquetas)] += valor
+        self._iniciar_escritura()
+
+    def observar(self, nombre, etiquetas, valor, buckets):
+        clave = (nombre, etiquetas)
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = [buckets, [0] * (len(buckets) + 1), 0.0]
+            histograma[1][bisect_left(buckets, valor)] += 1
+            histograma[2] += valor
+        self._iniciar_escritura()
+
+    def registrar_recolector(self, funcion):
+        """funcion() retorna (nombre, etiquetas dict, valor) leídos al exponer las métricas"""
+        self._recolectores.append(funcion)
+        return funcion
+
+    def instantanea(self):
+        """Estado actual del proceso en un dict serializable a JSON"""
+        with self._lock:
+            contadores = [[n, list(e), v] for (n, e), v in self._contadores.items()]
+            histogramas = [[n, list(e), list(h[0]), list(h[1]), h[2]] for (n, e), h in self._histogramas.items()]
+        recolectados = []
+        for recolector in self._recolectores:
+            try:
+                recolectados.extend([n, list(_etiquetas(e)), v] for n, e, v in recolector())
+            except Exception:
+                continue
+        return {'pid': self._pid, 'contadores': contadores + recolectados, 'histogramas': histogramas}
+
+    # --- Modo multiproceso ---
+
+    def _iniciar_escritura(self):
+        if self._archivo and self._hilo is None:
+            with self._lock:
+                if self._hilo is not None:
+                    return
+                self._hilo = threading.Thread(target=self._escribir_periodicamente, name='metricas', daemon=True)
+            self._hilo.start()
+
+    def _escribir_periodicamente(self):
+        while True:
+            time.sleep(METRICAS_INTERVALO)
+            self.escribir()
+
+    def escribir(self):
+        """Guardar la instantánea del proceso en METRICAS_DIR (reemplazo atómico)"""
+        if not self._archivo:
+            return
+        try:
+            os.makedirs(METRICAS_DIR, exist_ok=True)
+            temporal = f'{self._archivo}.tmp'
+            with open(temporal, 'w') as archivo:
+                json.dump(self.instantanea(), archivo)
+            os.replace(temporal, self._archivo)
+        except OSError:
+            pass
+
+    def instantaneas(self):
+        """Instantáneas de todos los procesos (solo la propia si no hay METRICAS_DIR)"""
+        propia = self.instantanea()
+        if not METRICAS_DIR:
+            return [propia]
+        resultado = [propia]
+        try:
+            nombres = os.listdir(METRICAS_DIR)
+        except OSError:
+            nombres = []
+        for nombre in nombres:
+            ruta = os.path.join(METRICAS_DIR, nombre)
+            if not nombre.endswith('.json') or ruta == self._archivo:
+                continue
+            try:
+                with open(ruta) as archivo:
+                    resultado.append(json.load(archivo))
+            except (OSError, ValueError):
+                continue
+        return resultado
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def agregar(instantaneas):
+    """Sumar las instantáneas de todos los procesos: (valores, histogramas)"""
+    valores = defaultdict(float)
+    histogramas = {}
+    for datos in instantaneas:
+        vivo = datos['pid'] == os.getpid() or _proceso_vivo(datos['pid'])
+        for nombre, etiquetas, valor in datos['contadores']:
+            # Los medidores de procesos terminados ya no representan nada
+            if not vivo and DEFINICIONES.get(nombre, ('gauge',))[0] == 'gauge':
+                continue
+            valores[(nombre, tuple(map(tuple, etiquetas)))] += valor
+        for nombre, etiquetas, buckets, conteos, suma in datos['histogramas']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            acumulado = histogramas.get(clave)
+            if acumulado is None or acumulado[0] != buckets:
+                histogramas[clave] = [buckets, list(conteos), suma]
+            else:
+                acumulado[1] = [a + b for a, b in zip(acumulado[1], conteos)]
+                acumulado[2] += suma
+
+    # Tasa de aciertos calculada sobre los totales de todos los procesos
+    for (nombre, etiquetas), aciertos in list(valores.items()):
+        if nombre == 'cache_aciertos_total':
+            consultas = aciertos + valores.get(('cache_fallos_total', etiquetas), 0)
+            valores[('cache_tasa_aciertos', etiquetas)] = round(aciertos / consultas, 4) if consultas else 0.0
+    return valores, histogramas
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formato_etiquetas(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{k}="{_escapar(v)}"' for k, v in pares) + '}'
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) and not valor.is_integer() else str(int(valor))
+
+
+def formato_prometheus(valores, histogramas):
+    """Texto en el formato de exposición de Prometheus (versión 0.0.4)"""
+    por_nombre = defaultdict(list)
+    for (nombre, etiquetas), valor in valores.items():
+        por_nombre[nombre].append((etiquetas, valor))
+    for (nombre, etiquetas), histograma in histogramas.items():
+        por_nombre[nombre].append((etiquetas, histograma))
+
+    lineas = []
+    for nombre in sorted(por_nombre):
+        tipo, ayuda = DEFINICIONES.get(nombre, ('untyped', ''))
+        lineas.append(f'# HELP {nombre} {ayuda}')
+        lineas.append(f'# TYPE {nombre} {tipo}')
+        for etiquetas, valor in sorted(por_nombre[nombre], key=lambda x: x[0]):
+            if tipo != 'histogram':
+                lineas.append(f'{nombre}{_formato_etiquetas(etiquetas)} {_numero(valor)}')
+                continue
+            buckets, conteos, suma = valor
+            acumulado = 0
+            for limite, conteo in zip(list(buckets) + [float('inf')], conteos):
+                acumulado += conteo
+                le = (('le', _numero(limite) if limite != float('inf') else '+Inf'),)
+                lineas.append(f'{nombre}_bucket{_formato_etiquetas(etiquetas, le)} {acumulado}')
+            lineas.append(f'{nombre}_sum{_formato_etiquetas(etiquetas)} {_numero(suma)}')
+            lineas.append(f'{nombre}_count{_formato_etiquetas(etiquetas)} {acumulado}')
+    return '\n'.join(lineas) + '\n'
+
+
+metricas = Metricas()
+
+
+def exponer():
+    """Texto de /metrics con las métricas de todos los procesos"""
+    metricas.escribir()
+    return formato_prometheus(*agregar(metricas.instantaneas()))
+
+
+def observar_consulta(sql, params, duracion):
+    """Observador de models.execute_sql: acumula las consultas de la petición en curso"""
+    if has_request_context() and 'metricas_inicio' in g:
+        g.metricas_consultas += 1
+        g.metricas_tiempo_sql += duracion
+
+
+def _inicio_peticion():
+    g.metricas_inicio = time.perf_counter()
+    g.metricas_consultas = 0
+    g.metricas_tiempo_sql = 0.0
+
+
+def _fin_peticion(respuesta):
+    inicio = g.pop('metricas_inicio', None)
+    if inicio is None:
+        return respuesta
+    duracion = time.perf_counter() - inicio
+    ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+    metricas.incrementar('http_peticiones_total', _etiquetas({
+        'metodo': request.method, 'ruta': ruta, 'estado': str(respuesta.status_code)
+    }))
+    etiquetas_ruta = _etiquetas({'metodo': request.method, 'ruta': ruta})
+    metricas.observar('http_duracion_peticion_segundos', etiquetas_ruta, duracion, BUCKETS_LATENCIA)
+    metricas.observar('db_consultas_por_peticion', etiquetas_ruta, g.metricas_consultas, BUCKETS_CONSULTAS)
+    if g.metricas_consultas:
+        metricas.incrementar('db_consultas_total', etiquetas_ruta, g.metricas_consultas)
+        metricas.incrementar('db_tiempo_consultas_segundos_total', etiquetas_ruta, g.metricas_tiempo_sql)
+    return respuesta
+
+
+def recolectar_estadisticas():
+    """Leer las estadísticas del pool, las cachés y bcrypt del proceso actual"""
+    from cache import cache_catalogo, cache_tasa, cache_usuarios
+    from models import estadisticas_pool
+    from seguridad import estadisticas_hash
+
+    pool = estadisticas_pool()
+    if pool:
+        yield 'db_pool_conexiones_en_uso', {}, pool['conexiones_en_uso']
+        yield 'db_pool_conexiones_libres', {}, pool['conexiones_libres']
+        yield 'db_pool_conexiones_max', {}, pool['max_conexiones']
+        yield 'db_pool_en_espera', {}, pool['en_espera']
+        yield 'db_pool_checkouts_total', {}, pool['checkouts']
+        yield 'db_pool_timeouts_total', {}, pool['timeouts']
+        yield 'db_pool_espera_segundos_total', {}, pool['espera_total_seg']
+        yield 'db_pool_conexiones_descartadas_total', {}, pool['conexiones_descartadas']
+
+    for nombre, cache in (('catalogo', cache_catalogo), ('tasa', cache_tasa), ('usuarios', cache_usuarios)):
+        datos = cache.estadisticas()
+        yield 'cache_aciertos_total', {'cache': nombre}, datos['aciertos']
+        yield 'cache_fallos_total', {'cache': nombre}, datos['fallos']
+        yield 'cache_entradas', {'cache': nombre}, datos['entradas']
+
+    hashes = estadisticas_hash()
+    yield 'bcrypt_operaciones_total', {'tipo': 'hash'}, hashes['hashes']
+    yield 'bcrypt_operaciones_total', {'tipo': 'verificacion'}, hashes['verificaciones']
+    yield 'bcrypt_tiempo_segundos_total', {}, hashes['tiempo_total_seg']
+    yield 'bcrypt_rechazos_total', {}, hashes['rechazos_ocupado']
+
+
+def configurar_metricas(app):
+    """Registrar los hooks de medición (llamar antes que los demás after_request para medir también su costo)"""
+    if not METRICAS:
+        return
+    from models import registrar_observador_sql
+    registrar_observador_sql(observar_consulta)
+    metricas.registrar_recolector(recolectar_estadisticas)
+    app.before_request(_inicio_peticion)
+    app.after_request(_fin_peticion)
+    if METRICAS_DIR:
+        atexit.register(metricas.escribir)
+
+
+def medir_sobrecarga(repeticiones):
+    """Costo de los hooks por petición y del observador SQL (dentro de un contexto de petición)"""
+    from flask import current_app
+
+    respuesta = current_app.response_class(b'')
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        _inicio_peticion()
+        _fin_peticion(respuesta)
+    peticion = time.perf_counter() - inicio
+
+    _inicio_peticion()
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        observar_consulta('SELECT 1', (), 0.0)
+    consulta = time.perf_counter() - inicio
+    g.pop('metricas_inicio', None)
+
+    inicio = time.perf_counter()
+    exponer()
+    return {
+        'peticion_us': peticion * 1e6 / repeticiones,
+        'consulta_us': consulta * 1e6 / repeticiones,
+        'exponer_ms': (time.perf_counter() - inicio) * 1000,
+    }
@@ -0,0 +1,355 @@
+"""Migraciones versionadas del esquema de la base de datos.
+
+Cada migración es una función registrada con @migracion('NNNN_nombre') que
+recibe un SchemaMigrator de Peewee. Las migraciones se aplican en orden, una
+vez cada una, y quedan registradas en la tabla 'migraciones'. Deben ser
+idempotentes porque una base creada con create_tables ya puede tener parte
+del esquema.
+
+Uso:
+    flask --app app migraciones upgrade
+    flask --app app migraciones status [--explain]
+"""
+import re
+from datetime import datetime
+
+from peewee import (Model, AutoField, BigIntegerField, BooleanField, CharField, DateTimeField, FloatField,
+                    ForeignKeyField, IntegerField, TextField, PostgresqlDatabase, fn)
+from playhouse.migrate import SchemaMigrator, migrate
+
+from models import (db, Categoria, Producto, PedidoItem,
+                    Configuracion, VersionCache, EventoPedido, CatalogoEliminado,
+                    ResumenVentasDia, ResumenVentasProducto, INDICE_PEDIDOS_RECIENTES)
+
+MIGRACIONES = []
+
+
+class MigracionAplicada(Model):
+    """Registro de las migraciones ya aplicadas"""
+    nombre = CharField(max_length=100, primary_key=True)
+    fecha_aplicada = DateTimeField(null=False)
+
+    class Meta:
+        database = db
+        table_name = 'migraciones'
+
+
+def migracion(nombre):
+    """Registrar una función como migración (el orden de registro es el orden de aplicación)"""
+    def decorador(funcion):
+        MIGRACIONES.append((nombre, funcion))
+        return funcion
+    return decorador
+
+
+def crear_indice_si_no_existe(migrator, tabla, columnas, unique=False):
+    """Crear un índice salvo que ya exista uno sobre exactamente esas columnas"""
+    for indice in db.get_indexes(tabla):
+        if list(indice.columns) == list(columnas):
+            return False
+    migrate(migrator.add_index(tabla, columnas, unique))
+    return True
+
+
+# Copia congelada de los modelos antes de las migraciones, para la 0001. Con los modelos actuales,
+# create_tables en una base anterior creaba índices sobre columnas que agregan migraciones
+# posteriores (version_cambio, de la 0005) antes de que existieran. Lo que se agregue a los
+# modelos va en una migración nueva, nunca aquí.
+class _UsuarioInicial(Model):
+    id = AutoField()
+    correo = CharField(max_length=100, unique=True, null=False)
+    contraseña_hash = CharField(max_length=255, null=False)
+    is_admin = BooleanField(default=False)
+    nombre_usuario = CharField(max_length=100, null=True)
+    direccion_principal = TextField(null=True)
+
+    class Meta:
+        database = db
+        table_name = 'usuarios'
+
+
+class _CategoriaInicial(Model):
+    id = AutoField()
+    nombre = CharField(max_length=100, null=False, unique=True)
+
+    class Meta:
+        database = db
+        table_name = 'categorias'
+
+
+class _ProductoInicial(Model):
+    id = AutoField()
+    nombre = CharField(max_length=100, null=False)
+    precio = FloatField(null=False)
+    stock = IntegerField(null=False)
+    imagen_url = CharField(max_length=500, null=True)
+    categoria_id = ForeignKeyField(_CategoriaInicial, null=True, on_delete='SET NULL')
+
+    class Meta:
+        database = db
+        table_name = 'productos'
+
+
+class _PedidoInicial(Model):
+    id = AutoField()
+    usuario_id = ForeignKeyField(_UsuarioInicial, null=True)
+    total = FloatField(null=False)
+    productos_json = TextField(null=False)
+    estado = CharField(max_length=50, null=False, default='Pendiente')
+    fecha_creacion = DateTimeField(null=True)
+    referencia_pago = TextField(null=True)
+    fecha_confirmacion = DateTimeField(null=True)
+    motivo_rechazo = TextField(null=True)
+    direccion_pedido = TextField(null=True)
+
+    class Meta:
+        database = db
+        table_name = 'pedidos'
+
+
+class _PedidoItemInicial(Model):
+    id = AutoField()
+    pedido_id = ForeignKeyField(_PedidoInicial, null=False, on_delete='CASCADE', index=True)
+    producto_id = ForeignKeyField(_ProductoInicial, null=True, on_delete='SET NULL', index=True)
+    nombre_producto = CharField(max_length=100, null=True)
+    cantidad = IntegerField(null=False)
+    precio_unitario = FloatField(null=False)
+
+    class Meta:
+        database = db
+        table_name = 'pedido_items'
+
+
+class _ConfiguracionInicial(Model):
+    id = AutoField()
+    tasa_bcv = FloatField(null=False, default=36.00)
+
+    class Meta:
+        database = db
+        table_name = 'configuracion'
+
+
+class _VersionCacheInicial(Model):
+    nombre = CharField(max_length=50, primary_key=True)
+    version = BigIntegerField(null=False, default=0)
+
+    class Meta:
+        database = db
+        table_name = 'versiones_cache'
+
+
+@migracion('0001_esquema_inicial')
+def esquema_inicial(migrator):
+    """Tablas anteriores a las migraciones (las que falten en una base creada antes)"""
+    db.create_tables([_UsuarioInicial, _CategoriaInicial, _ProductoInicial, _PedidoInicial, _PedidoItemInicial,
+                      _ConfiguracionInicial, _VersionCacheInicial], safe=True)
+
+
+@migracion('0002_indices_consultas_frecuentes')
+def indices_consultas_frecuentes(migrator):
+    # Pedidos del usuario (mis-pedidos) y panel de administración por estado
+    crear_indice_si_no_existe(migrator, 'pedidos', ('usuario_id', 'fecha_creacion'))
+    crear_indice_si_no_existe(migrator, 'pedidos', ('estado', 'fecha_creacion'))
+    # Catálogo filtrado por categoría y ordenado/buscado por nombre o precio
+    crear_indice_si_no_existe(migrator, 'productos', ('categoria_id',))
+    crear_indice_si_no_existe(migrator, 'productos', ('nombre',))
+    crear_indice_si_no_existe(migrator, 'productos', ('precio',))
+
+
+@migracion('0003_fecha_modificacion_versiones_cache')
+def fecha_modificacion_versiones_cache(migrator):
+    if 'fecha_modificacion' not in [c.name for c in db.get_columns('versiones_cache')]:
+        migrate(migrator.add_column('versiones_cache', 'fecha_modificacion', VersionCache.fecha_modificacion))
+
+
+@migracion('0004_eventos_pedidos')
+def eventos_pedidos(migrator):
+    db.create_tables([EventoPedido], safe=True)
+
+
+@migracion('0005_versiones_cambio_catalogo')
+def versiones_cambio_catalogo(migrator):
+    for modelo in (Producto, Categoria):
+        tabla = modelo._meta.table_name
+        columnas = [c.name for c in db.get_columns(tabla)]
+        for campo in (modelo.fecha_actualizacion, modelo.version_cambio):
+            if campo.column_name not in columnas:
+                migrate(migrator.add_column(tabla, campo.column_name, campo))
+        crear_indice_si_no_existe(migrator, tabla, ('version_cambio',))
+    db.create_tables([CatalogoEliminado], safe=True)
+
+
+CATEGORIAS_INICIALES = ['Lácteos', 'Panadería', 'Limpieza', 'Granos y Pastas', 'Frutas y Verduras', 'Carnes', 'Sin Categoría']
+
+# Categoría de los productos sin categoría según palabras del nombre (gana la primera regla que coincide;
+# distingue mayúsculas: "Pan" no coincide con "Empanada")
+REGLAS_CATEGORIA = [
+    ('Lácteos', ('Leche', 'Yogur', 'Huevos')),
+    ('Panadería', ('Pan',)),
+    ('Limpieza', ('Detergente',)),
+    ('Granos y Pastas', ('Arroz', 'Pasta', 'Aceite')),
+    ('Frutas y Verduras', ('Tomates',)),
+    ('Carnes', ('Pollo',)),
+]
+
+PRODUCTOS_INICIALES = [
+    {'nombre': 'Leche Entera 1L', 'precio': 2.50, 'stock': 50, 'imagen_url': 'https://images.unsplash.com/photo-1563636619-e9143da7973b?w=400', 'categoria': 'Lácteos'},
+    {'nombre': 'Huevos Cartón x12', 'precio': 3.20, 'stock': 30, 'imagen_url': 'https://images.unsplash.com/photo-1582722872445-44dc5f7e3c8f?w=400', 'categoria': 'Lácteos'},
+    {'nombre': 'Pan Integral', 'precio': 1.80, 'stock': 40, 'imagen_url': 'https://images.unsplash.com/photo-1509440159596-0249088772ff?w=400', 'categoria': 'Panadería'},
+    {'nombre': 'Detergente 1.5L', 'precio': 4.50, 'stock': 25, 'imagen_url': 'https://images.unsplash.com/photo-1610557892470-55d9e80c0bce?w=400', 'categoria': 'Limpieza'},
+    {'nombre': 'Arroz 1kg', 'precio': 1.50, 'stock': 60, 'imagen_url': 'https://images.unsplash.com/photo-1586201375761-83865001e31c?w=400', 'categoria': 'Granos y Pastas'},
+    {'nombre': 'Aceite de Oliva 500ml', 'precio': 5.90, 'stock': 35, 'imagen_url': 'https://images.unsplash.com/photo-1474979266404-7eaacbcd87c5?w=400', 'categoria': 'Granos y Pastas'},
+    {'nombre': 'Yogur Natural x4', 'precio': 2.30, 'stock': 45, 'imagen_url': 'https://images.unsplash.com/photo-1488477181946-6428a0291777?w=400', 'categoria': 'Lácteos'},
+    {'nombre': 'Pasta Espagueti 500g', 'precio': 1.20, 'stock': 55, 'imagen_url': 'https://images.unsplash.com/photo-1551462147-8585ac5aae54?w=400', 'categoria': 'Granos y Pastas'},
+    {'nombre': 'Tomates 1kg', 'precio': 2.80, 'stock': 30, 'imagen_url': 'https://images.unsplash.com/photo-1546470427-e26264be0d42?w=400', 'categoria': 'Frutas y Verduras'},
+    {'nombre': 'Pollo Pechuga 1kg', 'precio': 6.50, 'stock': 20, 'imagen_url': 'https://images.unsplash.com/photo-1604503468506-a8da13d82791?w=400', 'categoria': 'Carnes'},
+]
+
+
+def contiene(campo, palabra):
+    """campo contiene palabra distinguiendo mayúsculas, como `palabra in nombre` en Python
+    (contains usa LIKE/ILIKE, que no las distingue)"""
+    posicion = fn.strpos if isinstance(db, PostgresqlDatabase) else fn.instr
+    return posicion(campo, palabra) > 0
+
+
+@migracion('0006_datos_iniciales')
+def datos_iniciales(migrator):
+    """Configuración, categorías y productos de ejemplo con operaciones por conjunto (no fila por fila)"""
+    from busqueda import crear_indice_busqueda, indice_vacio, reconstruir_indice
+
+    if not Configuracion.select().exists():
+        Configuracion.create(tasa_bcv=36.00)
+        print('✓ Configuración inicializada con tasa BCV por defecto (36.00)')
+
+    Categoria.insert_many([{'nombre': nombre} for nombre in CATEGORIAS_INICIALES]).on_conflict_ignore().execute()
+    categorias = dict(Categoria
+                      .select(Categoria.nombre, Categoria.id)
+                      .where(Categoria.nombre.in_(CATEGORIAS_INICIALES))
+                      .tuples())
+
+    # Asignar categoría a los productos existentes que no tienen (un UPDATE por regla)
+    asignados = 0
+    for categoria, palabras in REGLAS_CATEGORIA:
+        coincide = contiene(Producto.nombre, palabras[0])
+        for palabra in palabras[1:]:
+            coincide |= contiene(Producto.nombre, palabra)
+        asignados += (Producto
+                      .update(categoria_id=categorias[categoria])
+                      .where(Producto.categoria_id.is_null() & coincide)
+                      .execute())
+    asignados += (Producto
+                  .update(categoria_id=categorias['Sin Categoría'])
+                  .where(Producto.categoria_id.is_null())
+                  .execute())
+    if asignados:
+        print(f'✓ {asignados} productos actualizados con categorías')
+
+    if not Producto.select().exists():
+        Producto.insert_many([
+            {**{k: v for k, v in datos.items() if k != 'categoria'}, 'categoria_id': categorias[datos['categoria']]}
+            for datos in PRODUCTOS_INICIALES
+        ]).execute()
+        print('✓ Base de datos inicializada con productos de ejemplo y categorías')
+
+    # Crear y poblar el índice de búsqueda (primera ejecución o base anterior al índice)
+    crear_indice_busqueda()
+    if indice_vacio():
+        reconstruir_indice()
+        print('✓ Índice de búsqueda de productos construido')
+
+
+@migracion('0007_resumenes_ventas')
+def resumenes_ventas(migrator):
+    """Tablas de resumen de los reportes, llenadas desde el historial de pedidos"""
+    from reportes import reconstruir_resumenes
+
+    if PedidoItem.categoria_id.column_name not in [c.name for c in db.get_columns('pedido_items')]:
+        migrate(migrator.add_column('pedido_items', PedidoItem.categoria_id.column_name, PedidoItem.categoria_id))
+    # Las líneas existentes toman la categoría actual de su producto (un solo UPDATE)
+    (PedidoItem
+     .update(categoria_id=Producto.select(Producto.categoria_id).where(Producto.id == PedidoItem.producto_id))
+     .where(PedidoItem.categoria_id.is_null() & PedidoItem.producto_id.is_null(False))
+     .execute())
+    db.create_tables([ResumenVentasDia, ResumenVentasProducto], safe=True)
+    reconstruir_resumenes()
+
+
+@migracion('0008_quitar_indice_resumen_producto')
+def quitar_indice_resumen_producto(migrator):
+    """Quitar el índice por producto del resumen de ventas"""
+    # Sin estadísticas, SQLite recorría este índice completo para agrupar por producto en lugar
+    # de filtrar por el rango de fechas del índice único (1,6 s frente a 0,16 s con 1M de pedidos)
+    for indice in db.get_indexes('resumen_ventas_producto'):
+        if list(indice.columns) == ['producto_id']:
+            migrate(migrator.drop_index('resumen_ventas_producto', indice.name))
+
+
+@migracion('0009_indice_pedidos_recientes')
+def indice_pedidos_recientes(migrator):
+    """Índice (fecha_creacion DESC, id DESC) del listado de pedidos del panel de administración"""
+    # Sin él, SQLite ordenaba todos los pedidos en un B-tree temporal para devolver cada página
+    db.execute(INDICE_PEDIDOS_RECIENTES.safe(True))
+
+
+@migracion('0010_indice_busqueda_por_rowid')
+def indice_busqueda_por_rowid(migrator):
+    """En SQLite, rehacer el índice de búsqueda con el id del producto como rowid"""
+    from busqueda import TABLA_BUSQUEDA, crear_indice_busqueda, indice_con_columna_producto_id, reconstruir_indice
+
+    # Con la columna producto_id, actualizar o quitar un producto recorría todo el índice
+    # (27 ms por producto con 100.000 productos)
+    if indice_con_columna_producto_id():
+        db.execute_sql(f'DROP TABLE {TABLA_BUSQUEDA}')
+        crear_indice_busqueda()
+        reconstruir_indice()
+        print('✓ Índice de búsqueda reconstruido con el id del producto como rowid')
+
+
+def migraciones_aplicadas():
+    db.create_tables([MigracionAplicada], safe=True)
+    return {m.nombre: m.fecha_aplicada for m in MigracionAplicada.select()}
+
+
+def migraciones_pendientes():
+    aplicadas = migraciones_aplicadas()
+    return [(nombre, funcion) for nombre, funcion in MIGRACIONES if nombre not in aplicadas]
+
+
+def aplicar_migraciones():
+    """Aplicar las migraciones pendientes en orden; retorna los nombres aplicados"""
+    migrator = SchemaMigrator.from_database(db)
+    aplicadas = []
+    for nombre, funcion in migraciones_pendientes():
+        with db.atomic():
+            funcion(migrator)
+            MigracionAplicada.create(nombre=nombre, fecha_aplicada=datetime.now())
+        print(f'✓ Migración {nombre} aplicada')
+        aplicadas.append(nombre)
+    return aplicadas
+
+
+def plan_usa_indice(consulta):
+    """Retornar (usa_indice, plan) según EXPLAIN de la base de datos activa.
+    
+    La consulta no usa índices si el plan recorre una tabla completa o
+    ordena las filas aparte: en SQLite, SCAN <tabla> sin índice o USE TEMP
+    B-TREE FOR ORDER BY; en PostgreSQL, Seq Scan o Sort. En PostgreSQL se
+    desalientan ambos al explicar: con tablas chicas el planificador los
+    prefiere aunque exista el índice, y solo aparecen si no hay otro plan.
+    """
+    sql, params = consulta.sql()
+    if isinstance(db, PostgresqlDatabase):
+        with db.atomic() as transaccion:
+            db.execute_sql('SET LOCAL enable_seqscan = off')
+            db.execute_sql('SET LOCAL enable_sort = off')
+            filas = db.execute_sql('EXPLAIN ' + sql, params).fetchall()
+            transaccion.rollback()
+        plan = '\n'.join(fila[0] for fila in filas)
+        return not re.search(r'\b(Seq Scan|Sort)\b', plan), plan
+    filas = db.execute_sql('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    pasos = [str(fila[-1]) for fila in filas]
+    sin_indice = [paso for paso in pasos
+                  if re.match(r'SCAN (?!CONSTANT ROW)', paso) and ' USING ' not in paso
+                  or paso.startswith('USE TEMP B-TREE FOR ORDER BY')]
+    return not sin_indice, '\n'.join(pasos)
@@ -0,0 +1,124 @@
+"""Perfilado de SQL por petición (opcional, PERFILADO=1).
+
+Registra cada consulta de la petición con su duración y una huella (el SQL
+con literales y listas de parámetros normalizados) para detectar patrones
+N+1: la misma huella repetida PERFILADO_REPETICIONES_N1 veces o más en una
+petición. Las consultas que tardan más de SQL_LENTA_MS se registran en el
+log con su plan (EXPLAIN). Cada respuesta lleva un encabezado Server-Timing
+con el tiempo en la base de datos, visible en las herramientas del navegador.
+"""
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from flask import current_app, g, has_request_context, request
+
+PERFILADO = os.environ.get('PERFILADO', '0') == '1'
+SQL_LENTA_MS = float(os.environ.get('SQL_LENTA_MS', 100))  # Umbral del log de consultas lentas
+PERFILADO_REPETICIONES_N1 = int(os.environ.get('PERFILADO_REPETICIONES_N1', 3))  # Repeticiones para sospechar N+1
+PERFILADO_HISTORIAL = int(os.environ.get('PERFILADO_HISTORIAL', 50))  # Perfiles recientes guardados por proceso
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ESPACIOS = re.compile(r'\s+')
+
+_recientes = deque(maxlen=PERFILADO_HISTORIAL)
+_recientes_lock = threading.Lock()
+
+
+def huella(sql):
+    """SQL normalizado: literales y parámetros como ?, listas IN (?, ?, ...) como (?+)"""
+    sql = _LITERALES.sub('?', sql.replace('%s', '?'))
+    sql = _LISTAS.sub('(?+)', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+def explicar(sql, params):
+    """Plan de ejecución de una consulta SELECT (sin pasar por execute_sql para no perfilarlo)"""
+    from models import db
+    from busqueda import es_postgres
+
+    prefijo = 'EXPLAIN ' if es_postgres() else 'EXPLAIN QUERY PLAN '
+    cursor = db.cursor()
+    try:
+        cursor.execute(prefijo + sql, params or ())
+        return '\n'.join(str(fila[0] if es_postgres() else fila[-1]) for fila in cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def observar_consulta(sql, params, duracion):
+    """Observador de models.execute_sql: guarda la consulta en el perfil de la petición"""
+    if not has_request_context() or 'perfil_consultas' not in g:
+        return
+    g.perfil_consultas.append((sql, duracion))
+    if duracion * 1000 < SQL_LENTA_MS:
+        return
+    plan = None
+    if sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        try:
+            plan = explicar(sql, params)
+        except Exception as e:
+            plan = f'(EXPLAIN falló: {e})'
+    current_app.logger.warning(
+        'Consulta lenta (%.1f ms) en %s %s: %s%s',
+        duracion * 1000, request.method, request.path, sql,
+        f'\n{plan}' if plan else ''
+    )
+
+
+def resumen(consultas):
+    """Totales, huellas y sospechas de N+1 de una lista de (sql, duracion)"""
+    conteo = Counter(huella(sql) for sql, _ in consultas)
+    tiempo = sum(duracion for _, duracion in consultas)
+    return {
+        'consultas': len(consultas),
+        'tiempo_ms': round(tiempo * 1000, 3),
+        'huellas': [{'sql': sql, 'veces': veces} for sql, veces in conteo.most_common()],
+        'sospechas_n1': [sql for sql, veces in conteo.items()
+                         if veces >= PERFILADO_REPETICIONES_N1 and sql.upper().startswith('SELECT')],
+    }
+
+
+def perfiles_recientes():
+    with _recientes_lock:
+        return list(_recientes)
+
+
+def _inicio_peticion():
+    g.perfil_inicio = time.perf_counter()
+    g.perfil_consultas = []
+
+
+def _fin_peticion(respuesta):
+    consultas = g.pop('perfil_consultas', None)
+    if consultas is None:
+        return respuesta
+    total_ms = (time.perf_counter() - g.pop('perfil_inicio')) * 1000
+    datos = resumen(consultas)
+
+    for sql in datos['sospechas_n1']:
+        current_app.logger.warning('Posible N+1 en %s %s: %s', request.method, request.path, sql)
+
+    with _recientes_lock:
+        _recientes.append(dict(datos, metodo=request.method, ruta=request.full_path,
+                               estado=respuesta.status_code, total_ms=round(total_ms, 3)))
+
+    respuesta.headers.add(
+        'Server-Timing',
+        f'db;dur={datos["tiempo_ms"]:.1f};desc="{datos["consultas"]} consultas", app;dur={total_ms:.1f}'
+    )
+    # Permite leer los tiempos desde el frontend servido en otro origen
+    respuesta.headers['Timing-Allow-Origin'] = '*'
+    return respuesta
+
+
+def configurar_perfilado(app):
+    if not PERFILADO:
+        return
+    from models import registrar_observador_sql
+    registrar_observador_sql(observar_consulta)
+    app.before_request(_inicio_peticion)
+    app.after_request(_fin_peticion)
@@ -0,0 +1,287 @@
+"""Reportes de ventas e inventario a partir de tablas de resumen.
+
+resumen_ventas_dia acumula pedidos y total por (día de creación, estado) y
+resumen_ventas_producto unidades e ingresos por (día, estado, producto,
+categoría). crear_pedido suma el pedido nuevo y los cambios de estado mueven
+sus montos del estado anterior al nuevo, en la misma transacción que escribe
+el pedido, con INSERT ... ON CONFLICT DO UPDATE que incrementa la fila. Así
+los reportes leen a lo sumo días x estados x productos filas, sin importar
+cuántos pedidos haya en el historial.
+
+La categoría de cada línea es la del producto al momento de la compra
+(PedidoItem.categoria_id). reconstruir_resumenes recalcula todo desde
+pedidos y pedido_items (backfill o reparación).
+"""
+from datetime import date, timedelta
+
+from peewee import EXCLUDED, JOIN, fn
+
+from busqueda import es_postgres
+from models import db, Pedido, PedidoItem, Producto, Categoria, ResumenVentasDia, ResumenVentasProducto
+
+# Los pedidos con el pago rechazado no cuentan como venta
+ESTADOS_SIN_VENTA = ('Pago Rechazado',)
+LOTE_RESUMEN = 500  # Filas por INSERT al acumular líneas
+
+
+def _fecha(pedido):
+    return pedido.fecha_creacion.date() if pedido.fecha_creacion else None
+
+
+def _acumular_pedido(fecha, estado, pedidos, total):
+    (ResumenVentasDia
+     .insert(fecha=fecha, estado=estado, pedidos=pedidos, total=total)
+     .on_conflict(conflict_target=[ResumenVentasDia.fecha, ResumenVentasDia.estado],
+                  update={ResumenVentasDia.pedidos: ResumenVentasDia.pedidos + EXCLUDED.pedidos,
+                          ResumenVentasDia.total: ResumenVentasDia.total + EXCLUDED.total})
+     .execute())
+
+
+def _acumular_lineas(montos):
+    """Sumar montos {(fecha, estado, producto_id, categoria_id): [unidades, ingresos]} a resumen_ventas_producto"""
+    filas = [{'fecha': fecha, 'estado': estado, 'producto_id': producto_id, 'categoria_id': categoria_id,
+              'unidades': unidades, 'ingresos': ingresos}
+             for (fecha, estado, producto_id, categoria_id), (unidades, ingresos) in montos.items()]
+    for inicio in range(0, len(filas), LOTE_RESUMEN):
+        (ResumenVentasProducto
+         .insert_many(filas[inicio:inicio + LOTE_RESUMEN])
+         .on_conflict(conflict_target=[ResumenVentasProducto.fecha, ResumenVentasProducto.estado,
+                                       ResumenVentasProducto.producto_id, ResumenVentasProducto.categoria_id],
+                      update={ResumenVentasProducto.unidades: ResumenVentasProducto.unidades + EXCLUDED.unidades,
+                              ResumenVentasProducto.ingresos: ResumenVentasProducto.ingresos + EXCLUDED.ingresos})
+         .execute())
+
+
+def _montos_lineas(fecha, estado, lineas, signo):
+    """Agrupar lineas (producto_id, categoria_id, cantidad, precio_unitario) por clave del resumen.
+
+    Un mismo INSERT ... ON CONFLICT no puede tocar dos veces la misma fila.
+    """
+    montos = {}
+    for producto_id, categoria_id, cantidad, precio_unitario in lineas:
+        clave = (fecha, estado, producto_id or 0, categoria_id or 0)
+        acumulado = montos.setdefault(clave, [0, 0.0])
+        acumulado[0] += signo * cantidad
+        acumulado[1] += signo * cantidad * precio_unitario
+    return montos
+
+
+def registrar_pedido(pedido, lineas):
+    """Sumar un pedido nuevo a los resúmenes (llamar dentro de la transacción que lo crea)"""
+    fecha = _fecha(pedido)
+    if fecha is None:
+        return
+    _acumular_pedido(fecha, pedido.estado, 1, pedido.total)
+    _acumular_lineas(_montos_lineas(fecha, pedido.estado, lineas, 1))
+
+
+def cambiar_estado(pedido, estado_anterior):
+    """Mover los montos de un pedido de estado_anterior a su estado actual (dentro de la transacción del cambio)"""
+    fecha = _fecha(pedido)
+    if fecha is None or estado_anterior == pedido.estado:
+        return
+    lineas = list(PedidoItem
+                  .select(PedidoItem.producto_id, PedidoItem.categoria_id,
+                          PedidoItem.cantidad, PedidoItem.precio_unitario)
+                  .where(PedidoItem.pedido_id == pedido.id)
+                  .tuples())
+    _acumular_pedido(fecha, estado_anterior, -1, -pedido.total)
+    _acumular_pedido(fecha, pedido.estado, 1, pedido.total)
+    montos = _montos_lineas(fecha, estado_anterior, lineas, -1)
+    montos.update(_montos_lineas(fecha, pedido.estado, lineas, 1))
+    _acumular_lineas(montos)
+
+
+def producto_eliminado(producto_id):
+    """Pasar las ventas de un producto que se elimina a producto_id 0 (dentro de la transacción que lo elimina).
+
+    Las líneas de pedido quedan con producto_id nulo, igual que con el
+    ON DELETE SET NULL de PostgreSQL, para que los cambios de estado
+    posteriores resten de la misma fila del resumen.
+    """
+    PedidoItem.update(producto_id=None).where(PedidoItem.producto_id == producto_id).execute()
+    condicion = ResumenVentasProducto.producto_id == producto_id
+    montos = {}
+    for fecha, estado, categoria_id, unidades, ingresos in (ResumenVentasProducto
+                                                            .select(ResumenVentasProducto.fecha,
+                                                                    ResumenVentasProducto.estado,
+                                                                    ResumenVentasProducto.categoria_id,
+                                                                    ResumenVentasProducto.unidades,
+                                                                    ResumenVentasProducto.ingresos)
+                                                            .where(condicion)
+                                                            .tuples()):
+        montos[(fecha, estado, 0, categoria_id)] = [unidades, ingresos]
+    ResumenVentasProducto.delete().where(condicion).execute()
+    _acumular_lineas(montos)
+
+
+def reconstruir_resumenes():
+    """Recalcular los resúmenes desde pedidos y pedido_items con dos INSERT ... SELECT.
+
+    Los pedidos sin líneas (anteriores a PedidoItem) solo cuentan en el
+    resumen por día; ejecutar antes rellenar_items_pedidos para incluirlos
+    por producto. Retorna (filas por día, filas por producto).
+    """
+    with db.atomic():
+        if es_postgres():
+            # Que ningún pedido se cree o cambie de estado a mitad de la reconstrucción
+            db.execute_sql('LOCK TABLE pedidos, pedido_items IN SHARE MODE')
+        ResumenVentasDia.delete().execute()
+        ResumenVentasProducto.delete().execute()
+
+        fecha = fn.DATE(Pedido.fecha_creacion)
+        (ResumenVentasDia
+         .insert_from(Pedido
+                      .select(fecha, Pedido.estado, fn.COUNT(Pedido.id), fn.SUM(Pedido.total))
+                      .where(Pedido.fecha_creacion.is_null(False))
+                      .group_by(fecha, Pedido.estado),
+                      [ResumenVentasDia.fecha, ResumenVentasDia.estado,
+                       ResumenVentasDia.pedidos, ResumenVentasDia.total])
+         .execute())
+
+        producto_id = fn.COALESCE(PedidoItem.producto_id, 0)
+        categoria_id = fn.COALESCE(PedidoItem.categoria_id, 0)
+        (ResumenVentasProducto
+         .insert_from(PedidoItem
+                      .select(fecha, Pedido.estado, producto_id, categoria_id,
+                              fn.SUM(PedidoItem.cantidad),
+                              fn.SUM(PedidoItem.cantidad * PedidoItem.precio_unitario))
+                      .join(Pedido)
+                      .where(Pedido.fecha_creacion.is_null(False))
+                      .group_by(fecha, Pedido.estado, producto_id, categoria_id),
+                      [ResumenVentasProducto.fecha, ResumenVentasProducto.estado,
+                       ResumenVentasProducto.producto_id, ResumenVentasProducto.categoria_id,
+                       ResumenVentasProducto.unidades, ResumenVentasProducto.ingresos])
+         .execute())
+    return ResumenVentasDia.select().count(), ResumenVentasProducto.select().count()
+
+
+def _redondear(valor):
+    return round(float(valor or 0), 2)
+
+
+def ventas_por_dia(desde, hasta, estados):
+    """Consulta de (fecha, pedidos, total) por día entre desde y hasta para los estados dados"""
+    pedidos = fn.SUM(ResumenVentasDia.pedidos)
+    return (ResumenVentasDia
+            .select(ResumenVentasDia.fecha, pedidos, fn.SUM(ResumenVentasDia.total))
+            .where((ResumenVentasDia.fecha >= desde) & (ResumenVentasDia.fecha <= hasta)
+                   & ResumenVentasDia.estado.in_(estados))
+            .group_by(ResumenVentasDia.fecha)
+            .having(pedidos > 0)
+            .order_by(ResumenVentasDia.fecha))
+
+
+def reporte_ventas(desde, hasta, estados, limite=20):
+    """Ingresos por día, estado, categoría y producto entre desde y hasta (fechas, inclusive).
+
+    estados filtra los desgloses por día, categoría y producto; el desglose
+    por estado siempre incluye todos.
+    """
+    en_fechas = (ResumenVentasDia.fecha >= desde) & (ResumenVentasDia.fecha <= hasta)
+    pedidos = fn.SUM(ResumenVentasDia.pedidos)
+    total = fn.SUM(ResumenVentasDia.total)
+
+    por_estado = [{'estado': estado, 'pedidos': int(n), 'total': _redondear(t)}
+                  for estado, n, t in (ResumenVentasDia
+                                       .select(ResumenVentasDia.estado, pedidos, total)
+                                       .where(en_fechas)
+                                       .group_by(ResumenVentasDia.estado)
+                                       .having(pedidos > 0)
+                                       .order_by(ResumenVentasDia.estado)
+                                       .tuples())]
+
+    por_dia = [{'fecha': str(fecha), 'pedidos': int(n), 'total': _redondear(t)}
+               for fecha, n, t in ventas_por_dia(desde, hasta, estados).tuples()]
+
+    lineas = ((ResumenVentasProducto.fecha >= desde) & (ResumenVentasProducto.fecha <= hasta)
+              & ResumenVentasProducto.estado.in_(estados))
+    unidades = fn.SUM(ResumenVentasProducto.unidades)
+    ingresos = fn.SUM(ResumenVentasProducto.ingresos)
+
+    por_categoria = [{'categoria_id': categoria_id or None, 'categoria_nombre': nombre,
+                      'unidades': int(u), 'ingresos': _redondear(i)}
+                     for categoria_id, nombre, u, i in (ResumenVentasProducto
+                                                        .select(ResumenVentasProducto.categoria_id, Categoria.nombre,
+                                                                unidades, ingresos)
+                                                        .join(Categoria, JOIN.LEFT_OUTER,
+                                                              on=(Categoria.id == ResumenVentasProducto.categoria_id))
+                                                        .where(lineas)
+                                                        .group_by(ResumenVentasProducto.categoria_id, Categoria.nombre)
+                                                        .having(unidades > 0)
+                                                        .order_by(ingresos.desc())
+                                                        .tuples())]
+
+    por_producto = [{'producto_id': producto_id or None, 'nombre': nombre,
+                     'unidades': int(u), 'ingresos': _redondear(i)}
+                    for producto_id, nombre, u, i in (ResumenVentasProducto
+                                                      .select(ResumenVentasProducto.producto_id, Producto.nombre,
+                                                              unidades, ingresos)
+                                                      .join(Producto, JOIN.LEFT_OUTER,
+                                                            on=(Producto.id == ResumenVentasProducto.producto_id))
+                                                      .where(lineas)
+                                                      .group_by(ResumenVentasProducto.producto_id, Producto.nombre)
+                                                      .having(unidades > 0)
+                                                      .order_by(ingresos.desc(), ResumenVentasProducto.producto_id)
+                                                      .limit(limite)
+                                                      .tuples())]
+
+    return {
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'estados': list(estados),
+        'pedidos': sum(dia['pedidos'] for dia in por_dia),
+        'total': _redondear(sum(dia['total'] for dia in por_dia)),
+        'por_dia': por_dia,
+        'por_estado': por_estado,
+        'por_categoria': por_categoria,
+        'por_producto': por_producto,
+    }
+
+
+def reporte_inventario(estados, umbral=5, dias=30, limite=20):
+    """Productos con stock bajo y rotación (unidades vendidas en los últimos dias frente al stock actual)"""
+    stock_bajo = [{'id': p['id'], 'nombre': p['nombre'], 'stock': p['stock'],
+                   'categoria_nombre': p['categoria_nombre']}
+                  for p in (Producto
+                            .select(Producto.id, Producto.nombre, Producto.stock,
+                                    Categoria.nombre.alias('categoria_nombre'))
+                            .join(Categoria, JOIN.LEFT_OUTER)
+                            .where(Producto.stock <= umbral)
+                            .order_by(Producto.stock, Producto.nombre)
+                            .limit(limite)
+                            .dicts())]
+
+    desde = date.today() - timedelta(days=dias - 1)
+    unidades = fn.SUM(ResumenVentasProducto.unidades).alias('unidades')
+    vendidos = (ResumenVentasProducto
+                .select(ResumenVentasProducto.producto_id, unidades)
+                .where((ResumenVentasProducto.fecha >= desde)
+                       & ResumenVentasProducto.estado.in_(estados)
+                       & (ResumenVentasProducto.producto_id != 0))
+                .group_by(ResumenVentasProducto.producto_id)
+                .having(fn.SUM(ResumenVentasProducto.unidades) > 0))
+    rotacion = []
+    for producto_id, nombre, stock, vendidas in (Producto
+                                                 .select(Producto.id, Producto.nombre, Producto.stock, vendidos.c.unidades)
+                                                 .join(vendidos, on=(vendidos.c.producto_id == Producto.id))
+                                                 .order_by(vendidos.c.unidades.desc(), Producto.id)
+                                                 .limit(limite)
+                                                 .tuples()):
+        rotacion.append({
+            'id': producto_id,
+            'nombre': nombre,
+            'stock': stock,
+            'unidades_vendidas': int(vendidas),
+            # Veces que se vendió el stock actual en el período y días que alcanza al ritmo de venta
+            'rotacion': round(vendidas / stock, 2) if stock > 0 else None,
+            'dias_de_inventario': round(stock * dias / vendidas, 1),
+        })
+
+    return {
+        'umbral': umbral,
+        'dias': dias,
+        'desde': desde.isoformat(),
+        'stock_bajo': stock_bajo,
+        'rotacion': rotacion,
+    }
@@ -0,0 +1,232 @@
+"""Hashing de contraseñas con bcrypt y limitación de intentos de login.
+
+bcrypt es deliberadamente lento, así que se ejecuta en un pool de hilos
+acotado: como mucho HASH_MAX_CONCURRENCIA hashes a la vez por proceso y, si
+ya hay HASH_MAX_EN_COLA peticiones esperando, se rechaza de inmediato con
+ServicioOcupado en lugar de acumular workers bloqueados. bcrypt libera el GIL,
+así que con workers de hilos (gthread) las demás peticiones siguen atendiéndose
+mientras se calcula el hash. Con workers gevent los hilos del pool serían
+greenlets y bcrypt bloquearía todo el proceso, así que se usa el pool de
+hilos nativos de gevent.
+
+Los hilos del pool corren con menor prioridad (HASH_NICE, solo Linux): en una
+tormenta de inicios de sesión bcrypt usa la CPU que dejan libre las demás
+peticiones en lugar de repartírsela con ellas, y el catálogo no se frena.
+Mientras espera el hash, la petición devuelve su conexión al pool: si no,
+unos pocos inicios de sesión en cola ocupan todas las conexiones del proceso.
+"""
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+
+import bcrypt
+
+from models import db
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))  # Costo de bcrypt para hashes nuevos
+HASH_MAX_CONCURRENCIA = int(os.environ.get('HASH_MAX_CONCURRENCIA', 2))  # Hashes simultáneos por proceso
+HASH_MAX_EN_COLA = int(os.environ.get('HASH_MAX_EN_COLA', 8))  # Peticiones esperando un hash por proceso
+HASH_ESPERA_MAX = float(os.environ.get('HASH_ESPERA_MAX', 5))  # Segundos máximos esperando el resultado
+HASH_NICE = int(os.environ.get('HASH_NICE', 10))  # Prioridad (nice) de los hilos de bcrypt; 0 = la de las peticiones
+
+LOGIN_MAX_FALLOS_CUENTA = int(os.environ.get('LOGIN_MAX_FALLOS_CUENTA', 5))  # Fallos por correo en la ventana (límite principal)
+LOGIN_MAX_POR_IP = int(os.environ.get('LOGIN_MAX_POR_IP', 20))  # Fallos por IP en la ventana (probar muchas cuentas)
+LOGIN_VENTANA_SEG = int(os.environ.get('LOGIN_VENTANA_SEG', 300))
+LIMITADOR_MAX_CLAVES = 10000  # Evita que correos/IPs aleatorios hagan crecer la memoria sin límite
+
+
+class ServicioOcupado(Exception):
+    """No hay capacidad para calcular más hashes en este momento"""
+
+
+_ejecutor = ThreadPoolExecutor(max_workers=HASH_MAX_CONCURRENCIA, thread_name_prefix='bcrypt')
+_cupos = threading.BoundedSemaphore(HASH_MAX_CONCURRENCIA + HASH_MAX_EN_COLA)
+
+_estadisticas_lock = threading.Lock()
+_estadisticas = {
+    'hashes': 0,
+    'verificaciones': 0,
+    'rehashes': 0,
+    'rechazos_ocupado': 0,
+    'tiempo_total_seg': 0.0,
+}
+
+
+def _contar(clave, cantidad=1):
+    with _estadisticas_lock:
+        _estadisticas[clave] += cantidad
+
+
+_hilos_con_prioridad = threading.local()
+
+
+def _con_prioridad_baja(funcion, *args):
+    """Ejecutar funcion en el hilo actual del pool, bajándole la prioridad la primera vez"""
+    if HASH_NICE and not getattr(_hilos_con_prioridad, 'ajustado', False):
+        _hilos_con_prioridad.ajustado = True
+        try:
+            # En Linux cada hilo tiene su propio nice: esto no afecta a los hilos de las peticiones
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), HASH_NICE)
+        except (AttributeError, OSError):
+            pass
+    return funcion(*args)
+
+
+def _gevent_activo():
+    """True si el proceso corre con monkey patching de gevent (servidor_gevent.py)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+_pool_gevent = None
+
+
+def _liberar_cupo(_):
+    _cupos.release()
+
+
+def _calcular_gevent(funcion, *args):
+    global _pool_gevent
+    import gevent
+    from gevent.threadpool import ThreadPool
+    if _pool_gevent is None:
+        _pool_gevent = ThreadPool(HASH_MAX_CONCURRENCIA)
+    try:
+        resultado = _pool_gevent.spawn(_con_prioridad_baja, funcion, *args)
+    except BaseException:
+        _cupos.release()
+        raise
+    resultado.rawlink(_liberar_cupo)
+    try:
+        return resultado.get(timeout=HASH_ESPERA_MAX)
+    except gevent.Timeout:
+        raise FuturoTimeout()
+
+
+def _calcular(funcion, *args):
+    """Calcular funcion en el pool. El cupo se libera cuando el cálculo termina o se cancela,
+    no cuando quien espera se rinde: un hash que sigue en curso sigue ocupando su lugar."""
+    if _gevent_activo():
+        return _calcular_gevent(funcion, *args)
+    try:
+        futuro = _ejecutor.submit(_con_prioridad_baja, funcion, *args)
+    except BaseException:
+        _cupos.release()
+        raise
+    futuro.add_done_callback(_liberar_cupo)
+    try:
+        return futuro.result(timeout=HASH_ESPERA_MAX)
+    except FuturoTimeout:
+        # Si aún no empezó se descarta; si ya corre, el cupo se libera al terminar
+        futuro.cancel()
+        raise
+
+
+def _ejecutar(funcion, *args):
+    """Ejecutar funcion en el pool de bcrypt respetando el límite de la cola"""
+    if not _cupos.acquire(blocking=False):
+        _contar('rechazos_ocupado')
+        raise ServicioOcupado('Demasiadas solicitudes de autenticación. Intenta de nuevo en unos segundos.')
+    # Devolver la conexión al pool durante el hash; la próxima consulta la vuelve a abrir (autoconnect)
+    if not db.is_closed() and not db.in_transaction():
+        db.close()
+    inicio = time.perf_counter()
+    try:
+        return _calcular(funcion, *args)
+    except FuturoTimeout:
+        _contar('rechazos_ocupado')
+        raise ServicioOcupado('El servicio de autenticación está ocupado. Intenta de nuevo en unos segundos.')
+    finally:
+        _contar('tiempo_total_seg', time.perf_counter() - inicio)
+
+
+def hashear_contraseña(contraseña):
+    """Retornar el hash bcrypt (str) de la contraseña con el costo configurado"""
+    _contar('hashes')
+    return _ejecutar(
+        lambda: bcrypt.hashpw(contraseña.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+    )
+
+
+def verificar_contraseña(contraseña, contraseña_hash):
+    """Comprobar la contraseña contra su hash bcrypt"""
+    _contar('verificaciones')
+    return _ejecutar(
+        lambda: bcrypt.checkpw(contraseña.encode('utf-8'), contraseña_hash.encode('utf-8'))
+    )
+
+
+def necesita_rehash(contraseña_hash):
+    """True si el hash se generó con un costo distinto al configurado ($2b$<costo>$...)"""
+    try:
+        return int(contraseña_hash.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+def contar_rehash():
+    _contar('rehashes')
+
+
+def estadisticas_hash():
+    with _estadisticas_lock:
+        return dict(_estadisticas)
+
+
+class LimitadorIntentos:
+    """Ventana deslizante en memoria de intentos por clave (IP o correo), por proceso"""
+
+    def __init__(self, maximo, ventana_seg):
+        self.maximo = maximo
+        self.ventana_seg = ventana_seg
+        self._intentos = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def _purgar(self, intentos, ahora):
+        while intentos and intentos[0] <= ahora - self.ventana_seg:
+            intentos.popleft()
+
+    def bloqueado(self, clave):
+        """Retornar los segundos a esperar si la clave superó el máximo, o 0"""
+        ahora = time.monotonic()
+        with self._lock:
+            intentos = self._intentos.get(clave)
+            if not intentos:
+                return 0
+            self._purgar(intentos, ahora)
+            if len(intentos) < self.maximo:
+                if not intentos:
+                    del self._intentos[clave]
+                return 0
+            return int(intentos[0] + self.ventana_seg - ahora) + 1
+
+    def registrar(self, clave):
+        with self._lock:
+            if clave not in self._intentos and len(self._intentos) >= LIMITADOR_MAX_CLAVES:
+                self._descartar_vencidas()
+            intentos = self._intentos[clave]
+            self._purgar(intentos, time.monotonic())
+            intentos.append(time.monotonic())
+
+    def _descartar_vencidas(self):
+        ahora = time.monotonic()
+        for clave in list(self._intentos):
+            self._purgar(self._intentos[clave], ahora)
+            if not self._intentos[clave]:
+                del self._intentos[clave]
+        # Si todas siguen vigentes, descartar las más antiguas
+        while len(self._intentos) >= LIMITADOR_MAX_CLAVES:
+            del self._intentos[next(iter(self._intentos))]
+
+    def limpiar(self, clave):
+        with self._lock:
+            self._intentos.pop(clave, None)
+
+
+limitador_ip = LimitadorIntentos(LOGIN_MAX_POR_IP, LOGIN_VENTANA_SEG)
+limitador_cuenta = LimitadorIntentos(LOGIN_MAX_FALLOS_CUENTA, LOGIN_VENTANA_SEG)
@@ -0,0 +1,65 @@
+"""Serialización JSON rápida y respuestas JSON en stream.
+
+Si orjson está instalado se usa como codificador de Flask (app.json); si no,
+se mantiene el codificador estándar. JSON_RAPIDO=0 fuerza el estándar. La
+salida es equivalente a la de Flask: claves ordenadas y fechas en formato HTTP.
+"""
+import os
+
+from flask import Response, current_app, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional
+    orjson = None
+
+JSON_RAPIDO = os.environ.get('JSON_RAPIDO', '1') != '0'
+
+
+class ProveedorJSONRapido(DefaultJSONProvider):
+    """Proveedor JSON de Flask basado en orjson"""
+
+    # Las fechas pasan por default() para conservar el formato de Flask
+    opciones = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                if orjson else 0)
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.opciones).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        cuerpo = orjson.dumps(obj, default=self.default, option=self.opciones)
+        return self._app.response_class(cuerpo, mimetype=self.mimetype)
+
+
+def configurar_json(app):
+    """Instalar el proveedor JSON rápido en la app si orjson está disponible"""
+    if orjson is not None and JSON_RAPIDO:
+        app.json = ProveedorJSONRapido(app)
+    return app.json
+
+
+def respuesta_json_en_stream(paginas):
+    """Responder un arreglo JSON enviando cada página a medida que se genera.
+
+    paginas es un iterable de listas de dicts (por ejemplo, lotes de una
+    consulta paginada por cursor), de modo que en memoria solo hay un lote a la
+    vez sin importar el tamaño de la tabla.
+    """
+    def generar():
+        dumps = current_app.json.dumps
+        yield '['
+        primero = True
+        for filas in paginas:
+            if not filas:
+                continue
+            fragmento = ','.join(dumps(fila) for fila in filas)
+            yield fragmento if primero else ',' + fragmento
+            primero = False
+        yield ']'
+
+    return Response(stream_with_context(generar()), mimetype='application/json')
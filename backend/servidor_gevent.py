@@ -0,0 +1,31 @@
+"""Punto de entrada WSGI para workers gevent (muchas peticiones concurrentes por proceso).
+
+Aplica monkey patching antes de importar la aplicación, de modo que el estado
+de conexión de Peewee (threading.local), el lock del pool y las esperas por
+una conexión libre sean por greenlet y cooperativos. Con PostgreSQL,
+psycogreen hace que psycopg2 ceda el control mientras espera al servidor.
+
+Uso:
+    GUNICORN_WORKER_CLASS=gevent gunicorn servidor_gevent:app
+
+gunicorn.conf.py usa este módulo automáticamente cuando el worker es gevent.
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+try:
+    # Peewee usa psycopg2cffi como psycopg2 si es el que está instalado
+    from psycopg2cffi import compat
+    compat.register()
+except ImportError:
+    pass
+
+try:
+    from psycogreen.gevent import patch_psycopg
+except ImportError:  # psycogreen y psycopg2 solo hacen falta con PostgreSQL
+    pass
+else:
+    patch_psycopg()
+
+from app import app  # noqa: E402
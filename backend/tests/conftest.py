@@ -0,0 +1,105 @@
+"""Configuración común de las pruebas (python -m pytest desde backend/).
+
+Las pruebas usan una base SQLite nueva en un directorio temporal, o el
+PostgreSQL de DATABASE_URL si está definida (usar una base dedicada: las
+pruebas crean usuarios, productos y pedidos).
+"""
+import itertools
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+# models.py crea supermercado.db en el directorio actual al importarse
+if not os.environ.get('DATABASE_URL'):
+    os.chdir(tempfile.mkdtemp(prefix='supermercado-pruebas-'))
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+from models import init_db  # noqa: E402
+
+init_db()
+
+from app import app as aplicacion  # noqa: E402
+
+CORREO_ADMIN = 'admin@inversionesledezma.com'
+CONTRASEÑA = 'pruebas123'
+_secuencia = itertools.count(1)
+
+
+def iniciar_sesion(cliente, correo, contraseña=CONTRASEÑA):
+    """Registrar la cuenta (o iniciar sesión si ya existe) en el cliente de pruebas"""
+    respuesta = cliente.post('/api/register', json={'correo': correo, 'contraseña': contraseña})
+    if respuesta.status_code != 201:
+        respuesta = cliente.post('/api/login', json={'correo': correo, 'contraseña': contraseña})
+    assert respuesta.status_code in (200, 201), respuesta.get_json()
+    return respuesta.get_json()['usuario_id']
+
+
+def nombre_unico(prefijo):
+    return f'{prefijo} {uuid.uuid4().hex[:8]} {next(_secuencia)}'
+
+
+@pytest.fixture(scope='session')
+def app():
+    aplicacion.config['TESTING'] = True
+    return aplicacion
+
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope='session')
+def admin(app):
+    """Cliente con la sesión del administrador"""
+    cliente = app.test_client()
+    iniciar_sesion(cliente, CORREO_ADMIN)
+    return cliente
+
+
+@pytest.fixture
+def nuevo_usuario(app):
+    """Crear clientes con la sesión de un usuario nuevo: nuevo_usuario() -> cliente"""
+    def crear():
+        cliente = app.test_client()
+        cliente.usuario_id = iniciar_sesion(cliente, f'{uuid.uuid4().hex[:12]}@pruebas.local')
+        return cliente
+    return crear
+
+
+@pytest.fixture
+def nuevo_producto(admin):
+    """Crear productos con el administrador: nuevo_producto(stock=10, precio=1.5, categoria_id=None) -> id"""
+    def crear(stock=10, precio=1.5, categoria_id=None, nombre=None):
+        respuesta = admin.post('/api/productos', json={
+            'nombre': nombre or nombre_unico('Producto de prueba'),
+            'precio': precio,
+            'stock': stock,
+            'categoria_id': categoria_id,
+        })
+        assert respuesta.status_code == 201, respuesta.get_json()
+        return respuesta.get_json()['id']
+    return crear
+
+
+@pytest.fixture
+def nueva_categoria(admin):
+    def crear():
+        respuesta = admin.post('/api/categorias', json={'nombre': nombre_unico('Categoría de prueba')})
+        assert respuesta.status_code == 201, respuesta.get_json()
+        return respuesta.get_json()['id']
+    return crear
+
+
+def comprar(cliente, carrito):
+    """POST /api/pedido con carrito = {producto_id: cantidad}"""
+    return cliente.post('/api/pedido', json={
+        'carrito': [{'id': producto_id, 'cantidad': cantidad} for producto_id, cantidad in carrito.items()],
+        'direccion_pedido': 'Calle de prueba',
+    })
@@ -0,0 +1,51 @@
+"""Índice de búsqueda de productos: altas, cambios, bajas y la migración al rowid."""
+import uuid
+
+import pytest
+
+from busqueda import (TABLA_BUSQUEDA, buscar_ids, crear_indice_busqueda, es_postgres,
+                      indice_con_columna_producto_id, reconstruir_indice)
+from migraciones import indice_busqueda_por_rowid
+from models import db
+
+
+def buscar(cliente, texto):
+    respuesta = cliente.get(f'/api/productos/buscar?q={texto}')
+    assert respuesta.status_code == 200, respuesta.get_json()
+    return [p['id'] for p in respuesta.get_json()]
+
+
+def test_editar_y_eliminar_actualizan_el_indice(admin, nuevo_producto):
+    antes, despues = f'zafiro{uuid.uuid4().hex[:8]}', f'topacio{uuid.uuid4().hex[:8]}'
+    producto_id = nuevo_producto(nombre=f'Collar {antes}')
+    assert buscar(admin, antes) == [producto_id]
+
+    respuesta = admin.put(f'/api/productos/{producto_id}', json={'nombre': f'Collar {despues}'})
+    assert respuesta.status_code == 200, respuesta.get_json()
+    assert buscar(admin, antes) == []
+    assert buscar(admin, despues) == [producto_id]
+
+    assert admin.delete(f'/api/productos/{producto_id}').status_code == 200
+    assert buscar(admin, despues) == []
+
+
+@pytest.mark.skipif(es_postgres(), reason='solo el índice FTS5 de SQLite cambió de formato')
+def test_migracion_rehace_el_indice_con_columna_producto_id(nuevo_producto):
+    nombre = f'rubi{uuid.uuid4().hex[:8]}'
+    producto_id = nuevo_producto(nombre=f'Anillo {nombre}')
+    # El índice como lo creaban las versiones anteriores
+    db.execute_sql(f'DROP TABLE {TABLA_BUSQUEDA}')
+    db.execute_sql(f'CREATE VIRTUAL TABLE {TABLA_BUSQUEDA} USING fts5('
+                   "producto_id UNINDEXED, documento, tokenize='unicode61 remove_diacritics 2')")
+    assert indice_con_columna_producto_id()
+    try:
+        indice_busqueda_por_rowid(None)
+    finally:
+        if indice_con_columna_producto_id():
+            # Dejar el índice como lo esperan las demás pruebas
+            db.execute_sql(f'DROP TABLE {TABLA_BUSQUEDA}')
+            crear_indice_busqueda()
+            reconstruir_indice()
+
+    assert not indice_con_columna_producto_id()
+    assert buscar_ids(nombre) == [producto_id]
@@ -0,0 +1,49 @@
+"""Invalidación del usuario de la sesión en caché (cache_usuarios) entre workers.
+
+Otro worker que modifica un usuario publica la invalidación por el canal de
+eventos en su transacción; este worker debe ver el cambio al recibirla, sin
+esperar CACHE_USUARIOS_TTL.
+"""
+import time
+
+from cache import cache_usuarios
+from eventos import central_eventos
+from models import db, Usuario
+
+
+def esperar(condicion, segundos=10):
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        if condicion():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_cambio_en_otro_worker_llega_por_el_canal(nuevo_usuario):
+    central_eventos.iniciar()
+    assert central_eventos.escuchando.wait(10)
+    cliente = nuevo_usuario()
+    assert cliente.get('/api/pedidos').status_code == 403
+    assert cache_usuarios.obtener(cliente.usuario_id) is not None
+
+    # Lo que hace otro worker: modificar el usuario y publicar el aviso en la misma transacción
+    with db.atomic():
+        Usuario.update(is_admin=True).where(Usuario.id == cliente.usuario_id).execute()
+        central_eventos.publicar({'tipo': 'cache', 'nombre': 'usuarios', 'clave': cliente.usuario_id})
+
+    assert esperar(lambda: cache_usuarios.obtener(cliente.usuario_id) is None)
+    assert cliente.get('/api/pedidos').status_code == 200
+
+
+def test_no_guarda_lo_leido_antes_de_un_aviso():
+    generacion = cache_usuarios.generacion()
+    cache_usuarios._recibir_aviso({'tipo': 'cache', 'nombre': 'usuarios', 'clave': -1})
+    cache_usuarios.guardar(-1, {'id': -1}, generacion)
+    assert cache_usuarios.obtener(-1) is None
+
+
+def test_reconexion_del_canal_vacia_la_cache():
+    cache_usuarios.guardar(-2, {'id': -2})
+    cache_usuarios._recibir_aviso(None)
+    assert cache_usuarios.obtener(-2) is None
@@ -0,0 +1,144 @@
+"""Cantidad de consultas SQL por petición en los endpoints más usados.
+
+Cada endpoint debe hacer un número fijo de consultas, sin importar cuántos
+productos, categorías, pedidos o líneas devuelva: si vuelve un N+1 (una
+consulta por fila) estas pruebas fallan. Las consultas se cuentan con el
+mismo observador que usan /metrics y el perfilado (ConsultasObservadasMixin).
+"""
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from cache import cache_catalogo, cache_usuarios
+from conftest import comprar
+from eventos import central_eventos
+from models import observadores_sql
+
+
+@contextmanager
+def consultas_sql():
+    """Lista de las consultas que ejecuta este hilo (el del cliente de pruebas) dentro del bloque"""
+    hilo = threading.get_ident()
+    consultas = []
+
+    def observador(sql, params, duracion):
+        if threading.get_ident() == hilo:
+            consultas.append(sql)
+
+    observadores_sql.append(observador)
+    try:
+        yield consultas
+    finally:
+        observadores_sql.remove(observador)
+
+
+def contar(cliente, ruta):
+    with consultas_sql() as consultas:
+        respuesta = cliente.get(ruta)
+    assert respuesta.status_code == 200, respuesta.get_json()
+    return len(consultas)
+
+
+@pytest.fixture(autouse=True)
+def caches_estables():
+    """La versión de la tasa queda en memoria mientras el canal de eventos escucha;
+    sin esto, la primera petición haría una consulta más"""
+    central_eventos.iniciar()
+    assert central_eventos.escuchando.wait(10)
+    cache_catalogo.limpiar()
+    cache_usuarios.limpiar()
+
+
+def sin_cache(cliente, ruta):
+    """Consultas de la ruta calculada desde la base (sin la respuesta en caché del catálogo)"""
+    cliente.get('/api/configuracion/tasa')  # Deja la versión de la tasa en memoria
+    cache_catalogo.limpiar()
+    return contar(cliente, ruta)
+
+
+# ruta -> consultas sin la respuesta en caché
+CONSULTAS_CATALOGO = {
+    '/api/productos': 2,  # versión del catálogo + productos con su categoría (JOIN)
+    '/api/productos?limite=5&sort=-precio': 2,
+    '/api/productos?categoria_id=sin-categoria&precio_max=3': 2,
+    '/api/productos?bs=1': 3,  # + tasa BCV
+    '/api/productos/buscar?q=prueba': 3,  # versión + índice de búsqueda + productos
+    '/api/productos/cambios?desde=0': 4,  # versión (caché) + versión (sincronización) + productos + categorías
+    '/api/categorias': 2,
+}
+
+# Rutas que no se guardan en caché: dependen del stock vigente
+CONSULTAS_STOCK = {
+    '/api/productos?en_stock=1': 1,
+    '/api/productos/stock': 1,
+    '/api/productos/stock?ids=1,2,3': 1,
+}
+
+CONSULTAS_PEDIDOS = {
+    '/api/pedidos/mis-pedidos': 2,  # pedidos + líneas de todos los pedidos (prefetch)
+    '/api/pedidos': 2,  # pedidos con su usuario (JOIN) + líneas
+    '/api/pedidos?limite=50': 2,
+    '/api/pedidos?estado=Pendiente&limite=5': 2,
+}
+
+
+@pytest.fixture(scope='module')
+def catalogo_con_datos(admin):
+    """Varias categorías con varios productos cada una"""
+    for i in range(3):
+        categoria = admin.post('/api/categorias', json={'nombre': f'Categoría consultas {i}'}).get_json()
+        for j in range(4):
+            respuesta = admin.post('/api/productos', json={
+                'nombre': f'Producto de prueba consultas {i}-{j}', 'precio': 1 + j, 'stock': 5,
+                'categoria_id': categoria['id']})
+            assert respuesta.status_code == 201
+
+
+@pytest.mark.parametrize('ruta', CONSULTAS_CATALOGO)
+def test_catalogo_sin_cache(cliente, catalogo_con_datos, ruta):
+    assert sin_cache(cliente, ruta) == CONSULTAS_CATALOGO[ruta]
+
+
+@pytest.mark.parametrize('ruta', CONSULTAS_CATALOGO)
+def test_catalogo_en_cache_solo_lee_la_version(cliente, catalogo_con_datos, ruta):
+    sin_cache(cliente, ruta)
+    assert contar(cliente, ruta) == 1
+
+
+@pytest.mark.parametrize('ruta', CONSULTAS_STOCK)
+def test_stock_sin_cache(cliente, catalogo_con_datos, ruta):
+    for _ in range(2):
+        assert contar(cliente, ruta) == CONSULTAS_STOCK[ruta]
+
+
+def test_compra_no_invalida_el_catalogo(cliente, nuevo_usuario, nuevo_producto):
+    producto_id = nuevo_producto(stock=10)
+    sin_cache(cliente, '/api/productos')
+    assert comprar(nuevo_usuario(), {producto_id: 3}).status_code == 201
+
+    assert contar(cliente, '/api/productos') == 1
+    assert cliente.get(f'/api/productos/stock?ids={producto_id}').get_json() == {str(producto_id): 7}
+
+
+@pytest.mark.parametrize('ruta', CONSULTAS_PEDIDOS)
+def test_pedidos_no_dependen_de_la_cantidad(admin, nuevo_usuario, nuevo_producto, ruta):
+    cliente = nuevo_usuario() if 'mis-pedidos' in ruta else admin
+    comprador = cliente if cliente is not admin else nuevo_usuario()
+    ids = [nuevo_producto(stock=100) for _ in range(3)]
+    assert comprar(comprador, {ids[0]: 1}).status_code == 201
+    # La primera petición carga el usuario de la sesión (Flask-Login); luego queda en caché
+    cliente.get('/api/usuario/actual')
+    assert contar(cliente, ruta) == CONSULTAS_PEDIDOS[ruta]
+
+    for _ in range(3):
+        assert comprar(comprador, {producto_id: 2 for producto_id in ids}).status_code == 201
+    assert contar(cliente, ruta) == CONSULTAS_PEDIDOS[ruta]
+
+
+def test_compra_usa_la_tasa_en_memoria(cliente, nuevo_usuario, nuevo_producto):
+    comprador, producto_id = nuevo_usuario(), nuevo_producto(stock=10)
+    cliente.get('/api/configuracion/tasa')  # Deja la tasa en memoria
+    with consultas_sql() as consultas:
+        assert comprar(comprador, {producto_id: 1}).status_code == 201
+    assert not [sql for sql in consultas if 'configuracion' in sql.lower()], consultas
@@ -0,0 +1,32 @@
+"""Inicio de sesión: límite de intentos por IP y hashing de contraseñas."""
+from models import db, Usuario
+from seguridad import LOGIN_MAX_POR_IP, hashear_contraseña, limitador_ip, verificar_contraseña
+
+IP = '198.51.100.7'
+
+
+def test_x_forwarded_for_no_evita_el_limite_por_ip(cliente):
+    """Sin PROXY_X_FOR la IP es la de la conexión: cambiar X-Forwarded-For no reinicia el límite"""
+    try:
+        codigos = []
+        for i in range(LOGIN_MAX_POR_IP + 1):
+            respuesta = cliente.post('/api/login', json={'correo': f'nadie{i}@pruebas.local', 'contraseña': 'x' * 8},
+                                     headers={'X-Forwarded-For': f'203.0.113.{i}'},
+                                     environ_base={'REMOTE_ADDR': IP})
+            codigos.append(respuesta.status_code)
+    finally:
+        limitador_ip.limpiar(IP)
+
+    assert codigos == [401] * LOGIN_MAX_POR_IP + [429]
+
+
+def test_el_hash_no_retiene_la_conexion():
+    """Mientras bcrypt calcula, la conexión vuelve al pool (salvo dentro de una transacción)"""
+    db.connect(reuse_if_open=True)
+    contraseña_hash = hashear_contraseña('secreta123')
+    assert db.is_closed()
+    Usuario.select().count()  # la siguiente consulta vuelve a conectar
+    assert not db.is_closed()
+    with db.atomic():
+        assert verificar_contraseña('secreta123', contraseña_hash)
+        assert not db.is_closed()
@@ -0,0 +1,39 @@
+"""Acceso a /metrics: token de Prometheus, sesión de administrador o apertura explícita."""
+import pytest
+
+import app as modulo_app
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(modulo_app, 'METRICAS_TOKEN', 'token-de-pruebas')
+    return 'token-de-pruebas'
+
+
+def test_sin_credenciales_no_autorizado(cliente, token):
+    assert cliente.get('/metrics').status_code == 401
+    assert cliente.get('/metrics', headers={'Authorization': 'Bearer otro'}).status_code == 401
+
+
+def test_sin_token_configurado_no_queda_abierta(cliente, monkeypatch):
+    monkeypatch.setattr(modulo_app, 'METRICAS_TOKEN', None)
+    assert cliente.get('/metrics', headers={'Authorization': 'Bearer '}).status_code == 401
+
+
+def test_usuario_sin_permisos(nuevo_usuario, token):
+    assert nuevo_usuario().get('/metrics').status_code == 401
+
+
+def test_con_token(cliente, token):
+    respuesta = cliente.get('/metrics', headers={'Authorization': f'Bearer {token}'})
+    assert respuesta.status_code == 200
+    assert 'http_peticiones_total' in respuesta.get_data(as_text=True)
+
+
+def test_con_sesion_de_administrador(admin):
+    assert admin.get('/metrics').status_code == 200
+
+
+def test_abierta_solo_con_metricas_publicas(cliente, monkeypatch):
+    monkeypatch.setattr(modulo_app, 'METRICAS_PUBLICAS', True)
+    assert cliente.get('/metrics').status_code == 200
@@ -0,0 +1,115 @@
+"""Migraciones: datos iniciales (0006) y actualización de una base anterior a las migraciones."""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from conftest import BACKEND
+
+from migraciones import datos_iniciales
+from models import db, Categoria, Producto
+
+
+@pytest.mark.parametrize('nombre, categoria', [
+    ('Leche Condensada', 'Lácteos'),
+    ('Pan Canilla', 'Panadería'),
+    ('Pasta Corta', 'Granos y Pastas'),
+    # Como el `in` de Python de la versión anterior: distingue mayúsculas
+    ('leche de coco', 'Sin Categoría'),
+    ('Empanada', 'Sin Categoría'),
+    ('PAN DE AÑO', 'Sin Categoría'),
+])
+def test_categoria_segun_el_nombre(nombre, categoria):
+    with db.atomic() as transaccion:
+        producto_id = Producto.insert(nombre=nombre, precio=1, stock=1, categoria_id=None).execute()
+        datos_iniciales(None)
+        asignada = Categoria.get_by_id(Producto.get_by_id(producto_id).categoria_id_id).nombre
+        transaccion.rollback()
+    assert asignada == categoria
+
+
+# Esquema de la versión anterior a las migraciones, como lo creaba su create_tables
+ESQUEMA_ANTERIOR = '''
+CREATE TABLE "categorias" ("id" INTEGER NOT NULL PRIMARY KEY, "nombre" VARCHAR(100) NOT NULL);
+CREATE UNIQUE INDEX "categoria_nombre" ON "categorias" ("nombre");
+CREATE TABLE "configuracion" ("id" INTEGER NOT NULL PRIMARY KEY, "tasa_bcv" REAL NOT NULL);
+CREATE TABLE "usuarios" ("id" INTEGER NOT NULL PRIMARY KEY, "correo" VARCHAR(100) NOT NULL,
+    "contraseña_hash" VARCHAR(255) NOT NULL, "is_admin" INTEGER NOT NULL, "nombre_usuario" VARCHAR(100),
+    "direccion_principal" TEXT);
+CREATE UNIQUE INDEX "usuario_correo" ON "usuarios" ("correo");
+CREATE TABLE "pedidos" ("id" INTEGER NOT NULL PRIMARY KEY, "usuario_id" INTEGER, "total" REAL NOT NULL,
+    "productos_json" TEXT NOT NULL, "estado" VARCHAR(50) NOT NULL, "fecha_creacion" DATETIME,
+    "referencia_pago" TEXT, "fecha_confirmacion" DATETIME, "motivo_rechazo" TEXT, "direccion_pedido" TEXT,
+    FOREIGN KEY ("usuario_id") REFERENCES "usuarios" ("id"));
+CREATE INDEX "pedido_usuario_id" ON "pedidos" ("usuario_id");
+CREATE TABLE "productos" ("id" INTEGER NOT NULL PRIMARY KEY, "nombre" VARCHAR(100) NOT NULL,
+    "precio" REAL NOT NULL, "stock" INTEGER NOT NULL, "imagen_url" VARCHAR(500), "categoria_id" INTEGER,
+    FOREIGN KEY ("categoria_id") REFERENCES "categorias" ("id") ON DELETE SET NULL);
+CREATE INDEX "producto_categoria_id" ON "productos" ("categoria_id");
+INSERT INTO configuracion VALUES (1, 40.5);
+INSERT INTO categorias VALUES (1, 'Lácteos');
+INSERT INTO productos VALUES (1, 'Leche Entera 1L', 2.5, 50, NULL, 1);
+INSERT INTO usuarios VALUES (1, 'cliente@pruebas.local', 'x', 0, NULL, NULL);
+INSERT INTO pedidos VALUES (1, 1, 5.0, '[{"id": 1, "nombre": "Leche Entera 1L", "precio": 2.5, "cantidad": 2}]',
+    'Pendiente', '2024-01-02 10:00:00', NULL, NULL, NULL, 'Calle 1');
+'''
+
+# En un proceso aparte (models.py elige la base al importarse): actualizar la base del
+# directorio actual, crear otra con los modelos actuales para comparar y probar el catálogo
+ACTUALIZAR = '''
+import json
+from peewee import SqliteDatabase
+from models import (init_db, Usuario, Categoria, Producto, Pedido, PedidoItem, Configuracion, VersionCache,
+                    CatalogoEliminado, EventoPedido, ResumenVentasDia, ResumenVentasProducto)
+init_db()
+modelos = [Usuario, Categoria, Producto, Pedido, PedidoItem, Configuracion, VersionCache, CatalogoEliminado,
+           EventoPedido, ResumenVentasDia, ResumenVentasProducto]
+referencia = SqliteDatabase('modelos.db')
+with referencia.bind_ctx(modelos):
+    referencia.create_tables(modelos)
+from app import app
+cliente = app.test_client()
+print(json.dumps({ruta: cliente.get(ruta).get_json()
+                  for ruta in ('/api/productos', '/api/productos/buscar?q=leche', '/api/configuracion/tasa')}))
+'''
+
+
+def esquema(ruta, tablas=None):
+    """{tabla: (columnas, {(columnas del índice, único)})} de una base SQLite"""
+    conexion = sqlite3.connect(ruta)
+    try:
+        assert conexion.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+        if tablas is None:
+            tablas = [fila[0] for fila in conexion.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        resultado = {}
+        for tabla in tablas:
+            columnas = {fila[1] for fila in conexion.execute(f'PRAGMA table_info("{tabla}")')}
+            indices = {(tuple(fila[2] for fila in conexion.execute(f'PRAGMA index_info("{indice[1]}")')), bool(indice[2]))
+                       for indice in conexion.execute(f'PRAGMA index_list("{tabla}")')}
+            resultado[tabla] = (columnas, indices)
+        return resultado
+    finally:
+        conexion.close()
+
+
+def test_base_anterior_a_las_migraciones_llega_a_la_ultima_version(tmp_path):
+    conexion = sqlite3.connect(tmp_path / 'supermercado.db')
+    conexion.executescript(ESQUEMA_ANTERIOR)
+    conexion.close()
+    entorno = {k: v for k, v in os.environ.items() if k != 'DATABASE_URL'}
+    entorno['PYTHONPATH'] = BACKEND
+
+    salida = subprocess.run([sys.executable, '-c', ACTUALIZAR], cwd=tmp_path, env=entorno,
+                            capture_output=True, text=True, timeout=120)
+    assert salida.returncode == 0, salida.stdout + salida.stderr
+    respuestas = json.loads(salida.stdout.strip().splitlines()[-1])
+
+    # Cada tabla de los modelos con todas sus columnas e índices, sin corromper la base
+    referencia = esquema(tmp_path / 'modelos.db')
+    assert esquema(tmp_path / 'supermercado.db', list(referencia)) == referencia
+    assert [p['nombre'] for p in respuestas['/api/productos']] == ['Leche Entera 1L']
+    assert [p['id'] for p in respuestas['/api/productos/buscar?q=leche']] == [1]
+    assert respuestas['/api/configuracion/tasa']['tasa_bcv'] == 40.5
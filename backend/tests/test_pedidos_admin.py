@@ -0,0 +1,62 @@
+"""Listado de pedidos del panel de administración paginado por cursor."""
+from busqueda import es_postgres
+from conftest import comprar
+from models import db, Pedido
+
+
+def recorrer_paginas(admin, ruta):
+    """Seguir siguiente_cursor hasta el final; retorna los ids en orden"""
+    ids, cursor = [], None
+    while True:
+        respuesta = admin.get(ruta + (f'&cursor={cursor}' if cursor else ''))
+        assert respuesta.status_code == 200, respuesta.get_json()
+        data = respuesta.get_json()
+        ids += [p['id'] for p in data['pedidos']]
+        cursor = data['siguiente_cursor']
+        if not cursor:
+            return ids
+
+
+def test_sin_limite_devuelve_la_primera_pagina(admin):
+    data = admin.get('/api/pedidos').get_json()
+    assert set(data) == {'pedidos', 'siguiente_cursor'}
+    assert len(data['pedidos']) <= 50
+
+
+def test_paginas_sin_repetidos_ni_huecos(admin, nuevo_usuario, nuevo_producto):
+    comprador, producto_id = nuevo_usuario(), nuevo_producto(stock=100)
+    nuevos = [comprar(comprador, {producto_id: 1}).get_json()['id'] for _ in range(5)]
+
+    ids = recorrer_paginas(admin, '/api/pedidos?limite=2')
+
+    assert len(ids) == len(set(ids))
+    # Más recientes primero: los pedidos recién creados encabezan la lista, del último al primero
+    assert ids[:5] == nuevos[::-1]
+    assert ids == recorrer_paginas(admin, '/api/pedidos?limite=200')
+
+
+def test_pedidos_sin_fecha(admin, nuevo_usuario, nuevo_producto):
+    """Los pedidos sin fecha_creacion (creados fuera de la aplicación) también se paginan"""
+    comprador, producto_id = nuevo_usuario(), nuevo_producto(stock=100)
+    nuevos = [comprar(comprador, {producto_id: 1}).get_json()['id'] for _ in range(4)]
+    sin_fecha = nuevos[:2]
+    fechas = dict(Pedido.select(Pedido.id, Pedido.fecha_creacion).where(Pedido.id.in_(sin_fecha)).tuples())
+    Pedido.update(fecha_creacion=None).where(Pedido.id.in_(sin_fecha)).execute()
+    try:
+        ids = recorrer_paginas(admin, '/api/pedidos?limite=1')
+        mis_pedidos = comprador.get('/api/pedidos/mis-pedidos?stream=1')
+    finally:
+        # Las demás pruebas cuentan con que los pedidos nuevos encabezan la lista
+        with db.atomic():
+            for pedido_id, fecha in fechas.items():
+                Pedido.update(fecha_creacion=fecha).where(Pedido.id == pedido_id).execute()
+
+    assert len(ids) == len(set(ids)) == Pedido.select().count()
+    # Sin fecha van al final en SQLite y al principio en PostgreSQL, del más nuevo al más viejo
+    assert (ids[:2] if es_postgres() else ids[-2:]) == sin_fecha[::-1]
+    assert mis_pedidos.status_code == 200
+    assert sorted(p['id'] for p in mis_pedidos.get_json()) == sorted(nuevos)
+
+
+def test_cursor_invalido(admin):
+    assert admin.get('/api/pedidos?cursor=no-es-un-cursor').status_code == 400
@@ -0,0 +1,17 @@
+"""Planes de ejecución de las consultas frecuentes.
+
+Las consultas se arman con las mismas funciones que los endpoints
+(consultas_frecuentes) y deben resolverse con índices: sin recorrer tablas
+completas ni ordenar las filas aparte. Es la misma revisión que
+`flask --app app migraciones status --explain`.
+"""
+import pytest
+
+from app import consultas_frecuentes
+from migraciones import plan_usa_indice
+
+
+@pytest.mark.parametrize('nombre', consultas_frecuentes())
+def test_consulta_usa_indices(nombre):
+    usa_indice, plan = plan_usa_indice(consultas_frecuentes()[nombre])
+    assert usa_indice, f'{nombre}:\n{plan}'
@@ -0,0 +1,64 @@
+"""Compras simultáneas de las últimas unidades de un producto.
+
+Varios clientes compran a la vez (un hilo por cliente, como los hilos de un
+worker gthread) y el stock nunca debe quedar negativo: exactamente los
+pedidos que caben en el stock se crean y los demás se rechazan. Con
+DATABASE_URL corre contra PostgreSQL (bloqueo de filas con FOR UPDATE).
+"""
+import threading
+
+import pytest
+
+from conftest import comprar
+from models import db, Producto
+
+CLIENTES = 12
+
+
+def stock_actual(producto_id):
+    with db.connection_context():
+        return Producto.get_by_id(producto_id).stock
+
+
+def compras_simultaneas(clientes, carrito):
+    """Lanzar comprar(cliente, carrito) en todos los clientes a la vez; retorna los códigos"""
+    barrera = threading.Barrier(len(clientes))
+    codigos = [None] * len(clientes)
+
+    def comprar_en_hilo(indice, cliente):
+        barrera.wait()
+        codigos[indice] = comprar(cliente, carrito).status_code
+
+    hilos = [threading.Thread(target=comprar_en_hilo, args=(i, cliente)) for i, cliente in enumerate(clientes)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(timeout=60)
+    return codigos
+
+
+@pytest.mark.parametrize('stock, cantidad', [(5, 1), (7, 2), (1, 1)])
+def test_no_se_vende_mas_que_el_stock(nuevo_usuario, nuevo_producto, stock, cantidad):
+    producto_id = nuevo_producto(stock=stock)
+    clientes = [nuevo_usuario() for _ in range(CLIENTES)]
+
+    codigos = compras_simultaneas(clientes, {producto_id: cantidad})
+
+    exitosos = codigos.count(201)
+    assert exitosos == stock // cantidad
+    # Los demás ven stock insuficiente (400) o que otro pedido lo tomó mientras tanto (409)
+    assert all(codigo in (400, 409) for codigo in codigos if codigo != 201), codigos
+    assert stock_actual(producto_id) == stock - exitosos * cantidad >= 0
+
+
+def test_carritos_con_varios_productos(nuevo_usuario, nuevo_producto):
+    """Un pedido descuenta todo su carrito o nada: el stock de cada producto queda consistente"""
+    escaso, abundante = nuevo_producto(stock=3), nuevo_producto(stock=100)
+    clientes = [nuevo_usuario() for _ in range(CLIENTES)]
+
+    codigos = compras_simultaneas(clientes, {abundante: 2, escaso: 1})
+
+    exitosos = codigos.count(201)
+    assert exitosos == 3
+    assert stock_actual(escaso) == 0
+    assert stock_actual(abundante) == 100 - 2 * exitosos
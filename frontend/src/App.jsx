@@ -8,6 +8,7 @@ import Login from './components/Login'
 import Registro from './components/Registro'
 
 const API_BASE_URL = 'https://inversiones-ledezma-ecommerce.onrender.com'
+const CLAVE_CATALOGO = 'catalogo'
 
 function App() {
   const [productos, setProductos] = useState([])
@@ -43,19 +44,66 @@ function App() {
     verificarUsuario()
   }, [])
 
-  // Cargar productos desde la API
-  useEffect(() => {
-    fetch('https://inversiones-ledezma-ecommerce.onrender.com/api/productos')
-      .then(res => res.json())
-      .then(data => {
-        // Verificar que la respuesta sea un array válido
-        setProductos(Array.isArray(data) ? data : [])
-        setLoading(false)
+  // El stock cambia con cada compra y no viene en la sincronización del
+  // catálogo: se pide aparte, sin caché, y se aplica sobre los productos
+  const actualizarStock = () =>
+    fetch(`${API_BASE_URL}/api/productos/stock`)
+      .then(res => (res.ok ? res.json() : null))
+      .then(stock => {
+        if (stock) {
+          setProductos(prev => prev.map(p => (p.id in stock ? { ...p, stock: stock[p.id] } : p)))
+        }
+      })
+      .catch(err => {
+        console.error('Error al cargar el stock:', err)
       })
+
+  // Cargar productos desde la API: se guarda el catálogo en localStorage y
+  // solo se piden los cambios desde la última versión conocida
+  useEffect(() => {
+    let guardado = null
+    try {
+      guardado = JSON.parse(localStorage.getItem(CLAVE_CATALOGO))
+    } catch (err) {
+      guardado = null
+    }
+    const catalogo = guardado && Array.isArray(guardado.productos) ? guardado : { version: 0, productos: [] }
+    if (catalogo.productos.length > 0) {
+      setProductos(catalogo.productos)
+      setLoading(false)
+    }
+
+    const sincronizar = (desde, productosPrevios) =>
+      fetch(`${API_BASE_URL}/api/productos/cambios?desde=${desde}`)
+        .then(res => {
+          // Versión desconocida para el servidor (p. ej. base de datos nueva): cargar todo
+          if (res.status === 409 && desde > 0) {
+            return sincronizar(0, [])
+          }
+          return res.json().then(data => {
+            if (!Array.isArray(data.productos)) {
+              throw new Error(data.error || 'Respuesta inválida')
+            }
+            const eliminados = new Set(data.eliminados ? data.eliminados.productos : [])
+            const porId = new Map(productosPrevios.map(p => [p.id, p]))
+            eliminados.forEach(id => porId.delete(id))
+            data.productos.forEach(p => porId.set(p.id, p))
+            const actualizados = [...porId.values()].sort((a, b) => a.id - b.id)
+            setProductos(actualizados)
+            try {
+              localStorage.setItem(CLAVE_CATALOGO, JSON.stringify({ version: data.version, productos: actualizados }))
+            } catch (err) {
+              console.error('No se pudo guardar el catálogo:', err)
+            }
+          })
+        })
+
+    sincronizar(catalogo.version, catalogo.productos)
+      .then(actualizarStock)
       .catch(err => {
         console.error('Error al cargar productos:', err)
-        setLoading(false)
       })
+      .finally(() => setLoading(false))
   }, [])
 
   // Función para añadir producto al carrito
@@ -111,6 +159,7 @@ function App() {
     setMostrarConfirmacion(true)
     // Limpiar el carrito después de realizar el pedido
     setCarrito([])
+    actualizarStock()
   }
 
   // Funciones de autenticación
@@ -1,10 +1,14 @@
 import { useState, useEffect } from 'react'
 
+const PEDIDOS_POR_PAGINA = 50
+
 function AdminPanel() {
   const [activeTab, setActiveTab] = useState('pedidos') // 'pedidos', 'productos' o 'categorias'
   
   // Estados para pedidos
   const [pedidos, setPedidos] = useState([])
+  const [siguienteCursor, setSiguienteCursor] = useState(null)
+  const [cargandoMas, setCargandoMas] = useState(false)
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState('')
   const [actualizando, setActualizando] = useState({})
@@ -47,6 +51,22 @@ function AdminPanel() {
     cargarTasaBcv()
   }, [])
   
+  // Recibir pedidos nuevos y cambios de estado sin recargar toda la lista
+  useEffect(() => {
+    const eventos = new EventSource('/api/pedidos/eventos', { withCredentials: true })
+    eventos.addEventListener('pedido', (e) => {
+      const data = JSON.parse(e.data)
+      if (data.tipo === 'creado') {
+        cargarRecientes()
+        return
+      }
+      setPedidos(prev => prev.map(p =>
+        p.id === data.pedido_id ? { ...p, estado: data.estado, motivo_rechazo: data.motivo_rechazo } : p
+      ))
+    })
+    return () => eventos.close()
+  }, [])
+  
   // Cargar productos cuando se selecciona la pestaña de productos
   useEffect(() => {
     if (activeTab === 'productos') {
@@ -58,17 +78,27 @@ function AdminPanel() {
     }
   }, [activeTab])
 
+  // Una página de pedidos (más recientes primero) a partir de cursor
+  const pedirPagina = async (cursor = null) => {
+    const params = new URLSearchParams({ limite: PEDIDOS_POR_PAGINA })
+    if (cursor) {
+      params.set('cursor', cursor)
+    }
+    const response = await fetch(`/api/pedidos?${params}`)
+    
+    if (!response.ok) {
+      throw new Error('Error al cargar los pedidos')
+    }
+    
+    return response.json()
+  }
+
   const cargarPedidos = async () => {
     try {
       setLoading(true)
-      const response = await fetch('/api/pedidos')
-      
-      if (!response.ok) {
-        throw new Error('Error al cargar los pedidos')
-      }
-      
-      const data = await response.json()
-      setPedidos(data)
+      const data = await pedirPagina()
+      setPedidos(data.pedidos)
+      setSiguienteCursor(data.siguiente_cursor)
       setError('')
     } catch (err) {
       console.error('Error al cargar pedidos:', err)
@@ -78,6 +108,36 @@ function AdminPanel() {
     }
   }
 
+  const cargarMasPedidos = async () => {
+    try {
+      setCargandoMas(true)
+      const data = await pedirPagina(siguienteCursor)
+      setPedidos(prev => {
+        const ids = new Set(prev.map(p => p.id))
+        return [...prev, ...data.pedidos.filter(p => !ids.has(p.id))]
+      })
+      setSiguienteCursor(data.siguiente_cursor)
+    } catch (err) {
+      console.error('Error al cargar más pedidos:', err)
+      setError('Error al cargar más pedidos. Por favor, intenta de nuevo.')
+    } finally {
+      setCargandoMas(false)
+    }
+  }
+
+  // Agregar al inicio los pedidos nuevos sin perder las páginas ya cargadas
+  const cargarRecientes = async () => {
+    try {
+      const data = await pedirPagina()
+      setPedidos(prev => {
+        const ids = new Set(prev.map(p => p.id))
+        return [...data.pedidos.filter(p => !ids.has(p.id)), ...prev]
+      })
+    } catch (err) {
+      console.error('Error al cargar pedidos nuevos:', err)
+    }
+  }
+
   const actualizarEstado = async (pedidoId, nuevoEstado, motivoRechazo = null) => {
     try {
       setActualizando(prev => ({ ...prev, [pedidoId]: true }))
@@ -105,8 +165,12 @@ function AdminPanel() {
         throw new Error(errorData.error || 'Error al actualizar el estado')
       }
 
-      // Recargar la lista de pedidos
-      await cargarPedidos()
+      // Actualizar solo este pedido para conservar las páginas cargadas
+      setPedidos(prev => prev.map(p =>
+        p.id === pedidoId
+          ? { ...p, estado: nuevoEstado, motivo_rechazo: nuevoEstado === 'Pago Rechazado' ? motivoRechazo : p.motivo_rechazo }
+          : p
+      ))
       
       // Cerrar el modal si estaba abierto
       if (nuevoEstado === 'Pago Rechazado') {
@@ -326,7 +390,10 @@ function AdminPanel() {
   // Funciones para gestión de tasa BCV
   const cargarTasaBcv = async () => {
     try {
-      const response = await fetch('https://inversiones-ledezma-ecommerce.onrender.com/api/configuracion/tasa')
+      // El administrador siempre revalida: la tasa puede quedar unos minutos en la caché del navegador
+      const response = await fetch('https://inversiones-ledezma-ecommerce.onrender.com/api/configuracion/tasa', {
+        cache: 'no-cache'
+      })
       
       if (!response.ok) {
         throw new Error('Error al cargar la tasa BCV')
@@ -734,6 +801,17 @@ function AdminPanel() {
                 </tbody>
               </table>
             </div>
+            {siguienteCursor && (
+              <div className="p-4 text-center border-t border-gray-200">
+                <button
+                  onClick={cargarMasPedidos}
+                  disabled={cargandoMas}
+                  className="bg-gray-100 hover:bg-gray-200 disabled:opacity-50 disabled:cursor-not-allowed text-gray-700 font-semibold py-2 px-4 rounded-lg transition-colors"
+                >
+                  {cargandoMas ? 'Cargando...' : 'Cargar más pedidos'}
+                </button>
+              </div>
+            )}
           </div>
         )}
 
@@ -50,6 +50,20 @@ function ConfirmacionPago({ pedidoId, total }) {
     cargarEstadoPedido()
   }, [pedidoId])
 
+  // Recibir los cambios de estado del pedido en cuanto el administrador los hace
+  useEffect(() => {
+    if (!pedidoId) return
+
+    const eventos = new EventSource('/api/pedidos/eventos', { withCredentials: true })
+    eventos.addEventListener('pedido', (e) => {
+      const data = JSON.parse(e.data)
+      if (data.pedido_id === pedidoId) {
+        setEstadoPedido(data.estado)
+      }
+    })
+    return () => eventos.close()
+  }, [pedidoId])
+
   // Recargar el estado después de enviar la referencia
   useEffect(() => {
     if (referenciaEnviada && pedidoId) {
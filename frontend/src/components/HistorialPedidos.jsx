@@ -16,6 +16,22 @@ function HistorialPedidos() {
     cargarTasaBcv()
   }, [])
   
+  // Actualizar el estado de los pedidos cuando cambia en el servidor
+  useEffect(() => {
+    const eventos = new EventSource('/api/pedidos/eventos', { withCredentials: true })
+    eventos.addEventListener('pedido', (e) => {
+      const data = JSON.parse(e.data)
+      if (data.tipo === 'creado') {
+        cargarPedidos()
+        return
+      }
+      setPedidos(prev => prev.map(p =>
+        p.id === data.pedido_id ? { ...p, estado: data.estado, motivo_rechazo: data.motivo_rechazo } : p
+      ))
+    })
+    return () => eventos.close()
+  }, [])
+  
   // Cargar tasa BCV
   const cargarTasaBcv = async () => {
     try {